@@ -1,59 +1,89 @@
+import os
+import time
+from diagnostics import IMPORT_TIMES, Profiler, import_breakdown, lazy_import, mark_miss
+_import_t0 = time.perf_counter()
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import yfinance as yf
-import os
 import numpy as np
+from dataclasses import replace
 from datetime import datetime
 import pytz
+from mc_engine import analytic_ruin_prob, default_workers, fan_series, run_simulation
+from holdings import FACTORS, SLEEVE_LABELS, SLEEVES, Holdings
+from rules import LEVERAGE_COST, kelly_limit as kelly_limit_for, pe_limit as pe_limit_for
+from history_store import HistoryStore
+from market_data import INDEX_SYMBOL, MarketStore, YFinanceProvider, fetch_quotes, load_market_data
+from portfolio_engine import PortfolioEngine, PortfolioInputs
+from scenarios import evaluate_grid
+from performance import lttb
+from txo_pricer import TXO_MULTIPLIER, WING_WIDTHS, rank_spreads, spread_table, strike_ladder
+IMPORT_TIMES.setdefault("app.py 啟動匯入", (time.perf_counter() - _import_t0) * 1000)
+
+# 只在按下按鈕後才用到的模組延後載入 (相依套件已由上方匯入，三者合計約 1 毫秒，實際耗時見診斷面板)；
+# plotly、scenarios、txo_pricer (含 scipy) 每次完整重跑都會用到，延後也省不了時間
+mc_portfolio = lazy_import("mc_portfolio")
+backtest = lazy_import("backtest")
+sweep = lazy_import("sweep")
 
 # --- 1. 頁面基礎設定 ---
 st.set_page_config(page_title="A.D.E.I.S 全能自駕戰情室 (v25.0)", layout="wide")
 
-# --- 2. 歷史紀錄系統 (CSV 雲端保險箱) ---
-HISTORY_FILE = "asset_history.csv"
+# 效能診斷：每個 session 一份，記錄每次重跑各區段的耗時與快取命中；
+# 網址帶 ?admin=<ADEIS_ADMIN_TOKEN> 時側邊欄底部顯示診斷面板
+ADMIN_TOKEN = os.environ.get("ADEIS_ADMIN_TOKEN")
+if "profiler" not in st.session_state:
+    st.session_state.profiler = Profiler()
+prof = st.session_state.profiler.start_run()
+if ADMIN_TOKEN and st.query_params.get("admin") == ADMIN_TOKEN:
+    st.session_state["is_admin"] = True
+
+# --- 2. 歷史紀錄系統 (SQLite 儲存，CSV 雲端保險箱) ---
+HISTORY_FILE = "asset_history.csv"   # 舊版紀錄檔，首次啟動時自動匯入資料庫
+HISTORY_DB = "asset_history.db"
+
+@st.cache_resource
+def get_history_store():
+    return HistoryStore(HISTORY_DB, legacy_csv=HISTORY_FILE)
+
+with prof.span("history.open"):
+    history_store = get_history_store()
+history_counts = (history_store.hits, history_store.misses)
 
 def load_last_record():
-    if not os.path.exists(HISTORY_FILE): return None
-    try:
-        df = pd.read_csv(HISTORY_FILE)
-        return df.iloc[-1] if not df.empty else None
+    try: return history_store.last()
     except: return None
 
-def save_record(data_dict):
-    new_df = pd.DataFrame([data_dict])
-    if not os.path.exists(HISTORY_FILE):
-        new_df.to_csv(HISTORY_FILE, index=False)
-    else:
-        try:
-            existing_df = pd.read_csv(HISTORY_FILE)
-            updated_df = pd.concat([existing_df, new_df], ignore_index=True)
-            updated_df.to_csv(HISTORY_FILE, index=False)
-        except:
-            new_df.to_csv(HISTORY_FILE, mode='a', header=False, index=False)
+def save_record(data_dict, holdings=None):
+    history_store.append(data_dict, holdings)
+
+# --- 3. 自動抓取引擎 (本地日線儲存 + 增量更新，包含即時波動率) ---
+MARKET_DB = "market_data.db"
+
+@st.cache_resource
+def get_market_store():
+    return MarketStore(MARKET_DB)
 
-# --- 3. 自動抓取引擎 (包含即時波動率) ---
 @st.cache_data(ttl=3600)
 def get_market_data():
-    data = {"ath": 32996.0, "pe_0050": None, "current_vol": 0.20}
-    try:
-        hist = yf.Ticker("^TWII").history(period="5y")
-        if not hist.empty: 
-            data["ath"] = float(hist['High'].max())
-            recent_hist = hist.tail(60)
-            daily_returns = recent_hist['Close'].pct_change().dropna()
-            data["current_vol"] = float(daily_returns.std() * np.sqrt(252))
-        etf_50 = yf.Ticker("0050.TW")
-        if 'trailingPE' in etf_50.info: data["pe_0050"] = etf_50.info['trailingPE']
-    except: pass
-    return data
+    # 只下載本地最後一根之後的 K 棒；斷網時直接以本地序列計算 ATH 與波動率
+    mark_miss("market_data")
+    return load_market_data(get_market_store(), YFinanceProvider())
+
+# 持股即時報價 (報價代號取自持股表的 Quote 欄)
+@st.cache_data(ttl=60, show_spinner=False)
+def get_live_quotes(symbols):
+    mark_miss("live_quotes")
+    return {"at": time.time(), "prices": fetch_quotes(YFinanceProvider(), list(symbols))}
 
 with st.spinner('正在連線抓取市場數據與波動率...'):
-    market_data = get_market_data()
+    market_data = prof.cached("market_data", get_market_data)
     ath_auto = market_data["ath"]
     pe_0050_ref = market_data["pe_0050"]
-    real_volatility = market_data["current_vol"]
+    rolling_volatility = market_data["current_vol"]
+    ewma_volatility = market_data["ewma_vol"]
+    index_auto = market_data["last_close"]
 
 # --- 4. 初始化 Session State ---
 def init_state(key, default_value):
@@ -61,21 +91,38 @@ def init_state(key, default_value):
         st.session_state[key] = default_value
 
 init_state('manual_ath_check', False)
+init_state('manual_index_check', index_auto is None)
 init_state('input_ath', ath_auto)
 init_state('input_index', 35600.0) 
 init_state('input_pe', 23.5)
 init_state('mortgage_loan', 3000000.0)
 init_state('personal_loan', 1336066.0)
 
-defaults = {
-    'p_675': 212.8, 's_675': 10000, 'p_631': 466.7, 's_631': 331,
-    'p_670': 157.95, 's_670': 616, 'p_662': 101.35, 's_662': 29840,
-    'p_713': 54.0, 's_713': 67000, 'p_865': 47.36, 's_865': 16000
-}
-for k, v in defaults.items(): init_state(k, v)
+DEFAULT_POSITIONS = [
+    ("00675L", 212.8, 10000), ("00631L", 466.7, 331), ("00670L", 157.95, 616),
+    ("00662", 101.35, 29840), ("00713", 54.0, 67000), ("00865B", 47.36, 16000),
+]
+init_state('holdings_df', Holdings.from_positions(DEFAULT_POSITIONS).to_frame())
+
+def current_holdings_frame():
+    """持股表目前內容 = 基準表 + 表格元件中尚未併入的編輯 (修改 / 刪除 / 新增列)。"""
+    df = st.session_state['holdings_df'].copy().reset_index(drop=True)
+    edits = st.session_state.get('holdings_editor') or {}
+    for i, changes in edits.get('edited_rows', {}).items():
+        for col, val in changes.items():
+            df.loc[int(i), col] = val
+    df = df.drop(index=[int(i) for i in edits.get('deleted_rows', [])], errors='ignore')
+    if edits.get('added_rows'):
+        df = pd.concat([df, pd.DataFrame(edits['added_rows'])], ignore_index=True)
+    return df.reset_index(drop=True)
+
+def set_holdings_frame(df):
+    """整批替換持股表 (載入紀錄、帶入報價)，並清掉表格元件的編輯狀態。"""
+    st.session_state['holdings_df'] = df.reset_index(drop=True)
+    st.session_state.pop('holdings_editor', None)
 
 # --- 5. 側邊欄輸入區 ---
-with st.sidebar:
+with st.sidebar, prof.span("sidebar.inputs"):
     st.header("📝 監控數據輸入")
     if st.button("📂 載入線上最新數據", type="secondary"):
         last_data = load_last_record()
@@ -84,18 +131,43 @@ with st.sidebar:
                 st.session_state['input_index'] = float(last_data['Current_Index'])
                 st.session_state['input_ath'] = float(last_data['ATH'])
                 st.session_state['manual_ath_check'] = True 
+                st.session_state['manual_index_check'] = True
                 if 'PE_Ratio' in last_data: st.session_state['input_pe'] = float(last_data['PE_Ratio'])
                 if 'Mortgage' in last_data: st.session_state['mortgage_loan'] = float(last_data['Mortgage'])
                 if 'Personal_Loan' in last_data: st.session_state['personal_loan'] = float(last_data['Personal_Loan'])
-                for code in ['675', '631', '670', '662', '713', '865']:
-                    if f'P_00{code}' in last_data:
-                        st.session_state[f'p_{code}'] = float(last_data[f'P_00{code}'])
-                        st.session_state[f's_{code}'] = int(last_data[f'S_00{code}'])
+                last_holdings = history_store.last_holdings()
+                if last_holdings is not None: set_holdings_frame(last_holdings.to_frame())
                 st.toast("✅ 成功載入！", icon="📂")
                 st.rerun()
             except Exception as e: st.error(f"載入失敗: {e}")
         else: st.warning("⚠️ 雲端目前無紀錄，請先上傳您的備份檔。")
 
+    # 即時報價一次並行抓齊所有持股，在持股表建立前整批寫入 session_state
+    q1, q2 = st.columns([3, 2])
+    fill_quotes = q1.button("⚡ 帶入即時報價", type="secondary")
+    auto_quotes = q2.toggle("自動", key="auto_quotes", help="每分鐘最多更新一次報價並自動帶入")
+    if fill_quotes or auto_quotes:
+        try:
+            quoted = Holdings.from_frame(current_holdings_frame())
+        except ValueError as e:
+            quoted = None
+            st.error(f"持股表有誤: {e}")
+        if quoted is not None and len(quoted):
+            symbols = tuple(sorted(set(quoted.quote)))
+            quotes = prof.cached("live_quotes", get_live_quotes, symbols)
+            if fill_quotes or quotes["at"] != st.session_state.get("quotes_applied_at"):
+                prices = {k: round(v, 2) for k, v in quotes["prices"].items()}
+                set_holdings_frame(quoted.with_prices(prices).to_frame())
+                st.session_state["quotes_applied_at"] = quotes["at"]
+                missing = [s for s in symbols if s not in prices]
+                if missing: st.warning(f"⚠️ 部分報價未取得：{', '.join(missing)}")
+                elif fill_quotes: st.toast(f"✅ 已帶入 {len(symbols)} 檔即時報價", icon="⚡")
+
+    # 戰情室自動刷新：只有第一分頁的片段會定時重跑，其餘分頁與側邊欄不受影響
+    live_c1, live_c2 = st.columns([3, 2])
+    live_dashboard = live_c1.toggle("📡 戰情室自動刷新", key="live_dashboard", help="定時重新抓取加權指數與持股報價，只更新第一分頁的指標 (不改動持股表)。")
+    live_interval = live_c2.selectbox("刷新間隔", [60, 120, 300], key="live_interval", format_func=lambda s: f"每 {s // 60} 分", disabled=not live_dashboard, label_visibility="collapsed")
+
     with st.expander("0. 市場位階 & 雙引擎煞車系統", expanded=True):
         col_ath1, col_ath2 = st.columns([2, 1])
         with col_ath1: st.metric("自動 ATH", f"{ath_auto:,.0f}")
@@ -103,8 +175,14 @@ with st.sidebar:
         final_ath = st.number_input("輸入 ATH", step=10.0, format="%.0f", key="input_ath") if use_manual_ath else ath_auto
         
         st.markdown("---")
-        current_index = st.number_input("今日大盤點數", step=10.0, format="%.0f", key="input_index")
-        mdd_pct = ((final_ath - current_index) / final_ath) * 100 if final_ath > 0 else 0.0
+        col_idx1, col_idx2 = st.columns([2, 1])
+        with col_idx1: st.metric("自動 大盤點數", f"{index_auto:,.0f}" if index_auto else "—")
+        with col_idx2: use_manual_index = st.checkbox("修正", key="manual_index_check", disabled=index_auto is None)
+        current_index = st.number_input("今日大盤點數", step=10.0, format="%.0f", key="input_index") if use_manual_index or index_auto is None else index_auto
+        if not use_manual_ath and not use_manual_index and market_data["drawdown_pct"] is not None:
+            mdd_pct = market_data["drawdown_pct"]   # 增量統計引擎直接提供的即時回撤
+        else:
+            mdd_pct = ((final_ath - current_index) / final_ath) * 100 if final_ath > 0 else 0.0
         
         # 避免大盤創新高時 MDD 變成負的
         if mdd_pct < 0: mdd_pct = 0.0
@@ -115,17 +193,13 @@ with st.sidebar:
         pe_val = st.number_input("輸入大盤 P/E (決定估值上限)", step=0.1, key="input_pe")
 
         # 1. 估值限速 (PE Limit)
-        pe_limit = 160
-        if pe_val < 17.0: pe_limit = 320
-        elif pe_val < 19.0: pe_limit = 280
-        elif pe_val < 21.0: pe_limit = 240
-        elif pe_val < 23.0: pe_limit = 200
+        pe_limit = int(pe_limit_for(pe_val))
         
         # 2. 波動率限速 (動態凱利公式)
-        market_mu = 0.1415 
-        leverage_cost = 0.025 
-        safe_vol = max(real_volatility, 0.15) 
-        kelly_limit = ((market_mu - leverage_cost) / (safe_vol ** 2)) * 100
+        leverage_cost = LEVERAGE_COST
+        vol_source = st.radio("波動率來源", ["60 日滾動", "EWMA (λ=0.94)"], horizontal=True, key="vol_source", help="EWMA 對近期波動反應更快，股災初期能更早啟動煞車。")
+        real_volatility = ewma_volatility if vol_source.startswith("EWMA") else rolling_volatility
+        kelly_limit = float(kelly_limit_for(real_volatility))
         
         # 3. 最終安全上限
         safe_leverage_limit = min(pe_limit, kelly_limit)
@@ -140,31 +214,27 @@ with st.sidebar:
         st.markdown("---")
         base_exposure = st.number_input("基準曝險 % (Tier 1)", value=23.0, min_value=20.0, max_value=30.0, step=1.0)
 
-    with st.expander("1. 攻擊型資產 (正二)", expanded=True):
-        c1, c2 = st.columns(2)
-        p_675 = c1.number_input("00675L 價格", step=0.1, key="p_675")
-        s_675 = c2.number_input("00675L 股數", step=1000, key="s_675")
-        c3, c4 = st.columns(2)
-        p_631 = c3.number_input("00631L 價格", step=0.1, key="p_631")
-        s_631 = c4.number_input("00631L 股數", step=100, key="s_631")
-        c5, c6 = st.columns(2)
-        p_670 = c5.number_input("00670L 價格", step=0.1, key="p_670")
-        s_670 = c6.number_input("00670L 股數", step=100, key="s_670")
-
-    with st.expander("2. 核心資產 (美股)", expanded=True):
-        c1, c2 = st.columns(2)
-        p_662 = c1.number_input("00662 價格", step=0.1, key="p_662")
-        s_662 = c2.number_input("00662 股數", step=100, key="s_662")
-
-    with st.expander("3. 防禦資產 (高息)", expanded=True):
-        c1, c2 = st.columns(2)
-        p_713 = c1.number_input("00713 價格", step=0.05, key="p_713")
-        s_713 = c2.number_input("00713 股數", step=1000, key="s_713")
-
-    with st.expander("4. 子彈庫 (無息短債)", expanded=True):
-        c1, c2 = st.columns(2)
-        p_865 = c1.number_input("00865B 價格", step=0.01, key="p_865")
-        s_865 = c2.number_input("00865B 股數", step=1000, key="s_865")
+    with st.expander("1~4. 持股明細 (可新增 / 刪除部位)", expanded=True):
+        holdings_frame = st.data_editor(
+            st.session_state['holdings_df'], key="holdings_editor", num_rows="dynamic", hide_index=True, use_container_width=True,
+            column_config={
+                "Code": st.column_config.TextColumn("代號", required=True),
+                "Account": st.column_config.TextColumn("帳戶"),
+                "Sleeve": st.column_config.SelectboxColumn("類別", options=list(SLEEVES), help="attack 攻擊型 / core 核心 / defense 防禦 / ammo 子彈庫"),
+                "Price": st.column_config.NumberColumn("價格", format="%.2f", min_value=0.0),
+                "Shares": st.column_config.NumberColumn("股數", step=1, min_value=0),
+                "Beta": st.column_config.NumberColumn("Beta", format="%.2f"),
+                "Leverage": st.column_config.NumberColumn("槓桿", format="%.1f"),
+                "Factor": st.column_config.SelectboxColumn("追蹤因子", options=list(FACTORS)),
+                "Quote": st.column_config.TextColumn("報價代號"),
+            })
+        try:
+            holdings = Holdings.from_frame(holdings_frame)
+        except ValueError as e:
+            st.error(f"持股表有誤，暫用上次的內容：{e}")
+            holdings = Holdings.from_frame(st.session_state['holdings_df'])
+        sleeve_caption = " / ".join(f"{SLEEVE_LABELS[k]} ${v:,.0f}" for k, v in holdings.sleeve_totals().items())
+        st.caption(f"{len(holdings)} 個部位：{sleeve_caption}")
 
     st.subheader("5. 負債監控 (券商與場外)")
     loan_amount = st.number_input("🏦 目前質押借款總額", value=2350000.0, step=10000.0)
@@ -172,73 +242,75 @@ with st.sidebar:
     personal_loan = st.number_input("💳 信貸未還餘額", key="personal_loan", step=10000.0)
 
 # --- 6. 運算引擎 ---
-v_675, v_631, v_670 = p_675 * s_675, p_631 * s_631, p_670 * s_670
-v_662, v_713, v_865 = p_662 * s_662, p_713 * s_713, p_865 * s_865
-
-val_attack = v_675 + v_631 + v_670
-val_core, val_defense, val_ammo = v_662, v_713, v_865
-
-# 券商層級資產 (用於維持率與槓桿計算)
-total_assets = val_attack + val_core + val_defense + val_ammo
-portfolio_net_assets = total_assets - loan_amount
-
-# 家族層級真實淨資產 (扣除所有場外負債)
-true_net_assets = portfolio_net_assets - mortgage_loan - personal_loan
-
-real_exposure = (val_attack * 2.0) + (val_core * 1.0) + (val_defense * 1.0) + (val_ammo * 1.0)
-real_leverage_ratio = (real_exposure / portfolio_net_assets) * 100 if portfolio_net_assets > 0 else 0
-
-beta_weighted_sum = ((v_675*1.6) + (v_631*1.6) + (v_670*2.0) + (v_713*0.6) + (v_662*1.0) + (v_865*0.0))
-portfolio_beta = beta_weighted_sum / total_assets if total_assets > 0 else 0
-maintenance_ratio = (total_assets / loan_amount) * 100 if loan_amount > 0 else 999
-loan_ratio = (loan_amount / total_assets) * 100 if total_assets > 0 else 0
-
-tier_0, tier_1, tier_2 = base_exposure, base_exposure + 5.0, base_exposure + 5.0
-tier_3, tier_4, tier_5 = base_exposure + 10.0, base_exposure + 15.0, base_exposure + 20.0
-
-ladder_data = [
-    {"MDD區間": "< 5%", "目標曝險": tier_0, "位階": "Tier 1 (基準)"},
-    {"MDD區間": "5%~10%", "目標曝險": tier_1, "位階": "Tier 1.5 (警戒)"},
-    {"MDD區間": "10%~20%", "目標曝險": tier_2, "位階": "Tier 2 (初跌)"},
-    {"MDD區間": "20%~35%", "目標曝險": tier_3, "位階": "Tier 3 (主跌)"},
-    {"MDD區間": "35%~45%", "目標曝險": tier_4, "位階": "Tier 4 (恐慌)"},
-    {"MDD區間": "> 45%", "目標曝險": tier_5, "位階": "Tier 5 (毀滅)"},
-]
-
-if mdd_pct < 5.0: target_attack_ratio, current_tier_index = tier_0, 0
-elif mdd_pct < 10.0: target_attack_ratio, current_tier_index = tier_1, 1
-elif mdd_pct < 20.0: target_attack_ratio, current_tier_index = tier_2, 2
-elif mdd_pct < 35.0: target_attack_ratio, current_tier_index = tier_3, 3
-elif mdd_pct < 45.0: target_attack_ratio, current_tier_index = tier_4, 4
-else: target_attack_ratio, current_tier_index = tier_5, 5
-
-current_tier_name = ladder_data[current_tier_index]["位階"]
-current_attack_ratio = (val_attack / total_assets) * 100 if total_assets > 0 else 0
-
-# --- V23.2 核心：AI 動態擴容再平衡閥值 (Auto-Scaling Gap Tolerance) ---
-if true_net_assets < 10000000:
-    gap_tolerance = 3.0  
-else:
-    gap_tolerance = 5.0  
-
-gap = current_attack_ratio - target_attack_ratio
-
-max_allowed_exposure_kelly = portfolio_net_assets * (safe_leverage_limit / 100.0)
-exposure_gap = max_allowed_exposure_kelly - real_exposure
-max_assets_broker = portfolio_net_assets / (1 - 0.35)
-max_loan_broker = max_assets_broker - portfolio_net_assets
-loan_headroom = max_loan_broker - loan_amount
-
-if exposure_gap < 0:
-    recommendation_action, recommendation_amount = "REDUCE", abs(exposure_gap)
-else:
-    recommendation_action, recommendation_amount = "BORROW", min(exposure_gap / 2, loan_headroom)
+# 計算圖保存在各自的 session 中，只有輸入變動的指標會重算
+if "portfolio_engine" not in st.session_state:
+    st.session_state.portfolio_engine = PortfolioEngine()
+portfolio_inputs = PortfolioInputs(
+    holdings=holdings, loan_amount=loan_amount, mortgage_loan=mortgage_loan, personal_loan=personal_loan, current_index=current_index,
+    mdd_pct=mdd_pct, pe=pe_val, volatility=real_volatility, base_exposure=base_exposure,
+)
+engine_before = sum(st.session_state.portfolio_engine.recomputed.values())
+with prof.span("engine"):
+    pf = st.session_state.portfolio_engine.set_inputs(portfolio_inputs)
+
+    holdings_values = pf["values"]
+    val_attack, val_core, val_defense, val_ammo = (pf["sleeve_values"][k] for k in ("attack", "core", "defense", "ammo"))
+
+    # 券商層級資產 (用於維持率與槓桿計算) / 家族層級真實淨資產 (扣除所有場外負債)
+    total_assets, portfolio_net_assets, true_net_assets = pf["total_assets"], pf["portfolio_net_assets"], pf["true_net_assets"]
+    real_exposure, real_leverage_ratio = pf["real_exposure"], pf["real_leverage_ratio"]
+    portfolio_beta, maintenance_ratio, loan_ratio = pf["portfolio_beta"], pf["maintenance_ratio"], pf["loan_ratio"]
+
+    ladder_data, current_tier_index, current_tier_name = pf["ladder"], pf["tier_index"], pf["tier_name"]
+    target_attack_ratio, current_attack_ratio = pf["target_attack_ratio"], pf["current_attack_ratio"]
+
+    # --- V23.2 核心：AI 動態擴容再平衡閥值 (Auto-Scaling Gap Tolerance) ---
+    gap_tolerance, gap = pf["gap_tolerance"], pf["gap"]
+
+    exposure_gap, max_loan_broker, loan_headroom = pf["exposure_gap"], pf["max_loan_broker"], pf["loan_headroom"]
+    recommendation_action, recommendation_amount = pf["recommendation"]
+prof.count("engine.recomputed_nodes", sum(st.session_state.portfolio_engine.recomputed.values()) - engine_before)
 
 last_record = load_last_record()
-diff_total = true_net_assets - (last_record['True_Net_Assets'] if last_record is not None and 'True_Net_Assets' in last_record else portfolio_net_assets)
+prev_true_net_assets = last_record['True_Net_Assets'] if last_record is not None and 'True_Net_Assets' in last_record else portfolio_net_assets
+
+# 第四分頁的總經動態最佳化預設值 (第一分頁的解析斷頭機率同樣使用)
+w_atk, w_cor = val_attack/total_assets if total_assets>0 else 0, val_core/total_assets if total_assets>0 else 0
+w_def, w_amo = val_defense/total_assets if total_assets>0 else 0, val_ammo/total_assets if total_assets>0 else 0
+
+pe_baseline = 22.0  
+safe_pe_val = max(min(pe_val, 30.0), 15.0) 
+
+mu_multiplier = pe_baseline / safe_pe_val
+vol_multiplier = 1.0 + (mdd_pct / 100.0) + (max(safe_pe_val - 24.0, 0) / 40.0)
+
+adj_atk_mu = 0.24 * mu_multiplier
+adj_cor_mu = 0.14 * ((mu_multiplier + 1.0) / 2)
+
+default_mu = (w_atk * adj_atk_mu) + (w_cor * adj_cor_mu) + (w_def * 0.08) + (w_amo * 0.04)
+default_vol = ((w_atk * 0.40) + (w_cor * 0.22) + (w_def * 0.12) + (w_amo * 0.03)) * vol_multiplier
+
+def mc_params():
+    """第四分頁滑桿的最新值 (CAGR, 波動率, 年數)。滑桿在預設值改變時會重設，此時改用新的預設值。"""
+    saved = st.session_state.get('mc_params')
+    if saved is None: return default_mu, default_vol, 5
+    if saved['defaults'] != (default_mu, default_vol): return default_mu, default_vol, saved['years']
+    return saved['mu'], saved['vol'], saved['years']
+
+def live_inputs():
+    """自動刷新用的快照：以最新的持股報價與加權指數取代目前輸入 (手動修正的指數 / ATH 維持不變)。"""
+    symbols = tuple(sorted(set(holdings.quote) | {INDEX_SYMBOL}))
+    quotes = prof.cached("live_quotes", get_live_quotes, symbols)
+    inputs = replace(portfolio_inputs, holdings=holdings.with_prices(quotes["prices"]))
+    live_index = quotes["prices"].get(INDEX_SYMBOL)
+    if live_index and not use_manual_index:
+        live_ath = final_ath if use_manual_ath else max(final_ath, live_index)
+        live_mdd = max((live_ath - live_index) / live_ath * 100, 0.0) if live_ath > 0 else 0.0
+        inputs = replace(inputs, current_index=live_index, mdd_pct=live_mdd)
+    return inputs, quotes["at"]
 
 # --- 側邊欄：已修復的雲端保險箱邏輯 ---
-with st.sidebar:
+with st.sidebar, prof.span("sidebar.vault"):
     st.markdown("---")
     st.subheader("💾 雲端保險箱")
     uploaded_file = st.file_uploader("📤 1. 恢復記憶 (上傳歷史 CSV)", type=["csv"])
@@ -246,34 +318,57 @@ with st.sidebar:
     if uploaded_file is not None:
         if st.button("📥 確認匯入此備份檔", type="primary"):
             try:
-                pd.read_csv(uploaded_file).to_csv(HISTORY_FILE, index=False)
+                history_store.import_csv(uploaded_file)
                 st.success("✅ 記憶已恢復！請點擊最上方『載入線上最新數據』")
             except Exception as e: 
                 st.error(f"上傳失敗: {e}")
 
+    contribution = st.number_input("💵 本次外部資金進出 (入金 + / 出金 -)", key="contribution", step=10000.0, help="自上次存檔以來從場外投入 (或提領) 的資金，第五分頁的時間加權 / 資金加權報酬會扣除它；房貸與信貸的本金減少會自動視為場外還款。")
     if st.button("💾 2. 儲存今日最新狀態", type="primary"):
         now_str = datetime.now(pytz.timezone('Asia/Taipei')).strftime("%Y-%m-%d %H:%M")
         save_data = {
             "Date": now_str, "Total_Assets": total_assets, "Portfolio_Net_Assets": portfolio_net_assets, "True_Net_Assets": true_net_assets,
             "MDD": mdd_pct, "Current_Index": current_index, "ATH": final_ath, "PE_Ratio": pe_val,
-            "Mortgage": mortgage_loan, "Personal_Loan": personal_loan,
-            "P_00675": p_675, "P_00631": p_631, "P_00670": p_670, "P_00662": p_662, "P_00713": p_713, "P_00865": p_865,
-            "S_00675": s_675, "S_00631": s_631, "S_00670": s_670, "S_00662": s_662, "S_00713": s_713, "S_00865": s_865
+            "Mortgage": mortgage_loan, "Personal_Loan": personal_loan, "Contribution": contribution,
         }
-        save_record(save_data)
+        save_record(save_data, holdings)
+        st.session_state.pop("contribution", None)
         st.success(f"已儲存！時間: {now_str}")
         st.rerun()
     
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, "rb") as f: csv_bytes = f.read()
+    if history_store.count() > 0:
+        csv_bytes = history_store.export_csv_bytes()
         st.download_button("📥 3. 下載最新備份", data=csv_bytes, file_name=f"ADEIS_Backup_{datetime.now(pytz.timezone('Asia/Taipei')).strftime('%Y%m%d')}.csv", mime="text/csv")
 
 # --- 7. 主畫面 ---
-tab1, tab2, tab3, tab4, tab5 = st.tabs([
-    "📊 戰情室 Dashboard", "📖 現金流與 SOP", "🚀 選擇權戰情室 (v25)", "🔮 蒙地卡羅未來推演", "⚖️ 系統校準與診斷"
+HISTORY_CHART_POINTS = 1500     # 第五分頁歷史軌跡圖的最大點數
+HEATMAP_POINTS = 200            # 第六分頁熱圖每軸最多顯示的點數 (數值仍以完整網格計算)
+tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+    "📊 戰情室 Dashboard", "📖 現金流與 SOP", "🚀 選擇權戰情室 (v25)", "🔮 蒙地卡羅未來推演", "⚖️ 系統校準與診斷", "🧯 壓力測試矩陣"
 ])
 
-with tab1:
+# 各分頁為獨立片段 (st.fragment)：分頁內的元件只重跑該片段，側邊欄變動才重跑整頁
+@prof.timed("tab1.dashboard")
+def dashboard_tab():
+    if live_dashboard:
+        inputs, quoted_at = live_inputs()
+        if "live_engine" not in st.session_state:
+            st.session_state.live_engine = PortfolioEngine()
+        d = st.session_state.live_engine.set_inputs(inputs)
+        st.caption(f"📡 自動刷新中 (每 {live_interval // 60} 分鐘)｜報價時間 {datetime.fromtimestamp(quoted_at, pytz.timezone('Asia/Taipei')):%H:%M:%S}｜大盤 {inputs.current_index:,.0f}")
+    else:
+        d = pf
+    mdd_pct, loan_amount = d["mdd_pct"], d["loan_amount"]
+    val_attack, val_core, val_defense, val_ammo = (d["sleeve_values"][k] for k in ("attack", "core", "defense", "ammo"))
+    total_assets, true_net_assets = d["total_assets"], d["true_net_assets"]
+    real_leverage_ratio, portfolio_beta = d["real_leverage_ratio"], d["portfolio_beta"]
+    maintenance_ratio, loan_ratio = d["maintenance_ratio"], d["loan_ratio"]
+    ladder_data, current_tier_name = d["ladder"], d["tier_name"]
+    target_attack_ratio, current_attack_ratio = d["target_attack_ratio"], d["current_attack_ratio"]
+    gap_tolerance, gap, max_loan_broker = d["gap_tolerance"], d["gap"], d["max_loan_broker"]
+    recommendation_action, recommendation_amount = d["recommendation"]
+    diff_total = true_net_assets - prev_true_net_assets
+
     st.subheader("1. 動態戰略地圖")
     m1, m2, m3, m4 = st.columns([1, 1, 1, 2])
     m1.metric("📉 目前大盤 MDD", f"{mdd_pct:.2f}%", help=f"計算基準 ATH: {final_ath:,.0f}")
@@ -309,13 +404,17 @@ with tab1:
     st.divider()
     
     st.subheader("3. 投資組合核心數據")
-    col1, col2, col3, col4, col5, col6 = st.columns([1.5, 1.5, 0.8, 1.0, 1.0, 1.0])
+    col1, col2, col3, col4, col5, col_ruin, col6 = st.columns([1.5, 1.5, 0.8, 1.0, 1.0, 1.0, 1.0])
     
     col1.metric("💰 總市值", f"${total_assets:,.0f}", help="您的股票與債券總值")
     col2.metric("💎 真實淨資產", f"${true_net_assets:,.0f}", delta=f"{diff_total:+,.0f}", help="總市值 - 質押借款 - 房貸增貸 - 信貸")
     col3.metric("📉 Beta", f"{portfolio_beta:.2f}")
     col4.metric("⚙️ 槓桿率", f"{real_leverage_ratio:.1f}%", delta="⚠️ 超速" if real_leverage_ratio > safe_leverage_limit else "✅ 安全", delta_color="inverse" if real_leverage_ratio > safe_leverage_limit else "normal")
     col5.metric("🛡️ 維持率 (T)", f"{maintenance_ratio:.0f}%", delta="安全線 > 300%", delta_color="inverse" if maintenance_ratio < 300 else "normal")
+    # 斷頭機率使用第四分頁的 CAGR/波動率/年數 (滑桿值保存在 session_state)
+    port_mu, port_vol, mc_years = mc_params()
+    analytic_ruin = analytic_ruin_prob(total_assets, loan_amount * 1.3, port_mu, port_vol, mc_years)
+    col_ruin.metric("💀 斷頭機率 (解析)", f"{analytic_ruin:.1f}%", delta=f"{mc_years} 年內", delta_color="inverse" if analytic_ruin > 5.0 else "off", help="以第四分頁的 CAGR、波動率與年數，用 GBM 首次觸及公式即時估算市值跌破 質押借款 x 130% 的機率；蒙地卡羅推演可作為交叉驗證。")
     col6.metric("💳 負債比 (U)", f"{loan_ratio:.1f}%", delta="安全線 < 35%", delta_color="inverse" if loan_ratio > 35 else "normal")
 
     st.divider()
@@ -323,9 +422,10 @@ with tab1:
     st.subheader("4. 資產配置與指令")
     c1, c2 = st.columns([2, 1])
     with c1:
-        chart_data = pd.DataFrame({'資產類別': ['攻擊型', '核心', '防禦', '子彈庫'], '市值': [val_attack, val_core, val_defense, val_ammo]})
-        fig = px.pie(chart_data, values='市值', names='資產類別', color='資產類別', color_discrete_map={'攻擊型': '#FF4B4B', '核心': '#FFD700', '防禦': '#2E8B57', '子彈庫': '#87CEFA'}, hole=0.45)
-        fig.update_traces(textposition='inside', textinfo='percent+label')
+        with prof.span("tab1.pie_chart"):
+            chart_data = pd.DataFrame({'資產類別': ['攻擊型', '核心', '防禦', '子彈庫'], '市值': [val_attack, val_core, val_defense, val_ammo]})
+            fig = px.pie(chart_data, values='市值', names='資產類別', color='資產類別', color_discrete_map={'攻擊型': '#FF4B4B', '核心': '#FFD700', '防禦': '#2E8B57', '子彈庫': '#87CEFA'}, hole=0.45)
+            fig.update_traces(textposition='inside', textinfo='percent+label')
         st.plotly_chart(fig, use_container_width=True)
 
     with c2:
@@ -343,6 +443,9 @@ with tab1:
             elif gap < -gap_tolerance: st.success(f"🟢 **買進訊號** ({gap:.1f}%)\n動用：${(total_assets * target_attack_ratio / 100) - val_attack:,.0f} 買進正二")
             else: st.success(f"✅ **系統待機**\n財務健康且無偏離。\n動態容忍度: +/- {gap_tolerance}%")
 
+with tab1:
+    st.fragment(run_every=live_interval if live_dashboard else None)(dashboard_tab)()
+
 with tab2:
     st.title("📖 A.D.E.I.S 實戰教戰守則 (無息子彈庫版)")
     st.markdown("""
@@ -365,39 +468,85 @@ with tab2:
     * **> 1,000萬**：容忍度 **5%** (沉穩守成，減少法人級量體的摩擦手續費)。
     """)
 
-with tab3:
+@st.fragment
+@prof.timed("tab3.option_chain")
+def option_chain_panel(txo):
+    st.subheader("📐 權利金、Greeks 與候選價差排名 (Black-Scholes)")
+    if not current_index:
+        st.info("ℹ️ 請先輸入加權指數。")
+        return
+    today = datetime.now(pytz.timezone('Asia/Taipei')).date()
+    o1, o2, o3 = st.columns(3)
+    days = o1.number_input("距結算日 (日曆天)", min_value=1, max_value=35, value=(2 - today.weekday()) % 7 or 7, help="TXO 週選擇權於週三結算。")
+    base_vol = o2.number_input("隱含波動率 (年化)", min_value=0.05, max_value=1.0, value=float(round(real_volatility, 3)), step=0.01, format="%.3f", help="預設為側邊欄選定的已實現波動率 (60 日或 EWMA)。")
+    skew = o3.slider("賣權偏斜 (每低 1000 點加減波動率)", 0.0, 0.05, 0.02, step=0.005, help="價外賣權的隱含波動率通常較高；0 表示不使用微笑曲線。")
+    ladder = strike_ladder(current_index)
+    smile = [(k, max(base_vol + skew * (current_index - k) / 1000, 0.05)) for k in (ladder[0], current_index, ladder[-1])] if skew > 0 else None
+
+    plan_side = {"bear_call": ("sell_call", "buy_call"), "bull_put": ("sell_put", "buy_put")}
+    with prof.span("txo.spread_table", strategy=txo["strategy"]):
+        table = spread_table(current_index, days, base_vol, txo["strategy"], smile=smile)
+    if txo["strategy"] == "iron_condor":
+        keys = {"sell_call": txo["sell_call"], "buy_call": txo["buy_call"], "sell_put": txo["sell_put"], "buy_put": txo["buy_put"]}
+    else:
+        sell_key, buy_key = plan_side[txo["strategy"]]
+        keys = {"sell": txo[sell_key], "buy": txo[buy_key]}
+    plan = table[np.logical_and.reduce([table[k] == v for k, v in keys.items()])] if len(table) else table
+    if len(plan):
+        row = plan.iloc[0]
+        st.markdown("**上方靜態建議的定價 (每口)**")
+        p1, p2, p3, p4, p5 = st.columns(5)
+        p1.metric("收取權利金", f"{row['credit']:.1f} 點", delta=f"$ {row['credit_ntd']:,.0f}", delta_color="off")
+        p2.metric("最大虧損", f"$ {row['max_loss_ntd']:,.0f}", delta=f"報酬/風險 {row['return_on_risk']:.2f}", delta_color="off")
+        p3.metric("觸價機率", f"{row['p_touch']*100:.1f}%", delta=f"到期獲利 {row['p_profit']*100:.1f}%", delta_color="off")
+        p4.metric("Theta (每日)", f"$ {row['theta_ntd']:,.0f}", delta=f"Delta {row['delta']:+.3f}", delta_color="off")
+        p5.metric("Vega (每 1%)", f"$ {row['vega'] * TXO_MULTIPLIER:,.0f}")
+
+    r1, r2, r3 = st.columns(3)
+    max_touch = r1.slider("觸價機率上限 (%)", 5, 60, 30, step=5) / 100
+    min_distance = r2.slider("賣方履約價最小距離 (點)", 0, 1500, int(txo["base_distance"]), step=100, help="預設為上方依 P/E 決定的安全距離。")
+    sort_labels = {"報酬 / 風險": "return_on_risk", "到期獲利機率": "p_profit", "每日 Theta": "theta", "收取權利金": "credit"}
+    sort_by = r3.selectbox("排序依據", list(sort_labels))
+    widths = st.multiselect("翼寬 (點)", list(WING_WIDTHS), default=[w for w in WING_WIDTHS if w <= 500])
+    if widths:
+        table = table[table["width"].isin(widths)]
+    ranked = rank_spreads(table, max_touch=max_touch, min_distance=min_distance, sort_by=sort_labels[sort_by], top=15)
+    st.caption(f"⏱️ 共評估 {len(table):,} 組價差，篩選後前 {len(ranked)} 名；金額以每點 {TXO_MULTIPLIER} 元換算。")
+    if ranked.empty:
+        st.warning("⚠️ 沒有符合條件的價差，請放寬觸價機率或距離。")
+        return
+    strike_cols = ["sell_call", "buy_call", "sell_put", "buy_put"] if txo["strategy"] == "iron_condor" else ["sell", "buy"]
+    show = ranked[strike_cols + ["credit", "credit_ntd", "max_loss_ntd", "return_on_risk", "p_touch", "p_profit", "delta", "theta_ntd", "vega"]].copy()
+    show[["p_touch", "p_profit"]] *= 100
+    show["vega"] *= TXO_MULTIPLIER
+    show.columns = [{"sell": "賣出", "buy": "買進", "sell_call": "賣 Call", "buy_call": "買 Call", "sell_put": "賣 Put", "buy_put": "買 Put"}.get(c, c) for c in strike_cols] + [
+        "權利金 (點)", "權利金 ($)", "最大虧損 ($)", "報酬/風險", "觸價機率 %", "獲利機率 %", "Delta", "Theta/日 ($)", "Vega/1% ($)"]
+    st.dataframe(show.style.format(precision=2, thousands=","), hide_index=True, use_container_width=True)
+
+with tab3, prof.span("tab3.txo"):
     st.header("🚀 選擇權每週戰情室 (TXO Weekly 動態對沖)")
 
-    base_distance = 500
-    if pe_val > 25.0:
-        base_distance = 700
+    txo = pf["txo_plan"]
+    if txo["base_distance"] == 700:
         st.warning("⚠️ 系統偵測：目前 P/E 處於高估值區，已自動將選擇權安全防護網拉寬至 700 點以上。")
-    elif pe_val < 20.0:
-        base_distance = 600
 
-    if gap >= 1.5:
+    if txo["strategy"] == "bear_call":
         strategy_name = "Bear Call Spread (高空收租 / 預先鎖利)"
         strategy_icon = "🐻"
         strategy_desc = f"【狀態】現貨正偏離達 +{gap:.2f}%。現貨部位已超載上漲動能。\n\n【動作】在現貨觸發賣出閥值前，提前在上方賣出買權收租。大盤狂噴則現貨補貼期權；大盤回檔則權利金無風險落袋。"
-        sell_strike = int(current_index + base_distance)
-        sell_strike = round(sell_strike / 100) * 100 
-        buy_strike = sell_strike + 500 
+        sell_strike, buy_strike = txo["sell_call"], txo["buy_call"]
 
-    elif -1.0 <= gap < 1.5:
+    elif txo["strategy"] == "iron_condor":
         strategy_name = "Iron Condor (鐵鷹策略 / 泥沼盤雙收)"
         strategy_icon = "🦅"
         strategy_desc = f"【狀態】現貨偏離度為 {gap:.2f}% (中性健康區間)。大盤目前缺乏單邊極端動能。\n\n【動作】啟動鐵鷹策略，在上下安全距離外同時建立部位，雙向收取 Theta 時間價值。這是死魚盤的最佳提款機。"
-        sell_call = round(int(current_index + base_distance + 100) / 100) * 100
-        buy_call = sell_call + 500
-        sell_put = round(int(current_index - base_distance - 100) / 100) * 100
-        buy_put = sell_put - 500
+        sell_call, buy_call, sell_put, buy_put = txo["sell_call"], txo["buy_call"], txo["sell_put"], txo["buy_put"]
 
     else:
         strategy_name = "Bull Put Spread (低檔防守收租)"
         strategy_icon = "🐂"
         strategy_desc = f"【狀態】現貨負偏離達 {gap:.2f}%。大盤近期回檔，估值壓力減輕。\n\n【動作】在下方賣出賣權。若大盤撐住，賺取權利金；若大盤續跌，等同於順勢增加多頭曝險，完美配合現貨逢低加碼邏輯。"
-        sell_strike = round(int(current_index - base_distance) / 100) * 100
-        buy_strike = sell_strike - 500
+        sell_strike, buy_strike = txo["sell_put"], txo["buy_put"]
 
     st.markdown(f"### 🎯 本週建議策略：{strategy_icon} {strategy_name}")
     st.info(strategy_desc)
@@ -423,29 +572,19 @@ with tab3:
             st.metric(f"買進 (Buy) {target_buy_type} 履約價", f"{buy_strike}")
         st.error(f"🔒 系統鐵律：必須同時買進 {buy_strike} 進行價差鎖定，嚴禁裸賣！")
 
+    st.markdown("---")
+    option_chain_panel(txo)
+
     st.markdown("---")
     st.markdown("💡 **量化副手提醒**：以上為系統靜態基準點。極端跳空日或重大數據發布前，請將最新 CSV 傳送給 AI 副手，進行當日『勝率評估』與『最佳建倉時機 (Theta/Vega 決策)』。")
 
-with tab4:
+@st.fragment
+@prof.timed("tab4.monte_carlo")
+def monte_carlo_tab():
     st.title("🔮 蒙地卡羅未來資產推演 (AI-Optimized Gravity Model)")
     st.markdown("基於您 **今日真實的資產配置** 與 **所有場外負債**，結合 AI 超級週期的總經環境，模擬未來 10,000 種平行宇宙的真實財富軌跡。")
     
     with st.expander("⚙️ 總體經濟動態最佳化 (Dynamic Macro Optimization)", expanded=True):
-        w_atk, w_cor = val_attack/total_assets if total_assets>0 else 0, val_core/total_assets if total_assets>0 else 0
-        w_def, w_amo = val_defense/total_assets if total_assets>0 else 0, val_ammo/total_assets if total_assets>0 else 0
-        
-        pe_baseline = 22.0  
-        safe_pe_val = max(min(pe_val, 30.0), 15.0) 
-        
-        mu_multiplier = pe_baseline / safe_pe_val
-        vol_multiplier = 1.0 + (mdd_pct / 100.0) + (max(safe_pe_val - 24.0, 0) / 40.0)
-
-        adj_atk_mu = 0.24 * mu_multiplier
-        adj_cor_mu = 0.14 * ((mu_multiplier + 1.0) / 2)
-        
-        default_mu = (w_atk * adj_atk_mu) + (w_cor * adj_cor_mu) + (w_def * 0.08) + (w_amo * 0.04)
-        default_vol = ((w_atk * 0.40) + (w_cor * 0.22) + (w_def * 0.12) + (w_amo * 0.03)) * vol_multiplier
-        
         st.markdown(f"🧠 **AI 引擎自動判定**：大盤目前 P/E 為 `{pe_val}` (基準為 22.0)。系統已為您客觀計算出：")
         st.markdown(f"- 預期報酬率乘數：`{mu_multiplier:.2f}` 倍 (不過度悲觀，保留 AI 動能)")
         st.markdown(f"- 波動率風險乘數：`{vol_multiplier:.2f}` 倍")
@@ -456,72 +595,152 @@ with tab4:
         port_vol = c_vol.slider("最佳化投資組合 年化波動率 (Volatility)", min_value=0.05, max_value=0.50, value=float(default_vol), step=0.01, format="%.2f")
     
     mc_years = st.slider("🕰️ 選擇推演時間軸 (Years)", min_value=1, max_value=20, value=5, step=1)
+    st.session_state['mc_params'] = {'defaults': (default_mu, default_vol), 'mu': port_mu, 'vol': port_vol, 'years': mc_years}
+    analytic_ruin = analytic_ruin_prob(total_assets, loan_amount * 1.3, port_mu, port_vol, mc_years)
+    st.metric("💀 斷頭機率 (解析)", f"{analytic_ruin:.1f}%", delta=f"{mc_years} 年內", delta_color="inverse" if analytic_ruin > 5.0 else "off", help="以上方的 CAGR、波動率與年數，用 GBM 首次觸及公式即時估算；第一分頁的儀表會在下次整頁更新時同步。")
+    mc_model = st.radio("🧬 推演模型", ["單一混合 GBM", "多資產相關性模型 (六檔持股)"], horizontal=True, help="多資產模型讓每檔持股擁有各自的報酬、波動與槓桿倍數 (含正二每日再平衡的波動耗損)，並以相關矩陣連動；總經乘數同樣套用。")
+    multi_asset = mc_model != "單一混合 GBM"
+    if multi_asset:
+        rebalance_modes = {"每月檢查 Tier 目標再平衡": 12, "每季檢查 Tier 目標再平衡": 4, "買進持有 (不再平衡)": None}
+        rebalance_mode = st.radio("⚖️ 再平衡規則", list(rebalance_modes.keys()), horizontal=True, help=f"依模擬出的大盤 MDD 查 Tier 目標，攻擊型占比偏離超過 ±{gap_tolerance}% 時調回目標。")
+    c_paths, c_par = st.columns(2)
+    mc_paths = c_paths.selectbox("🎲 模擬路徑數", [10000, 100000, 1000000], format_func=lambda n: f"{n:,}")
+    use_parallel = c_par.checkbox(f"⚡ 多核心平行運算 ({default_workers()} 核)", value=mc_paths > 10000)
+    ruin_modes = {
+        "月線 + 布朗橋修正 (推薦)": dict(steps_per_year=12, bridge=True),
+        "日線逐日檢查 (252 步/年)": dict(steps_per_year=252, bridge=False),
+        "月線月底檢查 (舊版)": dict(steps_per_year=12, bridge=False),
+    }
+    sampling_modes = {"對偶變數 (Antithetic)": "antithetic", "準蒙地卡羅 (Scrambled Sobol)": "sobol", "一般偽亂數": "plain"}
+    if multi_asset: sampling_modes = {"一般偽亂數": "plain"}
+    sampling_mode = st.radio("🎯 抽樣方式 (變異數縮減)", list(sampling_modes.keys()), horizontal=True, help="對偶變數與 Sobol 準蒙地卡羅能以更少的路徑達到相同的尾部精度；下方會附上 95% 信賴區間。")
+    if multi_asset: ruin_modes = {k: v for k, v in ruin_modes.items() if not v["bridge"]}
+    ruin_mode = st.radio("🔍 斷頭偵測解析度", list(ruin_modes.keys()), horizontal=True, help="月底檢查會漏掉月中跌破又彈回的斷頭事件；布朗橋修正以解析解補上格點之間的觸線機率，不需日線記憶體。")
+    n_shown = st.select_slider("🧵 疊加抽樣路徑", [0, 20, 50, 100], value=0, help="扇形圖的百分位帶已在伺服器端算好；抽樣路徑合併成單一 WebGL 線條，圖表大小與路徑數、年數無關。")
     
-    if st.button("🚀 啟動 10,000 次真實淨資產推演", type="primary"):
-        with st.spinner(f"正在運算未來 {mc_years} 年的 10,000 種可能性..."):
-            np.random.seed(42) 
-            num_simulations = 10000
-            steps = mc_years * 12 
-            dt = 1 / 12
-            
-            Z = np.random.normal(0, 1, (steps, num_simulations))
-            drift = (port_mu - 0.5 * port_vol**2) * dt
-            diffusion = port_vol * np.sqrt(dt) * Z
-            daily_returns = np.exp(drift + diffusion)
-            
-            price_paths = np.zeros_like(daily_returns)
-            price_paths[0] = total_assets
-            for t in range(1, steps):
-                price_paths[t] = price_paths[t-1] * daily_returns[t]
-                
-            true_net_paths = price_paths - loan_amount - mortgage_loan - personal_loan
-            
-            margin_call_threshold = loan_amount * 1.3
-            ruin_paths = np.any(price_paths < margin_call_threshold, axis=0)
-            ruin_prob = np.mean(ruin_paths) * 100
-            
-            final_true_net_assets = true_net_paths[-1, ~ruin_paths]
-            
-            if len(final_true_net_assets) > 0:
-                p05 = np.percentile(final_true_net_assets, 5)
-                p50 = np.percentile(final_true_net_assets, 50)
-                p95 = np.percentile(final_true_net_assets, 95)
-            else:
-                p05 = p50 = p95 = 0
-
-            sample_paths = true_net_paths[:, np.random.choice(num_simulations, 100, replace=False)]
-            time_axis = np.linspace(0, mc_years, steps)
-            
-            fig = go.Figure()
-            for i in range(100):
-                fig.add_trace(go.Scatter(x=time_axis, y=sample_paths[:, i], mode='lines', line=dict(color='rgba(135, 206, 250, 0.1)'), showlegend=False))
+    if st.button(f"🚀 啟動 {mc_paths:,} 次真實淨資產推演", type="primary"):
+        with st.spinner(f"正在運算未來 {mc_years} 年的 {mc_paths:,} 種可能性..."):
+            total_debt = loan_amount + mortgage_loan + personal_loan
+            n_workers = default_workers() if use_parallel else 1
+            with prof.span("mc.simulation", paths=mc_paths, years=mc_years, multi_asset=multi_asset, workers=n_workers):
+                if multi_asset:
+                    steps_per_year = ruin_modes[ruin_mode]["steps_per_year"]
+                    per_year = rebalance_modes[rebalance_mode]
+                    sim = mc_portfolio.run_portfolio_simulation(holdings_values, total_debt, loan_amount * 1.3, mc_years, n_paths=mc_paths, seed=42,
+                                                   steps_per_year=steps_per_year, mu_scale=mu_multiplier, vol_scale=vol_multiplier,
+                                                   financing_rate=leverage_cost, rebalance_every=steps_per_year // per_year if per_year else None,
+                                                   base_exposure=base_exposure, start_mdd_pct=mdd_pct, tolerance=gap_tolerance, n_workers=n_workers,
+                                                   holdings=holdings.catalog())
+                else:
+                    sim = run_simulation(total_assets, total_debt, loan_amount * 1.3, port_mu, port_vol, mc_years,
+                                         n_paths=mc_paths, seed=42, n_workers=n_workers,
+                                         sampling=sampling_modes[sampling_mode], **ruin_modes[ruin_mode])
+            prof.count("mc.sim_cache." + ("hit" if sim["cached"] else "miss"))
+            ruin_prob, p05, p50, p95 = sim["ruin_prob"], sim["p05"], sim["p50"], sim["p95"]
+            if sim["cached"]: st.caption("⚡ 相同參數已推演過，直接取用快取結果。")
+            with prof.span("mc.fan_chart", samples=n_shown):
+                fan = fan_series(sim, n_samples=n_shown)
+                t_fan, bands = fan["t"], fan["bands"]
             
-            median_path = np.median(true_net_paths, axis=1)
-            fig.add_trace(go.Scatter(x=time_axis, y=median_path, mode='lines', line=dict(color='#FFD700', width=3), name='中位數預期'))
-            fig.add_trace(go.Scatter(x=[0, mc_years], y=[true_net_assets, true_net_assets], mode='lines', line=dict(color='#FF4B4B', width=2, dash='dash'), name='目前真實淨資產起點'))
+                # 百分位扇形圖：外帶 5~95%、內帶 25~75%，各以兩條曲線 + fill="tonexty" 繪製
+                fig = go.Figure()
+                if n_shown:
+                    fig.add_trace(go.Scattergl(x=fan["sample_t"], y=fan["sample_y"], mode='lines', line=dict(color='rgba(135, 206, 250, 0.25)', width=1), name=f'抽樣路徑 ({n_shown} 條)', hoverinfo='skip'))
+                for lo, hi, color, name in ((5, 95, 'rgba(135, 206, 250, 0.15)', '5% ~ 95%'), (25, 75, 'rgba(135, 206, 250, 0.35)', '25% ~ 75%')):
+                    fig.add_trace(go.Scatter(x=t_fan, y=bands[lo], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+                    fig.add_trace(go.Scatter(x=t_fan, y=bands[hi], mode='lines', line=dict(width=0), fill='tonexty', fillcolor=color, name=name, hoverinfo='skip'))
+                fig.add_trace(go.Scatter(x=t_fan, y=bands[50], mode='lines', line=dict(color='#FFD700', width=3), name='中位數預期'))
+                fig.add_trace(go.Scatter(x=[0, mc_years], y=[true_net_assets, true_net_assets], mode='lines', line=dict(color='#FF4B4B', width=2, dash='dash'), name='目前真實淨資產起點'))
             
-            fig.update_layout(title=f"未來 {mc_years} 年【真實淨資產】推演 (抽樣 100 條路徑)", xaxis_title="年度", yaxis_title="真實淨資產 (台幣)", template="plotly_dark")
+                fig.update_layout(title=f"未來 {mc_years} 年【真實淨資產】推演 (百分位扇形圖，{sim['n_paths']:,} 條路徑)", xaxis_title="年度", yaxis_title="真實淨資產 (台幣)", template="plotly_dark", hovermode="x unified")
             st.plotly_chart(fig, use_container_width=True)
             
             st.subheader("📊 家族傳承真實財富報告")
             r1, r2, r3, r4 = st.columns(4)
             # 修正了第四分頁的亂碼錯字
-            r1.metric(f"💀 質押斷頭機率", f"{ruin_prob:.2f}%", help="未來任一月份券商維持率跌破 130% 的機率")
+            r1.metric(f"💀 質押斷頭機率", f"{ruin_prob:.2f}%", delta=f"解析解 {analytic_ruin:.2f}%", delta_color="off", help=f"未來任一時點券商維持率跌破 130% 的機率 (偵測方式: {ruin_mode})")
             r2.metric(f"⛈️ 最差 5% 真實財富", f"${p05:,.0f}", help="運氣極差情況下扣除所有負債後的剩餘淨值")
             r3.metric(f"⛅ 中位數 真實財富", f"${p50:,.0f}", help="最有可能發生的真實財富落點")
             r4.metric(f"☀️ 最佳 5% 真實財富", f"${p95:,.0f}", help="AI 超級週期延續情況下的真實財富")
             
+            # 路徑太少 (或 Sobol 只有一個複本) 時標準誤無法估計，顯示 "—"
+            ci = {k: "± " + (f"{1.96 * v:.2f}%" if k == "ruin_prob" else f"${1.96 * v:,.0f}") if np.isfinite(v) else "—" for k, v in sim["se"].items()}
+            st.caption(f"📏 95% 信賴區間 ({sampling_mode})：斷頭機率 {ci['ruin_prob']}｜最差 5% {ci['p05']}｜中位數 {ci['p50']}｜最佳 5% {ci['p95']}")
+            
             if ruin_prob > 5.0:
                 st.error("⚠️ **風險警告：** 您的斷頭機率高於 5%。建議調降質押借款，或增加防禦配置，再重新推演。")
             else:
                 st.success("✅ **系統評估：** 您的投資組合抗壓性極佳，請安心享受時間複利。")
 
-with tab5:
+with tab4:
+    monte_carlo_tab()
+
+@st.fragment
+@prof.timed("tab5.rate_check")
+def rate_check():
+    actual_rate = st.number_input("輸入目前實際質押年利率 (%)", value=2.5, step=0.1)
+    if actual_rate > 3.0:
+        st.error(f"🚨 **資金成本過高**：目前利率 {actual_rate}% 偏高。這將侵蝕您的投資組合期望值，建議尋求轉貸降息，或考慮放緩借款擴張速度。")
+    else:
+        st.success(f"✅ **資金成本健康**：利率 {actual_rate}% 非常優異。享有正二低成本槓桿優勢，請安心維持目前的戰略極限。")
+
+@st.fragment
+@prof.timed("tab5.backtest")
+def backtest_panel():
+    index_bars = get_market_store().bars(INDEX_SYMBOL)
+    if len(index_bars) < 2:
+        st.info("ℹ️ 本地尚無足夠的加權指數日線，請先連網更新市場數據。")
+    else:
+        st.caption(f"資料區間：{index_bars.index[0]:%Y-%m-%d} ~ {index_bars.index[-1]:%Y-%m-%d} ({len(index_bars):,} 根 K 棒)；起始部位取目前的總市值、質押借款與場外負債，P/E 固定為目前輸入值。")
+        if st.button("▶️ 執行回測"):
+            with prof.span("backtest.run", bars=len(index_bars)):
+                bt = backtest.run_backtest(index_bars, total_assets, loan_amount, mortgage_loan + personal_loan,
+                                  base_exposure=base_exposure, pe=pe_val, financing_rate=leverage_cost, loan_rate=leverage_cost)
+            bt_sum, bt_curve = bt["summary"], bt["curve"]
+            b1, b2, b3, b4 = st.columns(4)
+            b1.metric("年化報酬 (CAGR)", f"{bt_sum['cagr']*100:.2f}%")
+            b2.metric("最大回撤", f"{bt_sum['max_drawdown_pct']:.1f}%")
+            b3.metric("再平衡次數 / 年週轉率", f"{bt_sum['n_rebalances']}", delta=f"{bt_sum['annual_turnover']*100:.0f}% / 年", delta_color="off")
+            b4.metric("最低維持率", f"{bt_sum['min_maintenance_ratio']:.0f}%", delta=f"斷頭 {bt_sum['margin_call_days']} 天 / 低於安全線 {bt_sum['below_safety_days']} 天", delta_color="off")
+            fig_bt = go.Figure()
+            fig_bt.add_trace(go.Scatter(x=bt_curve.index, y=bt_curve["net_assets"], mode="lines", name="券商淨資產"))
+            fig_bt.add_trace(go.Scatter(x=bt["events"].index[1:], y=bt_curve.loc[bt["events"].index[1:], "net_assets"], mode="markers", marker=dict(size=4, color="#FFD700"), name="再平衡"))
+            fig_bt.update_layout(template="plotly_dark", title="📈 回測淨資產曲線", yaxis_title="淨資產", hovermode="x unified")
+            st.plotly_chart(fig_bt, use_container_width=True)
+            fig_dd = px.area(bt_curve, y="drawdown_pct", title="📉 淨資產回撤 (%)")
+            fig_dd.update_layout(template="plotly_dark", yaxis_title="回撤 (%)", xaxis_title=None)
+            st.plotly_chart(fig_dd, use_container_width=True)
+
+@st.fragment
+@prof.timed("tab5.sweep")
+def sweep_panel():
+    index_bars = get_market_store().bars(INDEX_SYMBOL).dropna(subset=["High", "Close"])
+    if len(index_bars) < 60:
+        st.info("ℹ️ 本地尚無足夠的加權指數日線，請先連網更新市場數據。")
+    else:
+        st.caption("以歷史日報酬區塊自助抽樣產生合成路徑，評估全部參數組合；大規模掃描請改用命令列 `python sweep.py`。")
+        sw1, sw2 = st.columns(2)
+        sweep_paths = sw1.selectbox("合成路徑數", [50, 100, 200], index=0)
+        sweep_years = sw2.slider("每條路徑年數", 3, 20, 10)
+        if st.button("🔍 開始掃描"):
+            with st.spinner("掃描參數組合中..."), prof.span("sweep.run", paths=sweep_paths, years=sweep_years):
+                sweep_df = sweep.run_sweep(sweep.bootstrap_bars(index_bars, sweep_paths, sweep_years), sweep.param_grid(), total_assets,
+                                     loan_amount, mortgage_loan + personal_loan, n_workers=default_workers(),
+                                     pe=pe_val, earnings_growth=0.08, financing_rate=leverage_cost, loan_rate=leverage_cost)
+            sweep_df["方案"] = sweep_df.apply(lambda r: f"base {r.base_exposure:.0f} / 容忍 {r.gap_tolerances} @ {r.gap_scale_assets/1e6:.0f}M / P/E 上限 {r.pe_limits[0]}~{r.pe_limits[-1]}", axis=1)
+            fig_sw = px.scatter(sweep_df, x="ruin_prob", y="cagr_median", color="pareto", hover_name="方案",
+                                labels={"ruin_prob": "斷頭機率 (%)", "cagr_median": "CAGR 中位數"},
+                                color_discrete_map={True: "#FFD700", False: "#555555"})
+            fig_sw.update_layout(template="plotly_dark", title="🧭 CAGR vs. 斷頭機率 (金色為 Pareto 前緣)")
+            st.plotly_chart(fig_sw, use_container_width=True)
+            st.dataframe(sweep_df[sweep_df["pareto"]].sort_values("ruin_prob").drop(columns=["pareto"]), use_container_width=True, hide_index=True)
+
+with tab5, prof.span("tab5.calibration"):
     st.title("⚖️ 系統校準與診斷 (Calibration Room)")
     st.markdown("自動比對雲端保險箱內的歷史軌跡，進行系統自我診斷與參數微調建議。建議每季檢視一次。")
 
-    if os.path.exists(HISTORY_FILE):
-        df_hist = pd.read_csv(HISTORY_FILE)
+    df_hist = history_store.load()
+    if not df_hist.empty:
         if len(df_hist) >= 2:
             if 'True_Net_Assets' not in df_hist.columns:
                 df_hist['True_Net_Assets'] = df_hist['Net_Assets'] if 'Net_Assets' in df_hist.columns else df_hist['Total_Assets']
@@ -529,26 +748,28 @@ with tab5:
             df_hist['Date'] = pd.to_datetime(df_hist['Date'])
             df_hist = df_hist.sort_values('Date')
 
-            fig_hist = px.line(df_hist, x='Date', y='True_Net_Assets', title="💎 真實淨資產歷史軌跡 (依據存檔紀錄)", markers=True)
-            fig_hist.update_layout(template="plotly_dark", yaxis_title="真實淨資產")
+            # 歷史筆數再多也只畫 LTTB 挑出的轉折點
+            with prof.span("tab5.history_chart", rows=len(df_hist)):
+                keep = lttb(df_hist['Date'].astype('int64'), df_hist['True_Net_Assets'], HISTORY_CHART_POINTS)
+                fig_hist = px.line(df_hist.iloc[keep], x='Date', y='True_Net_Assets', title="💎 真實淨資產歷史軌跡 (依據存檔紀錄)", markers=len(keep) <= 200, render_mode="webgl")
+                fig_hist.update_layout(template="plotly_dark", yaxis_title="真實淨資產")
             st.plotly_chart(fig_hist, use_container_width=True)
+            if len(keep) < len(df_hist): st.caption(f"共 {len(df_hist):,} 筆紀錄，圖表以 LTTB 降採樣為 {len(keep):,} 點。")
 
-            start_date = df_hist['Date'].iloc[0]
-            end_date = df_hist['Date'].iloc[-1]
-            days_passed = (end_date - start_date).days
-            start_assets = df_hist['True_Net_Assets'].iloc[0]
-            end_assets = df_hist['True_Net_Assets'].iloc[-1]
-
-            if days_passed > 0 and start_assets > 0:
-                annualized_return = ((end_assets / start_assets) ** (365 / days_passed)) - 1
-            else:
-                annualized_return = 0
+            # 績效統計隨每次存檔增量更新，這裡只讀取累計狀態
+            perf = history_store.performance()
+            days_passed = int(perf['years'] * 365)
+            annualized_return = perf['twr_annualized']
 
             st.subheader("🕵️‍♂️ 系統歷史績效診斷")
             c1, c2, c3 = st.columns(3)
-            c1.metric("歷史追蹤期間", f"{days_passed} 天")
-            c2.metric("期間淨資產變化", f"${end_assets - start_assets:+,.0f}")
-            c3.metric("換算年化報酬率 (CAGR)", f"{annualized_return*100:.2f}%")
+            c1.metric("歷史追蹤期間", f"{days_passed} 天", delta=f"{perf['records']:,} 筆紀錄", delta_color="off")
+            c2.metric("期間淨資產變化", f"${perf['end_value'] - perf['start_value']:+,.0f}", delta=f"外部資金 ${perf['net_flows']:+,.0f}", delta_color="off", help="外部資金 = 手動登錄的入金 / 出金 + 房貸增貸與信貸的本金減少")
+            c3.metric("時間加權報酬 (TWR 年化)", f"{annualized_return*100:.2f}%", delta=f"期間 {perf['twr']*100:+.2f}%", delta_color="off", help="逐筆子期間報酬連乘，已扣除外部資金進出，反映策略本身的績效。")
+            c4, c5, c6 = st.columns(3)
+            c4.metric("資金加權報酬 (MWR / IRR)", f"{perf['mwr']*100:.2f}%" if perf['mwr'] is not None else "—", help="考慮投入時點與金額的內部報酬率，反映您實際拿到的報酬。")
+            c5.metric("已實現波動率 (年化)", f"{perf['realized_vol']*100:.1f}%" if perf['realized_vol'] is not None else "—")
+            c6.metric("最大回撤", f"{perf['max_drawdown_pct']:.1f}%", delta=f"目前 {perf['drawdown_pct']:.1f}%", delta_color="off", help="以扣除外部資金後的淨值指數計算。")
 
             st.divider()
 
@@ -567,13 +788,131 @@ with tab5:
 
             st.markdown("#### 2. 資金成本校準 ($r$)")
             st.markdown("請輸入您**目前實際**的券商質押利率。系統將評估是否會吃掉正二的逆價差紅利：")
-            actual_rate = st.number_input("輸入目前實際質押年利率 (%)", value=2.5, step=0.1)
-            if actual_rate > 3.0:
-                st.error(f"🚨 **資金成本過高**：目前利率 {actual_rate}% 偏高。這將侵蝕您的投資組合期望值，建議尋求轉貸降息，或考慮放緩借款擴張速度。")
-            else:
-                st.success(f"✅ **資金成本健康**：利率 {actual_rate}% 非常優異。享有正二低成本槓桿優勢，請安心維持目前的戰略極限。")
+            rate_check()
 
         else:
             st.warning("⚠️ 歷史資料不足：需要至少 2 筆儲存紀錄，才能啟動趨勢診斷與校準。請在左側側邊欄點擊「儲存今日最新狀態」來累積紀錄。")
     else:
-        st.warning("⚠️ 找不到歷史備份檔 (`asset_history.csv`)。系統目前無記憶，請先在左側進行第一次儲存。")
+        st.warning("⚠️ 找不到歷史紀錄。系統目前無記憶，請先在左側進行第一次儲存，或上傳 CSV 備份檔。")
+
+    st.divider()
+    with st.expander("🧪 策略歷史回測 (以本地 ^TWII 日線重播 Tier 階梯 + 動態容忍度 + 雙引擎煞車)"):
+        backtest_panel()
+
+    with st.expander("🧭 策略參數掃描 (base_exposure / gap_tolerance / P/E 上限表的 Pareto 前緣)"):
+        sweep_panel()
+
+@st.fragment
+@prof.timed("tab6.scenarios")
+def scenario_tab():
+    st.title("🧯 壓力測試矩陣 (Scenario Grid)")
+    st.markdown("一次計算整個「加權指數 x P/E x 質押借款」網格上的維持率、負債比、實質槓桿與加碼 / 減碼建議。持股價格依各自 Beta 隨指數變動，MDD 以目前 ATH 重新計算。")
+
+    g1, g2, g3 = st.columns(3)
+    idx_range = g1.slider("加權指數變動 (%)", -60, 30, (-40, 15), step=5)
+    pe_range = g2.slider("大盤 P/E 範圍", 10.0, 35.0, (14.0, 28.0), step=0.5)
+    grid_res = g3.selectbox("網格解析度 (每軸點數)", [100, 200, 400, 1000], index=1)
+    loan_max = st.slider("質押借款上限 (借款軸)", 0, int(max(loan_amount * 3, 5_000_000)), int(max(loan_amount * 2, 2_000_000)), step=100_000)
+
+    if current_index > 0 and total_assets > 0:
+        idx_axis = current_index * (1 + np.linspace(idx_range[0], idx_range[1], grid_res) / 100)
+        pe_axis = np.linspace(pe_range[0], pe_range[1], grid_res)
+        loan_axis = np.linspace(0, loan_max, grid_res)
+        t_grid = time.perf_counter()
+        with prof.span("scenarios.grid", resolution=grid_res):
+            grid_pe = evaluate_grid(portfolio_inputs, idx_axis, pe_axis, None)
+            grid_loan = evaluate_grid(portfolio_inputs, idx_axis, None, loan_axis)
+        stride = -(-grid_res // HEATMAP_POINTS)
+        shown = f"；熱圖每 {stride} 點取 1 點顯示" if stride > 1 else ""
+        st.caption(f"⏱️ {2 * grid_res * grid_res:,} 個情境，計算耗時 {(time.perf_counter() - t_grid) * 1000:.0f} ms{shown}")
+
+        def scenario_heatmap(z, x, y, title, x_title, y_title, colorscale, zmid=None, zmin=None, zmax=None, marker=None):
+            # 等間隔抽點，每張熱圖至多 HEATMAP_POINTS^2 格送到瀏覽器
+            z, x, y = z[::stride, ::stride], x[::stride], y[::stride]
+            fig = go.Figure(go.Heatmap(z=z.T, x=x, y=y, colorscale=colorscale, zmid=zmid, zmin=zmin, zmax=zmax))
+            if marker is not None:
+                fig.add_trace(go.Scatter(x=[marker[0]], y=[marker[1]], mode="markers", marker=dict(symbol="x", size=12, color="white"), name="目前狀態"))
+            fig.update_layout(template="plotly_dark", title=title, xaxis_title=x_title, yaxis_title=y_title, height=420, showlegend=False)
+            return fig
+
+        st.subheader("1. 指數 x P/E (目前借款)")
+        pe_metric = st.radio("指標", ["加碼 / 減碼建議金額", "實質槓桿 (%)", "槓桿上限 (%)", "曝險缺口"], horizontal=True)
+        if pe_metric == "加碼 / 減碼建議金額":
+            z, cs, zmid = grid_pe["recommendation"] * grid_pe["recommendation_amount"], "RdYlGn", 0
+        elif pe_metric == "實質槓桿 (%)":
+            z, cs, zmid = grid_pe["real_leverage_ratio"], "Viridis", None
+        elif pe_metric == "槓桿上限 (%)":
+            z, cs, zmid = grid_pe["safe_leverage_limit"], "Viridis", None
+        else:
+            z, cs, zmid = grid_pe["exposure_gap"], "RdYlGn", 0
+        st.plotly_chart(scenario_heatmap(z, idx_axis, pe_axis, f"{pe_metric} (綠 = BORROW / 紅 = REDUCE)" if zmid == 0 else pe_metric,
+                                         "加權指數", "P/E", cs, zmid=zmid, marker=(current_index, pe_val)), use_container_width=True)
+
+        st.subheader("2. 指數 x 質押借款 (目前 P/E)")
+        h1, h2 = st.columns(2)
+        h1.plotly_chart(scenario_heatmap(grid_loan["maintenance_ratio"], idx_axis, loan_axis, "🛡️ 維持率 (%)", "加權指數", "質押借款",
+                                         "RdYlGn", zmin=130, zmax=400, marker=(current_index, loan_amount)), use_container_width=True)
+        h2.plotly_chart(scenario_heatmap(grid_loan["loan_ratio"], idx_axis, loan_axis, "📊 負債比 U (%)", "加權指數", "質押借款",
+                                         "RdYlGn_r", zmin=0, zmax=50, marker=(current_index, loan_amount)), use_container_width=True)
+
+        call_idx = idx_axis[grid_loan["margin_call"][:, np.argmin(np.abs(loan_axis - loan_amount))]]
+        if len(call_idx):
+            st.error(f"⛔ 以目前借款，加權指數跌到 {call_idx.max():,.0f} 點 ({(call_idx.max() / current_index - 1) * 100:+.1f}%) 以下維持率將跌破 130%。")
+        else:
+            st.success("✅ 在上述指數範圍內，以目前借款維持率不會跌破 130%。")
+    else:
+        st.info("ℹ️ 請先輸入持股與加權指數，才能產生壓力測試矩陣。")
+
+with tab6:
+    scenario_tab()
+
+# --- 8. 效能診斷面板 (管理員) ---
+# 歷史資料庫的快取為行程共用，以本次重跑前後的計數差記入 (其他 session 同時重跑時會一併計入)；
+# 蒙地卡羅快取在片段內按鈕觸發，於推演處直接計數
+prof.count("history_store.hit", history_store.hits - history_counts[0])
+prof.count("history_store.miss", history_store.misses - history_counts[1])
+
+HEAVY_MODULES = ["numpy", "pandas", "streamlit", "plotly.express", "scipy.special", "yfinance"]
+
+def diagnostics_panel():
+    run = prof.last_run()
+    if run is not None:
+        elapsed = run["total_ms"] if "total_ms" in run else (time.perf_counter() - run["t0"]) * 1000
+        st.markdown(f"**重跑 #{run['run']}** ({run['label']}，到面板為止 {elapsed:,.0f} ms)")
+        spans = pd.DataFrame(run["spans"]).sort_values("start_ms")
+        spans["區段"] = ["　" * d + n for d, n in zip(spans["depth"], spans["name"])]
+        st.dataframe(spans[["區段", "start_ms", "ms"]].rename(columns={"start_ms": "開始 (ms)", "ms": "耗時 (ms)"}).style.format(precision=1), hide_index=True, use_container_width=True)
+
+    st.markdown(f"**最近 {len(prof.runs)} 次重跑的區段統計**")
+    summary = pd.DataFrame(prof.span_summary())
+    if not summary.empty:
+        st.dataframe(summary[["name", "calls", "mean_ms", "max_ms", "last_ms"]].rename(columns={"name": "區段", "calls": "次數", "mean_ms": "平均 (ms)", "max_ms": "最大 (ms)", "last_ms": "最近 (ms)"}).style.format(precision=1), hide_index=True, use_container_width=True)
+
+    st.markdown("**快取命中**")
+    caches = pd.DataFrame.from_dict(prof.cache_summary(), orient="index")
+    if not caches.empty:
+        caches["hit_rate"] *= 100
+        st.dataframe(caches.rename(columns={"hit": "命中", "miss": "未命中", "hit_rate": "命中率 %"}).style.format(precision=1), use_container_width=True)
+
+    st.markdown("**匯入時間**")
+    if IMPORT_TIMES:
+        st.dataframe(pd.DataFrame({"模組": list(IMPORT_TIMES), "耗時 (ms)": list(IMPORT_TIMES.values())}).style.format(precision=1), hide_index=True, use_container_width=True)
+    st.caption("延後載入的模組在第一次使用時才計入；下方按鈕在乾淨的子行程量測冷啟動匯入時間。")
+    if st.button("⏱️ 量測冷啟動匯入時間"):
+        try:
+            st.session_state["import_breakdown"] = import_breakdown(HEAVY_MODULES)
+        except Exception as e:
+            st.error(f"量測失敗: {e}")
+    if st.session_state.get("import_breakdown"):
+        cold = pd.DataFrame(st.session_state["import_breakdown"])
+        cold["module"] = ["　" * d + m for d, m in zip(cold["depth"], cold["module"])]
+        st.dataframe(cold[["module", "cumulative_ms", "self_ms"]].rename(columns={"module": "模組", "cumulative_ms": "累計 (ms)", "self_ms": "自身 (ms)"}).style.format(precision=1), hide_index=True, use_container_width=True)
+
+    st.download_button("📥 匯出結構化日誌 (JSONL)", data=prof.to_jsonl(), file_name=f"ADEIS_profile_{datetime.now(pytz.timezone('Asia/Taipei')).strftime('%Y%m%d_%H%M%S')}.jsonl", mime="application/x-ndjson")
+
+if st.session_state.get("is_admin"):
+    with st.sidebar:
+        st.markdown("---")
+        with st.expander("🩺 效能診斷 (管理員)"):
+            diagnostics_panel()
+prof.finish_run()
@@ -0,0 +1,234 @@
+# --- 策略歷史回測 (MDD 位階階梯 + 動態容忍度再平衡 + 雙引擎煞車) ---
+# 以本地保存的 ^TWII 日線重播第 6 區的同一套規則：
+#   目標攻擊占比 = min(Tier 目標, 槓桿上限允許的占比)，槓桿上限 = min(估值限速, 凱利限速)
+#   實際占比偏離目標超過 gap_tolerance (3% / 5%) 時，當日收盤調回目標。
+# 所有逐日序列 (ATH、MDD、波動率、上限) 一次向量化算完；兩次再平衡之間兩個資產各自複利，
+# 市值是累積報酬的封閉式，因此只需以陣列向前搜尋「下一個觸發日」，Python 迴圈次數 = 再平衡次數。
+# prepare() 產生與策略參數無關的逐日中間量，可被 replay() 以不同參數重複使用 (參數掃描)。
+import numpy as np
+import pandas as pd
+
+from rules import (GAP_SCALE_ASSETS, GAP_TOLERANCES, PE_LIMITS, TIER_OFFSETS, gap_tolerance, kelly_limit, pe_bucket,
+                   tier_index)
+
+TRADING_DAYS = 252
+VOL_WINDOW = 60
+MARGIN_CALL_PCT = 130.0     # 券商斷頭線
+SAFETY_LINE_PCT = 300.0     # 系統安全線
+SCAN_WINDOW = 64            # 向前搜尋的初始視窗 (找不到就加倍)
+
+
+def prepare(bars, pe=23.5, earnings_growth=None, attack_leverage=2.0, rest_beta=0.5, rest_yield=0.02,
+            financing_rate=0.025, loan_rate=0.025, start_ath=None, vol_window=VOL_WINDOW):
+    """
+    把一條指數路徑整理成與策略參數無關的逐日陣列 (MDD 位階、P/E 區間、凱利上限、兩類資產累積報酬)。
+    pe: 本益比，純量或與 bars 等長的陣列；earnings_growth 不為 None 時，純量 pe 視為起點，
+        之後隨「價格 / 盈餘趨勢」變動 (盈餘每年成長 earnings_growth)
+    """
+    bars = bars.dropna(subset=["High", "Close"])
+    close = bars["Close"].to_numpy(float)
+    high = bars["High"].to_numpy(float)
+    n = len(close)
+    if n < 2:
+        raise ValueError("回測至少需要 2 根 K 棒")
+    dt = 1.0 / TRADING_DAYS
+    steps = np.arange(n)
+
+    ath = np.maximum.accumulate(high)
+    if start_ath is not None:
+        ath = np.maximum(ath, start_ath)
+    mdd = np.maximum((ath - close) / ath * 100, 0.0)
+
+    vol = pd.Series(close).pct_change().rolling(vol_window, min_periods=2).std().to_numpy() * np.sqrt(TRADING_DAYS)
+    vol = pd.Series(vol).bfill().fillna(0.0).to_numpy()
+    if earnings_growth is not None and np.ndim(pe) == 0:
+        pe = pe * close / close[0] * np.exp(-earnings_growth * dt * steps)
+    pe = np.broadcast_to(np.asarray(pe, dtype=float), close.shape)
+
+    r = np.empty(n)
+    r[0] = 0.0
+    r[1:] = close[1:] / close[:-1] - 1.0
+    log_a = np.log1p(np.maximum(attack_leverage * r - (attack_leverage - 1.0) * financing_rate * dt, -1 + 1e-12))
+    log_r = np.log1p(np.maximum(rest_beta * r + (1.0 - rest_beta) * rest_yield * dt, -1 + 1e-12))
+    log_a[0] = log_r[0] = 0.0
+    years = (bars.index[-1] - bars.index[0]).days / 365.25 if isinstance(bars.index, pd.DatetimeIndex) else n * dt
+    return {
+        "index": bars.index, "close": close, "mdd": mdd, "vol": vol, "pe": pe,
+        "tier_idx": tier_index(mdd), "pe_idx": pe_bucket(pe), "kelly": kelly_limit(vol),
+        "ga": np.cumsum(log_a), "gr": np.cumsum(log_r), "loan_growth": np.exp(loan_rate * dt * steps),
+        "attack_leverage": float(attack_leverage), "years": max(years, dt),
+    }
+
+
+def replay(prep, total_assets, loan_amount=0.0, other_debt=0.0, base_exposure=23.0, pe_limits=PE_LIMITS,
+           gap_scale_assets=GAP_SCALE_ASSETS, gap_tolerances=GAP_TOLERANCES, scan_window=SCAN_WINDOW):
+    """以一組策略參數重播 prepare() 的路徑，回傳逐日的攻擊 / 其餘市值與再平衡事件 (日序, 原占比, 目標, 交易額)。"""
+    ga, gr, lev = prep["ga"], prep["gr"], prep["attack_leverage"]
+    n = len(ga)
+    tier = base_exposure + np.asarray(TIER_OFFSETS)[prep["tier_idx"]]
+    safe_limit = np.minimum(np.asarray(pe_limits, dtype=float)[prep["pe_idx"]], prep["kelly"])
+    loan = loan_amount * prep["loan_growth"]
+
+    def targets(j, total):
+        # 煞車：實質曝險 (攻擊 L 倍 + 其餘 1 倍) 不得超過 淨資產 x 上限
+        net = total - loan[j]
+        cap = (safe_limit[j] / 100.0 * net / total - 1.0) / max(lev - 1.0, 1e-9) * 100
+        return np.clip(np.minimum(tier[j], cap), 0.0, 100.0)
+
+    atk_out, rest_out = np.empty(n), np.empty(n)
+    tgt0 = float(targets(np.array([0]), np.array([float(total_assets)]))[0])
+    atk_out[0], rest_out[0] = total_assets * tgt0 / 100, total_assets * (1 - tgt0 / 100)
+    events = [(0, np.nan, tgt0, atk_out[0])]
+
+    # --- 事件驅動：從上次再平衡日 s 往後找第一個超出容忍度的日子 ---
+    s, lo, w = 0, 1, scan_window
+    while lo < n:
+        j = np.arange(lo, min(n, lo + w))
+        atk = atk_out[s] * np.exp(ga[j] - ga[s])
+        rest = rest_out[s] * np.exp(gr[j] - gr[s])
+        total = atk + rest
+        ratio = np.divide(atk, total, out=np.zeros_like(total), where=total > 0) * 100
+        tgt = targets(j, total)
+        tol = gap_tolerance(total - loan[j] - other_debt, gap_scale_assets, gap_tolerances)
+        hit = np.flatnonzero(np.abs(ratio - tgt) > tol)
+        stop = hit[0] + 1 if hit.size else len(j)
+        atk_out[lo:lo + stop], rest_out[lo:lo + stop] = atk[:stop], rest[:stop]
+        if hit.size:
+            e = lo + hit[0]
+            new_atk = total[hit[0]] * tgt[hit[0]] / 100
+            events.append((e, ratio[hit[0]], tgt[hit[0]], new_atk - atk_out[e]))
+            atk_out[e], rest_out[e] = new_atk, total[hit[0]] - new_atk
+            s, lo, w = e, e + 1, scan_window
+        else:
+            lo += len(j)
+            w *= 2
+    return {"attack": atk_out, "rest": rest_out, "loan": loan, "tier": tier, "safe_limit": safe_limit,
+            "events": events}
+
+
+def replay_grid(preps, params, total_assets, loan_amount=0.0, other_debt=0.0):
+    """
+    多組參數 x 多條等長路徑一起重播：逐日推進一個 (參數組, 路徑) 的狀態矩陣，
+    每天一次向量化檢查容忍度並再平衡；規則與 replay() 相同，供參數掃描使用。
+    params: list of dict (base_exposure, pe_limits, gap_scale_assets, gap_tolerances)
+    回傳 (參數組, 路徑) 的 CAGR、最大回撤、是否曾跌破斷頭線、年週轉率
+    """
+    lev = preps[0]["attack_leverage"]
+    grow_a = np.exp(np.diff(np.stack([p["ga"] for p in preps]), axis=1))      # (P, n-1) 每日成長倍數
+    grow_r = np.exp(np.diff(np.stack([p["gr"] for p in preps]), axis=1))
+    tier_idx = np.stack([p["tier_idx"] for p in preps])
+    pe_idx = np.stack([p["pe_idx"] for p in preps])
+    kelly = np.stack([p["kelly"] for p in preps])
+    loan = loan_amount * preps[0]["loan_growth"]
+    years = np.array([p["years"] for p in preps])
+
+    base = np.array([q.get("base_exposure", 23.0) for q in params], dtype=float)
+    tiers = base[:, None] + np.asarray(TIER_OFFSETS)                          # (K, 6)
+    pe_tab = np.array([q.get("pe_limits", PE_LIMITS) for q in params], dtype=float)
+    scale = np.array([q.get("gap_scale_assets", GAP_SCALE_ASSETS) for q in params], dtype=float)[:, None]
+    tols = np.array([q.get("gap_tolerances", GAP_TOLERANCES) for q in params], dtype=float)
+    tol_lo, tol_hi = tols[:, :1], tols[:, 1:]
+
+    def targets(t, total):
+        limit = np.minimum(pe_tab[:, pe_idx[:, t]], kelly[:, t])
+        cap = (limit / 100.0 * (total - loan[t]) / total - 1.0) / max(lev - 1.0, 1e-9) * 100
+        return np.clip(np.minimum(tiers[:, tier_idx[:, t]], cap), 0.0, 100.0)
+
+    shape = (len(params), len(preps))
+    total = np.full(shape, float(total_assets))
+    atk = total * targets(0, total) / 100
+    rest = total - atk
+    net0 = total_assets - loan[0]
+    peak = np.full(shape, max(net0, 0.0))
+    max_dd = np.zeros(shape)
+    traded = np.zeros(shape)
+    total_sum = total.copy()
+    ruined = np.zeros(shape, dtype=bool)
+    for t in range(1, len(loan)):
+        atk *= grow_a[:, t - 1]
+        rest *= grow_r[:, t - 1]
+        total = atk + rest
+        tgt = targets(t, total)
+        tol = np.where(total - loan[t] - other_debt < scale, tol_lo, tol_hi)
+        move = np.abs(atk / total * 100 - tgt) > tol
+        if move.any():
+            want = np.where(move, total * tgt / 100, atk)
+            traded += np.abs(want - atk)
+            atk, rest = want, total - want
+        net = total - loan[t]
+        np.maximum(peak, net, out=peak)
+        np.maximum(max_dd, np.divide(peak - net, peak, out=np.zeros(shape), where=peak > 0) * 100, out=max_dd)
+        if loan[t] > 0:
+            ruined |= total / loan[t] * 100 < MARGIN_CALL_PCT
+        total_sum += total
+
+    net = atk + rest - loan[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cagr = np.where((net > 0) & (net0 > 0), (net / net0) ** (1 / years) - 1, -1.0)
+    mean_total = total_sum / len(loan)
+    return {"cagr": cagr, "max_drawdown_pct": max_dd, "ruined": ruined,
+            "annual_turnover": np.divide(traded, mean_total * years, out=np.zeros(shape), where=mean_total > 0)}
+
+
+def run_backtest(bars, total_assets, loan_amount=0.0, other_debt=0.0, base_exposure=23.0, pe=23.5,
+                 attack_leverage=2.0, rest_beta=0.5, rest_yield=0.02, financing_rate=0.025, loan_rate=0.025,
+                 start_ath=None, vol_window=VOL_WINDOW, scan_window=SCAN_WINDOW):
+    """
+    bars: 以日期為索引、含 High / Close 的指數日線 (MarketStore.bars)
+    total_assets / loan_amount: 起始券商總市值與質押借款；other_debt 為房貸增貸 + 信貸 (只影響容忍度)
+    pe: 本益比，純量或與 bars 等長的陣列
+    attack_leverage: 攻擊型資產相對指數的槓桿 (每日再平衡，扣融資成本 financing_rate)
+    rest_beta / rest_yield: 其餘資產 = rest_beta 倍指數 + 其餘部位的年化收益
+    loan_rate: 質押利息，累計進借款
+    start_ath: 回測前的歷史高點 (None 表示以第一根 K 棒為起點)
+    回傳 {"curve": 逐日 DataFrame, "events": 再平衡明細, "summary": 績效與風險摘要}
+    """
+    prep = prepare(bars, pe, None, attack_leverage, rest_beta, rest_yield, financing_rate, loan_rate, start_ath,
+                   vol_window)
+    run = replay(prep, total_assets, loan_amount, other_debt, base_exposure, scan_window=scan_window)
+    atk_out, rest_out, loan, safe_limit = run["attack"], run["rest"], run["loan"], run["safe_limit"]
+    index = prep["index"]
+
+    # --- 彙整 ---
+    total = atk_out + rest_out
+    net = total - loan
+    true_net = net - other_debt
+    exposure = attack_leverage * atk_out + rest_out
+    with np.errstate(divide="ignore", invalid="ignore"):
+        attack_ratio = np.where(total > 0, atk_out / total * 100, 0.0)
+        real_leverage = np.where(net > 0, exposure / net * 100, np.inf)
+        maintenance = np.where(loan > 0, total / np.where(loan > 0, loan, 1.0) * 100, np.inf)
+    peak = np.maximum.accumulate(np.maximum(net, 0.0))
+    drawdown = np.where(peak > 0, (peak - net) / np.where(peak > 0, peak, 1.0) * 100, 0.0)
+
+    curve = pd.DataFrame({
+        "index_close": prep["close"], "mdd_pct": prep["mdd"], "volatility": prep["vol"],
+        "safe_leverage_limit": safe_limit, "tier_target": run["tier"], "attack_ratio": attack_ratio,
+        "attack_value": atk_out, "rest_value": rest_out, "total_assets": total, "loan": loan, "net_assets": net,
+        "true_net_assets": true_net, "real_leverage": real_leverage, "maintenance_ratio": maintenance,
+        "drawdown_pct": drawdown,
+    }, index=index)
+    ev = np.array(run["events"], dtype=float)
+    events = pd.DataFrame({"from_ratio": ev[:, 1], "to_ratio": ev[:, 2], "trade": ev[:, 3]},
+                          index=index[ev[:, 0].astype(int)])
+
+    years = prep["years"]
+    trades = np.abs(events["trade"].to_numpy()[1:])
+    margin_call = maintenance < MARGIN_CALL_PCT
+    below_safety = maintenance < SAFETY_LINE_PCT
+    summary = {
+        "start": index[0], "end": index[-1], "years": years,
+        "start_net_assets": float(net[0]), "end_net_assets": float(net[-1]),
+        "cagr": float((net[-1] / net[0]) ** (1 / years) - 1) if net[0] > 0 and net[-1] > 0 else -1.0,
+        "max_drawdown_pct": float(drawdown.max()),
+        "n_rebalances": len(trades),
+        "turnover": float(trades.sum()),
+        "annual_turnover": float(trades.sum() / total.mean() / years) if total.mean() > 0 else 0.0,
+        "min_maintenance_ratio": float(maintenance.min()),
+        "margin_call_days": int(margin_call.sum()),
+        "first_margin_call": index[int(np.argmax(margin_call))] if margin_call.any() else None,
+        "below_safety_days": int(below_safety.sum()),
+        "max_real_leverage": float(real_leverage.max()),
+        "limit_breach_days": int((real_leverage > safe_limit + 1e-9).sum()),
+    }
+    return {"curve": curve, "events": events, "summary": summary}
@@ -0,0 +1,263 @@
+# --- 效能基準套件 (可於無 Streamlit、無網路環境直接執行) ---
+# mc: 蒙地卡羅 (年數 x 路徑數、多資產、快取命中)；portfolio: 第 6 區計算圖與壓力測試網格；
+# history: 歷史紀錄在 1k / 100k / 1M 筆時的存檔與讀取；market: 以 FakeProvider 取代 yfinance 的市場數據更新。
+# 每個案例記錄最佳 / 平均耗時，另跑一次 tracemalloc 取峰值記憶體 (平行模式只含主行程)；
+# 結果可輸出成 JSON，並以 --compare 與先前的結果逐案比較。
+#   python bench.py
+#   python bench.py --suite mc history --rows 1000 100000 --out bench.json
+#   python bench.py --compare bench_old.json
+#   python bench.py --suite mc --legacy          # 附上舊版 tab4 寫法作為對照
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from history_store import HistoryStore
+from holdings import COLUMNS as HOLDING_COLUMNS, Holdings
+from market_data import INDEX_SYMBOL, PE_SYMBOL, FakeProvider, MarketStore, fetch_quotes, load_market_data
+from mc_engine import default_workers, run_simulation
+from mc_portfolio import run_portfolio_simulation
+from portfolio_engine import PortfolioEngine, PortfolioInputs, evaluate
+from scenarios import evaluate_grid
+
+SUITES = ("mc", "portfolio", "history", "market")
+
+# 以一組典型的帳戶狀態作為基準輸入
+BENCH_STATE = dict(total_assets=9_500_000.0, total_debt=6_686_066.0,
+                   margin_call_threshold=2_350_000.0 * 1.3, mu=0.14, vol=0.24)
+BENCH_POSITIONS = [
+    ("00675L", 212.8, 10000), ("00631L", 466.7, 331), ("00670L", 157.95, 616),
+    ("00662", 101.35, 29840), ("00713", 54.0, 67000), ("00865B", 47.36, 16000),
+]
+BENCH_INPUTS = dict(loan_amount=2_350_000.0, mortgage_loan=3_000_000.0, personal_loan=1_336_066.0,
+                    current_index=30_000.0, mdd_pct=8.0, pe=23.5, volatility=0.2, base_exposure=23.0)
+
+
+def legacy_simulation(total_assets, total_debt, margin_call_threshold, mu, vol, years, n_paths):
+    """原本 tab4 的寫法：整個 (steps, paths) 矩陣 + 逐步 Python 迴圈。"""
+    np.random.seed(42)
+    steps = years * 12
+    dt = 1 / 12
+    Z = np.random.normal(0, 1, (steps, n_paths))
+    daily_returns = np.exp((mu - 0.5 * vol ** 2) * dt + vol * np.sqrt(dt) * Z)
+    price_paths = np.zeros_like(daily_returns)
+    price_paths[0] = total_assets
+    for t in range(1, steps):
+        price_paths[t] = price_paths[t - 1] * daily_returns[t]
+    true_net_paths = price_paths - total_debt
+    ruin_paths = np.any(price_paths < margin_call_threshold, axis=0)
+    final = true_net_paths[-1, ~ruin_paths]
+    np.percentile(final, [5, 50, 95]) if len(final) else None
+    np.median(true_net_paths, axis=1)
+    return np.mean(ruin_paths) * 100
+
+
+def measure(fn, repeat):
+    """(最佳秒數, 平均秒數, 峰值 MB)；峰值另跑一次 tracemalloc，計時不受追蹤成本影響。"""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return min(times), sum(times) / len(times), peak / 2 ** 20
+
+
+class Runner:
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def case(self, suite, name, fn, repeat=None, **params):
+        best, mean, peak = measure(fn, repeat or self.repeat)
+        self.results.append({"suite": suite, "name": name, "params": params,
+                             "best_s": best, "mean_s": mean, "peak_mb": peak})
+        label = ", ".join(f"{k}={v:,}" if isinstance(v, int) else f"{k}={v}" for k, v in params.items())
+        print(f"  {name:<28} {label:<34} {best * 1000:>11.2f} ms {peak:>10.1f} MB")
+
+
+# --- 蒙地卡羅 ---
+def bench_mc(run, args):
+    for years in args.years:
+        for paths in args.paths:
+            run.case("mc", "gbm_serial", lambda: run_simulation(**BENCH_STATE, years=years, n_paths=paths, use_cache=False),
+                     years=years, paths=paths)
+            if args.workers > 1:
+                # 先暖機一次，避免把行程池建立時間算進去
+                run_simulation(**BENCH_STATE, years=years, n_paths=paths, n_workers=args.workers, use_cache=False)
+                run.case("mc", "gbm_parallel", lambda: run_simulation(**BENCH_STATE, years=years, n_paths=paths,
+                                                                      n_workers=args.workers, use_cache=False),
+                         years=years, paths=paths, workers=args.workers)
+            if args.legacy:
+                run.case("mc", "gbm_legacy", lambda: legacy_simulation(**BENCH_STATE, years=years, n_paths=paths),
+                         years=years, paths=paths)
+        values = Holdings.from_positions(BENCH_POSITIONS).by_code()
+        paths = min(args.paths)
+        run.case("mc", "multi_asset_monthly_rebalance",
+                 lambda: run_portfolio_simulation(values, BENCH_STATE["total_debt"], BENCH_STATE["margin_call_threshold"],
+                                                  years, n_paths=paths, rebalance_every=1, use_cache=False),
+                 years=years, paths=paths)
+    run_simulation(**BENCH_STATE, years=max(args.years), n_paths=min(args.paths))
+    run.case("mc", "cache_hit", lambda: run_simulation(**BENCH_STATE, years=max(args.years), n_paths=min(args.paths)),
+             years=max(args.years), paths=min(args.paths))
+
+
+# --- 第 6 區投資組合運算 ---
+def _book(n_positions, seed=0):
+    if n_positions <= len(BENCH_POSITIONS):
+        return Holdings.from_positions(BENCH_POSITIONS[:n_positions])
+    rng = np.random.default_rng(seed)
+    codes = [BENCH_POSITIONS[i % len(BENCH_POSITIONS)][0] for i in range(n_positions)]
+    return Holdings(codes, rng.uniform(20, 500, n_positions), rng.integers(0, 20000, n_positions),
+                    account=[f"帳戶{i % 5}" for i in range(n_positions)])
+
+
+def bench_portfolio(run, args):
+    for n in (len(BENCH_POSITIONS), 500):
+        inputs = PortfolioInputs(holdings=_book(n), **BENCH_INPUTS)
+        run.case("portfolio", "evaluate_all_nodes", lambda: evaluate(inputs), positions=n)
+        engine = PortfolioEngine().set_inputs(inputs)
+        engine.outputs()
+        run.case("portfolio", "engine_rerun_unchanged", lambda: engine.set_inputs(inputs).outputs(), positions=n)
+        moved = [PortfolioInputs(holdings=inputs.holdings, **dict(BENCH_INPUTS, mdd_pct=m)) for m in (8.0, 12.0)]
+        flip = iter(range(10 ** 9))
+        run.case("portfolio", "engine_rerun_mdd_changed",
+                 lambda: engine.set_inputs(moved[next(flip) % 2]).outputs(), positions=n)
+    inputs = PortfolioInputs(holdings=_book(len(BENCH_POSITIONS)), **BENCH_INPUTS)
+    for res in (200, 1000):
+        idx = inputs.current_index * (1 + np.linspace(-0.4, 0.15, res))
+        run.case("portfolio", "scenario_grid_index_x_pe",
+                 lambda: evaluate_grid(inputs, idx, np.linspace(14, 28, res)), grid=res)
+        run.case("portfolio", "scenario_grid_index_x_loan",
+                 lambda: evaluate_grid(inputs, idx, None, np.linspace(0, 5e6, res)), grid=res)
+
+
+# --- 歷史紀錄 ---
+def _history_frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+    total = 9.5e6 * np.exp(np.cumsum(rng.normal(0, 0.004, n)))
+    mortgage = np.maximum(3e6 - np.arange(n) * 10.0, 0)
+    return pd.DataFrame({
+        "Date": pd.date_range("2015-01-01", periods=n, freq="2h").strftime("%Y-%m-%d %H:%M"),
+        "Total_Assets": total, "Portfolio_Net_Assets": total - 2.35e6, "True_Net_Assets": total - 2.35e6 - mortgage - 1.3e6,
+        "MDD": rng.uniform(0, 30, n), "Current_Index": rng.uniform(20000, 35000, n), "ATH": 35000.0,
+        "PE_Ratio": rng.uniform(15, 28, n), "Mortgage": mortgage, "Personal_Loan": 1.3e6,
+        "Contribution": np.where(rng.random(n) < 0.01, 50000.0, 0.0),
+    })
+
+
+def bench_history(run, args):
+    holdings = Holdings.from_positions(BENCH_POSITIONS)
+    record = _history_frame(1).iloc[0].to_dict()
+    no_holdings = pd.DataFrame(columns=["Record"] + HOLDING_COLUMNS)
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.rows:
+            path = os.path.join(tmp, f"history_{n}.db")
+            df = _history_frame(n)
+            run.case("history", "bulk_import", lambda: HistoryStore(path).replace_all(df, no_holdings), repeat=1, rows=n)
+            store = HistoryStore(path)
+            store.load()
+            # 存檔 (save_record) 與存檔後的第一次讀取 (快取失效，重讀整份歷史)
+            run.case("history", "append", lambda: store.append(record, holdings), rows=n)
+            run.case("history", "append_then_last", lambda: (store.append(record, holdings), store.last()), rows=n)
+            run.case("history", "load_cold", lambda: HistoryStore(path).load(), rows=n)
+            run.case("history", "last_warm", lambda: store.last(), rows=n)
+            run.case("history", "performance_warm", store.performance, rows=n)
+            if n <= 100_000:
+                run.case("history", "export_csv_cold", lambda: HistoryStore(path).export_csv_bytes(), rows=n)
+
+
+# --- 市場數據 (FakeProvider，不需網路) ---
+def _fake_provider(years=20, delay=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(end=date.today(), periods=int(years * 252))
+    close = 8000 * np.exp(np.cumsum(rng.normal(0.0003, 0.011, len(index))))
+    bars = pd.DataFrame({"Open": close, "High": close * 1.004, "Low": close * 0.996, "Close": close,
+                         "Volume": 1e6}, index=index)
+    quotes = {f"{c}.TW": p for c, p, _ in BENCH_POSITIONS}
+    return FakeProvider(bars={INDEX_SYMBOL: bars}, info={PE_SYMBOL: {"trailingPE": 21.3}}, quotes=quotes, delay=delay)
+
+
+def bench_market(run, args):
+    provider = _fake_provider()
+    with tempfile.TemporaryDirectory() as tmp:
+        cold = iter(range(10 ** 9))
+        run.case("market", "load_market_data_cold",
+                 lambda: load_market_data(MarketStore(os.path.join(tmp, f"cold_{next(cold)}.db")), provider))
+        store = MarketStore(os.path.join(tmp, "warm.db"))
+        load_market_data(store, provider)
+        run.case("market", "load_market_data_warm", lambda: load_market_data(store, provider))
+    slow = _fake_provider(delay=0.05)
+    symbols = list(slow.quotes)
+    run.case("market", "fetch_quotes_parallel", lambda: fetch_quotes(slow, symbols), symbols=len(symbols), delay_ms=50)
+
+
+# --- 結果輸出 / 比較 ---
+def _metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"timestamp": datetime.now().isoformat(timespec="seconds"), "commit": commit,
+            "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def _key(r):
+    return r["suite"], r["name"], json.dumps(r["params"], sort_keys=True)
+
+
+def compare(results, old_path):
+    with open(old_path, encoding="utf-8") as f:
+        old = {_key(r): r for r in json.load(f)["results"]}
+    print(f"\n與 {old_path} 比較 (新 / 舊，>1 表示變慢或變大)")
+    for r in results:
+        o = old.get(_key(r))
+        if o is None:
+            continue
+        print(f"  {r['suite']:<10} {r['name']:<28} {r['params']!s:<40} "
+              f"時間 x{r['best_s'] / o['best_s']:.2f}  記憶體 x{r['peak_mb'] / max(o['peak_mb'], 1e-9):.2f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="效能基準套件 (蒙地卡羅 / 投資組合運算 / 歷史紀錄 / 市場數據)")
+    ap.add_argument("--suite", nargs="+", choices=SUITES, default=list(SUITES))
+    ap.add_argument("--paths", type=int, nargs="+", default=[10_000, 100_000])
+    ap.add_argument("--years", type=int, nargs="+", default=[5, 20])
+    ap.add_argument("--rows", type=int, nargs="+", default=[1_000, 100_000, 1_000_000], help="歷史紀錄筆數")
+    ap.add_argument("--workers", type=int, default=default_workers())
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--legacy", action="store_true", help="加跑舊版 tab4 蒙地卡羅寫法")
+    ap.add_argument("--out", help="結果 JSON 輸出路徑")
+    ap.add_argument("--compare", help="與先前的 JSON 結果比較")
+    args = ap.parse_args()
+
+    run = Runner(args.repeat)
+    meta = _metadata()
+    print(f"commit={meta['commit']}  python={meta['python']}  numpy={meta['numpy']}  cpus={meta['cpus']}")
+    for suite in args.suite:
+        print(f"[{suite}]")
+        globals()[f"bench_{suite}"](run, args)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "args": vars(args), "results": run.results}, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        compare(run.results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# --- 效能診斷 (每次重跑的計時區段、快取命中計數、匯入時間) ---
+# Profiler 記錄每次重跑 (rerun) 內的具名區段 (可巢狀) 與計數器，保留最近幾次重跑供診斷面板彙整，
+# 並可匯出為結構化日誌 (JSON Lines，每個區段 / 計數器一行)。無 UI 相依，命令列與基準測試也可使用。
+# lazy_import() 把只在部分操作才用到的模組延後到第一次使用才載入，並記下實際載入耗時；
+# import_breakdown() 在子行程以 python -X importtime 量測冷啟動時各模組的匯入時間。
+# 設定環境變數 ADEIS_PROFILE_LOG=1 時，每次重跑結束也會把結構化紀錄寫到 adeis.profile 日誌 (標準錯誤輸出)。
+import functools
+import importlib
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import types
+from collections import Counter, deque
+from contextlib import contextmanager
+
+RUNS_KEPT = 50                  # 保留最近幾次重跑的紀錄
+IMPORT_TIMES = {}               # 模組名 -> 本行程實際載入耗時 (毫秒)
+logger = logging.getLogger("adeis.profile")
+if os.environ.get("ADEIS_PROFILE_LOG") and not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.DEBUG)
+_local = threading.local()
+
+
+class Profiler:
+    def __init__(self, keep=RUNS_KEPT):
+        self.runs = deque(maxlen=keep)
+        self.totals = Counter()     # 跨重跑累計的計數器
+        self._run = None
+        self._stack = []
+        self._n = 0
+
+    def start_run(self, label="rerun"):
+        """開始新的一次重跑；上一次若尚未結束會先收尾。"""
+        if self._run is not None:
+            self.finish_run()
+        self._n += 1
+        self._run = {"run": self._n, "label": label, "at": time.time(), "t0": time.perf_counter(),
+                     "spans": [], "counters": Counter()}
+        self._stack = []
+        return self
+
+    def _current(self):
+        # 片段 (st.fragment) 單獨重跑時不經過整頁的 start_run()，自成一次紀錄 (下次開始時收尾)
+        if self._run is None:
+            self.start_run("fragment")
+        return self._run
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """計時區段；巢狀使用時記錄上層區段名稱。例外照常往外拋，區段仍會記錄 (error 欄)。"""
+        run = self._current()
+        parent = self._stack[-1] if self._stack else None
+        self._stack.append(name)
+        t0 = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self._stack.pop()
+            run["spans"].append({"name": name, "parent": parent, "depth": len(self._stack),
+                                 "start_ms": (t0 - run["t0"]) * 1000, "ms": (time.perf_counter() - t0) * 1000,
+                                 **({"error": error} if error else {}), **attrs})
+
+    def timed(self, name):
+        """裝飾器版本的 span()。"""
+        def wrap(fn):
+            @functools.wraps(fn)
+            def inner(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return inner
+        return wrap
+
+    def count(self, name, n=1):
+        if n:
+            self._current()["counters"][name] += n
+            self.totals[name] += n
+
+    def cached(self, name, fn, *args, **kwargs):
+        """呼叫快取函式並計入 name.hit / name.miss；快取函式本體需呼叫 mark_miss(name)。"""
+        missed = getattr(_local, "missed", None)
+        if missed is None:
+            missed = _local.missed = set()
+        missed.discard(name)
+        with self.span(name):
+            value = fn(*args, **kwargs)
+        self.count(f"{name}.{'miss' if name in missed else 'hit'}")
+        missed.discard(name)
+        return value
+
+    def finish_run(self):
+        run, self._run = self._run, None
+        if run is None:
+            return None
+        run["total_ms"] = (time.perf_counter() - run.pop("t0")) * 1000
+        self.runs.append(run)
+        if logger.isEnabledFor(logging.DEBUG):
+            for rec in _run_records(run):
+                logger.debug(json.dumps(rec, ensure_ascii=False, default=float))
+        return run
+
+    def last_run(self):
+        return self._run if self._run is not None and self._run["spans"] else (self.runs[-1] if self.runs else None)
+
+    # --- 彙整與匯出 ---
+    def span_summary(self):
+        """各區段跨重跑的次數、平均 / 最大 / 最近一次耗時 (毫秒)，依總耗時排序。"""
+        agg = {}
+        for run in self.runs:
+            for s in run["spans"]:
+                a = agg.setdefault(s["name"], {"name": s["name"], "calls": 0, "total_ms": 0.0, "max_ms": 0.0})
+                a["calls"] += 1
+                a["total_ms"] += s["ms"]
+                a["max_ms"] = max(a["max_ms"], s["ms"])
+                a["last_ms"] = s["ms"]
+        for a in agg.values():
+            a["mean_ms"] = a["total_ms"] / a["calls"]
+        return sorted(agg.values(), key=lambda a: -a["total_ms"])
+
+    def cache_summary(self):
+        """{快取名: {"hit": 次數, "miss": 次數, "hit_rate": 命中率}} (依 name.hit / name.miss 計數器)。"""
+        out = {}
+        for key, n in self.totals.items():
+            name, _, kind = key.rpartition(".")
+            if kind in ("hit", "miss"):
+                out.setdefault(name, {"hit": 0, "miss": 0})[kind] = n
+        for v in out.values():
+            v["hit_rate"] = v["hit"] / (v["hit"] + v["miss"]) if v["hit"] + v["miss"] else None
+        return out
+
+    def records(self):
+        """所有保留的重跑展開成結構化紀錄 (每個區段、計數器與重跑總計各一筆)。"""
+        out = []
+        for run in self.runs:
+            out += _run_records(run)
+        for name, ms in IMPORT_TIMES.items():
+            out.append({"type": "import", "module": name, "ms": ms})
+        return out
+
+    def to_jsonl(self):
+        return "\n".join(json.dumps(r, ensure_ascii=False, default=float) for r in self.records()) + "\n"
+
+
+def _run_records(run):
+    base = {"run": run["run"], "label": run["label"], "at": run["at"]}
+    out = [{"type": "run", **base, "ms": run.get("total_ms")}]
+    out += [{"type": "span", **base, **s} for s in run["spans"]]
+    out += [{"type": "counter", **base, "name": k, "value": v} for k, v in run["counters"].items()]
+    return out
+
+
+def mark_miss(name):
+    """在快取函式本體內呼叫：本次 Profiler.cached(name, ...) 為未命中 (同一執行緒)。"""
+    missed = getattr(_local, "missed", None)
+    if missed is None:
+        missed = _local.missed = set()
+    missed.add(name)
+
+
+# --- 匯入時間 ---
+class _LazyModule(types.ModuleType):
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            already = self.__name__ in sys.modules
+            t0 = time.perf_counter()
+            module = importlib.import_module(self.__name__)
+            if not already:
+                IMPORT_TIMES[self.__name__] = (time.perf_counter() - t0) * 1000
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+def lazy_import(name):
+    """回傳代理模組，第一次存取屬性時才真正 import (耗時記入 IMPORT_TIMES)。"""
+    return _LazyModule(name)
+
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_breakdown(modules, top=25, python=None):
+    """
+    在乾淨的子行程依序匯入 modules (未安裝的略過)，解析 -X importtime 輸出。
+    後匯入的模組不含前面已載入的共同相依，累計耗時即為它額外增加的啟動時間。
+    回傳依累計耗時排序的 [{"module", "self_ms", "cumulative_ms", "depth"}] (前 top 名)。
+    """
+    code = "\n".join(f"try:\n    import {m}\nexcept ImportError:\n    pass" for m in modules)
+    proc = subprocess.run([python or sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True, timeout=120)
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_LINE.match(line)
+        if m:
+            rows.append({"module": m.group(4), "self_ms": int(m.group(1)) / 1000,
+                         "cumulative_ms": int(m.group(2)) / 1000, "depth": (len(m.group(3)) - 1) // 2})
+    if proc.returncode != 0 and not rows:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import 失敗")
+    return sorted(rows, key=lambda r: -r["cumulative_ms"])[:top]
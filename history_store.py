@@ -0,0 +1,293 @@
+# --- 歷史紀錄儲存 (SQLite WAL) ---
+# 取代「整個 CSV 讀入 -> 接一列 -> 整檔覆寫」：每次存檔為單筆 INSERT (O(1))，
+# 交易保證原子性，WAL 模式允許多個 session 同時讀寫。
+# 新欄位 (例如 Mortgage、Personal_Loan) 出現時自動 ALTER TABLE 加欄，舊紀錄為空值。
+# 持股以長格式另存於 holdings 表 (每筆紀錄 x 每個部位一列)；舊版 P_00675 / S_00675 欄位在開啟時自動轉換。
+# 雲端保險箱的 CSV 備份同樣為長格式 (紀錄欄位重複於每個部位列，以 Record 欄分組)，舊版寬格式仍可匯入。
+# 帳戶績效 (TWR / MWR / 已實現波動率 / 最大回撤) 的累計狀態存於 stats 表、外部資金流存於 stat_flows 表，
+# 每次存檔在同一個交易內 O(1) 更新 (狀態大小不隨紀錄筆數成長)。
+# 讀取端快取整份 DataFrame、最後一筆與匯出位元組，以「寫入世代 + 資料庫/WAL 檔的 mtime 與大小」
+# 判斷是否失效；一次重繪內多次讀取 (以及沒有寫入的重繪) 都不會再碰資料庫。
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+from contextlib import closing
+
+import pandas as pd
+
+from holdings import COLUMNS as HOLDING_COLUMNS, Holdings
+from performance import PerformanceStats, feed_records
+
+TABLE = "history"
+HOLDINGS_TABLE = "holdings"
+STATS_TABLE = "stats"
+FLOWS_TABLE = "stat_flows"
+WIDE_COLUMN = re.compile(r"[PS]_\w+")
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def split_wide(df):
+    """舊版寬格式 (P_ / S_ 欄位) -> (不含持股欄位的紀錄, 長格式持股含 Record 欄)。"""
+    wide = [c for c in df.columns if WIDE_COLUMN.fullmatch(str(c))]
+    frames = []
+    for pos, (_, row) in enumerate(df[wide].iterrows()):
+        h = Holdings.from_wide_record(row.to_dict()).to_frame()
+        frames.append(h.assign(Record=pos))
+    held = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["Record"] + HOLDING_COLUMNS)
+    return df.drop(columns=wide).reset_index(drop=True), held[["Record"] + HOLDING_COLUMNS]
+
+
+def _to_sql_value(v):
+    if v is None or (isinstance(v, float) and v != v):
+        return None
+    if hasattr(v, "item"):      # NumPy 純量
+        return v.item()
+    return v
+
+
+class HistoryStore:
+    def __init__(self, path, legacy_csv=None):
+        """path: SQLite 檔；legacy_csv: 舊版 asset_history.csv，資料庫為空時自動匯入一次。"""
+        self.path = path
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._cache = None
+        self.hits = 0
+        self.misses = 0
+        with closing(self._connect()) as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute(f"CREATE TABLE IF NOT EXISTS {TABLE} (_id INTEGER PRIMARY KEY AUTOINCREMENT)")
+            con.execute(f"""CREATE TABLE IF NOT EXISTS {HOLDINGS_TABLE} (record_id INTEGER,
+                Code TEXT, Account TEXT, Sleeve TEXT, Price REAL, Shares REAL, Beta REAL, Leverage REAL,
+                Factor TEXT, Quote TEXT)""")
+            con.execute(f"CREATE INDEX IF NOT EXISTS {HOLDINGS_TABLE}_record ON {HOLDINGS_TABLE} (record_id)")
+            con.execute(f"CREATE TABLE IF NOT EXISTS {STATS_TABLE} (name TEXT PRIMARY KEY, state TEXT)")
+            con.execute(f"CREATE TABLE IF NOT EXISTS {FLOWS_TABLE} (t REAL, amount REAL)")
+            has_wide = any(WIDE_COLUMN.fullmatch(c) for c in self._columns(con))
+        if has_wide:
+            self._migrate_wide()
+        if legacy_csv and os.path.exists(legacy_csv) and self.count() == 0:
+            try:
+                self.import_csv(legacy_csv)
+            except Exception:
+                pass
+
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        con.execute("PRAGMA synchronous=NORMAL")
+        return con
+
+    def _columns(self, con):
+        return [row[1] for row in con.execute(f"PRAGMA table_info({TABLE})") if row[1] != "_id"]
+
+    def _ensure_columns(self, con, names):
+        existing = set(self._columns(con))
+        for name in names:
+            if name not in existing:
+                con.execute(f"ALTER TABLE {TABLE} ADD COLUMN {_quote(name)}")
+
+    def _insert(self, con, rows, columns, table=TABLE):
+        cols = ", ".join(_quote(c) for c in columns)
+        marks = ", ".join("?" for _ in columns)
+        con.executemany(f"INSERT INTO {table} ({cols}) VALUES ({marks})",
+                        ([_to_sql_value(r.get(c)) for c in columns] for r in rows))
+
+    def _insert_holdings(self, con, record_id, holdings):
+        rows = holdings.to_frame() if isinstance(holdings, Holdings) else holdings
+        rows = rows.reindex(columns=HOLDING_COLUMNS).assign(record_id=record_id).to_dict("records")
+        self._insert(con, rows, ["record_id"] + HOLDING_COLUMNS, HOLDINGS_TABLE)
+
+    def _load_stats(self, con, with_flows=False):
+        """
+        (已處理到的紀錄序號, PerformanceStats)；尚未建立時為 (0, 空的統計)。
+        with_flows=False 時 stats.flows 為空，之後 extend() 產生的資金流即為待追加的新資金流。
+        """
+        row = con.execute(f"SELECT state FROM {STATS_TABLE} WHERE name = 'performance'").fetchone()
+        if row is None:
+            return 0, PerformanceStats()
+        state = json.loads(row[0])
+        if "flows" in state["stats"]:       # 舊格式 (資金流存在 JSON 內)：視為落後，交給讀取端重建
+            return 0, PerformanceStats()
+        stats = PerformanceStats.from_dict(state["stats"])
+        if with_flows:
+            stats.flows = con.execute(f"SELECT t, amount FROM {FLOWS_TABLE} ORDER BY rowid").fetchall()
+        return state["last_id"], stats
+
+    def _save_stats(self, con, last_id, stats, replace=False):
+        """寫回累計狀態並追加 stats.flows (replace=True 時先清空資金流表)。"""
+        state = stats.to_dict()
+        flows = state.pop("flows")
+        if replace:
+            con.execute(f"DELETE FROM {FLOWS_TABLE}")
+        con.executemany(f"INSERT INTO {FLOWS_TABLE} VALUES (?, ?)", flows)
+        con.execute(f"INSERT OR REPLACE INTO {STATS_TABLE} VALUES ('performance', ?)",
+                    (json.dumps({"last_id": last_id, "stats": state}),))
+
+    def append(self, record, holdings=None):
+        """
+        新增一筆紀錄 (dict) 與其持股 (Holdings 或 HOLDING_COLUMNS 欄位的 DataFrame)。
+        加欄與寫入在同一個交易內完成；record 內若仍帶舊版 P_ / S_ 欄位，會轉成長格式持股。
+        """
+        if any(WIDE_COLUMN.fullmatch(str(k)) for k in record):
+            if holdings is None:
+                holdings = Holdings.from_wide_record(record)
+            record = {k: v for k, v in record.items() if not WIDE_COLUMN.fullmatch(str(k))}
+        con = self._connect()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            self._ensure_columns(con, record.keys())
+            self._insert(con, [record], list(record.keys()))
+            record_id = con.execute("SELECT last_insert_rowid()").fetchone()[0]
+            if holdings is not None:
+                self._insert_holdings(con, record_id, holdings)
+            # 績效統計只接續上一筆：狀態落後 (例如舊版資料庫) 時留給讀取端整批重建
+            last_id, stats = self._load_stats(con)
+            if last_id == record_id - 1:
+                self._save_stats(con, record_id, feed_records(stats, pd.DataFrame([record])))
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        finally:
+            con.close()
+            self._generation += 1
+
+    def replace_all(self, df, holdings=None):
+        """
+        以 DataFrame 整批取代全部紀錄 (原子操作，失敗時保留原資料)。
+        holdings: 長格式持股，Record 欄為 df 的列位置 (0 起算)。df 若為舊版寬格式會自動拆分。
+        """
+        if holdings is None:
+            df, holdings = split_wide(df)
+        columns = [str(c) for c in df.columns]
+        rows = df.rename(columns=str).to_dict("records")
+        con = self._connect()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            # 重建紀錄表，順便移除不再使用的欄位
+            con.execute(f"DROP TABLE {TABLE}")
+            con.execute(f"CREATE TABLE {TABLE} (_id INTEGER PRIMARY KEY AUTOINCREMENT)")
+            con.execute(f"DELETE FROM {HOLDINGS_TABLE}")
+            self._ensure_columns(con, columns)
+            for i, row in enumerate(rows):
+                row["_id"] = i + 1          # 新表：紀錄序號 = 列位置 + 1
+            self._insert(con, rows, ["_id"] + columns)
+            held = holdings[(holdings["Record"] >= 0) & (holdings["Record"] < len(rows))]
+            held = held.reindex(columns=HOLDING_COLUMNS).assign(record_id=held["Record"].astype(int) + 1)
+            self._insert(con, held.to_dict("records"), ["record_id"] + HOLDING_COLUMNS, HOLDINGS_TABLE)
+            self._save_stats(con, len(rows), feed_records(PerformanceStats(), df), replace=True)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        finally:
+            con.close()
+            self._generation += 1
+
+    def _migrate_wide(self):
+        """舊版資料庫：把 P_ / S_ 欄位轉成長格式持股並移除這些欄位。"""
+        df = self._read_all()["df"]
+        self.replace_all(df)
+
+    def _signature(self):
+        sig = [self._generation]
+        for p in (self.path, self.path + "-wal"):
+            try:
+                st = os.stat(p)
+                sig += [st.st_mtime_ns, st.st_size]
+            except FileNotFoundError:
+                sig += [0, 0]
+        return tuple(sig)
+
+    def _read_all(self):
+        with closing(self._connect()) as con:
+            columns = self._columns(con)
+            rows = con.execute(f"SELECT {', '.join(['_id'] + [_quote(c) for c in columns])} FROM {TABLE} ORDER BY _id").fetchall()
+            held = con.execute(f"SELECT record_id, {', '.join(HOLDING_COLUMNS)} FROM {HOLDINGS_TABLE} "
+                               f"ORDER BY record_id, rowid").fetchall()
+            stats_id, stats = self._load_stats(con, with_flows=True)
+        df = pd.DataFrame(rows, columns=["_id"] + columns)
+        position = pd.Series(range(len(df)), index=df["_id"].to_numpy())
+        held = pd.DataFrame(held, columns=["record_id"] + HOLDING_COLUMNS)
+        held.insert(0, "Record", held.pop("record_id").map(position))
+        held = held.dropna(subset=["Record"]).astype({"Record": int}).reset_index(drop=True)
+        if stats_id != (df["_id"].iloc[-1] if len(df) else 0):
+            stats = feed_records(PerformanceStats(), df)
+        return {"df": df.drop(columns=["_id"]), "holdings": held, "performance": stats}
+
+    def _snapshot(self):
+        """目前的快取內容；簽章改變 (本行程或其他行程寫入) 時才重新讀取資料庫。"""
+        sig = self._signature()
+        with self._lock:
+            if self._cache is None or self._cache["sig"] != sig:
+                self._cache = {"sig": sig, **self._read_all()}
+                self.misses += 1
+            else:
+                self.hits += 1
+            return self._cache
+
+    def count(self):
+        return len(self._snapshot()["df"])
+
+    def load(self):
+        """全部紀錄，依寫入順序排列；欄位順序與 CSV 相同 (先出現的欄位在前)。回傳副本，可自由修改。"""
+        return self._snapshot()["df"].copy()
+
+    def last(self):
+        """最後一筆紀錄 (pd.Series，略去空欄位)；無紀錄時回傳 None。"""
+        snap = self._snapshot()
+        if "last" not in snap:
+            df = snap["df"]
+            snap["last"] = df.iloc[-1].dropna() if not df.empty else None
+        return snap["last"].copy() if snap["last"] is not None else None
+
+    def holdings(self):
+        """全部持股 (長格式)，Record 欄對應 load() 的列位置。回傳副本。"""
+        return self._snapshot()["holdings"].copy()
+
+    def last_holdings(self):
+        """最後一筆紀錄的持股 (Holdings)；無紀錄或該筆未存持股時回傳 None。"""
+        snap = self._snapshot()
+        if "last_holdings" not in snap:
+            held = snap["holdings"]
+            rows = held[held["Record"] == len(snap["df"]) - 1]
+            snap["last_holdings"] = Holdings.from_frame(rows) if len(rows) else None
+        return snap["last_holdings"].copy() if snap["last_holdings"] is not None else None
+
+    def performance(self):
+        """帳戶績效摘要 (PerformanceStats.summary() 的 dict)；與紀錄同一份快取，IRR 每次寫入只解一次。"""
+        snap = self._snapshot()
+        if "summary" not in snap:
+            snap["summary"] = snap["performance"].summary()
+        return dict(snap["summary"])
+
+    def import_csv(self, file):
+        """匯入雲端保險箱的 CSV 備份 (路徑或上傳檔案物件)，取代現有紀錄；長格式與舊版寬格式皆可。"""
+        df = pd.read_csv(file)
+        if "Code" not in df.columns:
+            self.replace_all(df)
+            return
+        if "Record" not in df.columns:
+            df["Record"] = 0
+        records = df.drop(columns=HOLDING_COLUMNS, errors="ignore").groupby("Record", sort=True).first()
+        position = pd.Series(range(len(records)), index=records.index)
+        held = df[df["Code"].notna()].reindex(columns=["Record"] + HOLDING_COLUMNS)
+        held["Record"] = held["Record"].map(position)
+        self.replace_all(records.reset_index(drop=True), held)
+
+    def export_csv_bytes(self):
+        """長格式備份：每個部位一列，紀錄欄位重複，Record 欄為紀錄序號。"""
+        snap = self._snapshot()
+        if "csv" not in snap:
+            records = snap["df"].reset_index(drop=True).rename_axis("Record").reset_index()
+            long = records.merge(snap["holdings"], on="Record", how="left")
+            buf = io.StringIO()
+            long.to_csv(buf, index=False)
+            snap["csv"] = buf.getvalue().encode("utf-8")
+        return snap["csv"]
@@ -0,0 +1,155 @@
+# --- 持股資料模型 (陣列化) ---
+# 每個部位一列：代號、帳戶、資產類別 (sleeve)、價格、股數、Beta、槓桿倍數、追蹤因子、報價代號。
+# 數值欄位存成 NumPy 陣列，總市值 / 實質曝險 / Beta 加權皆為一次內積，部位數量增加到上百檔也不需改程式。
+# 歷史紀錄以長格式 (每個部位一列) 保存；舊版 P_00675 / S_00675 欄位可由 from_wide_record() 轉換。
+import re
+
+import numpy as np
+import pandas as pd
+
+SLEEVES = ("attack", "core", "defense", "ammo")
+SLEEVE_LABELS = {"attack": "攻擊型", "core": "核心", "defense": "防禦", "ammo": "子彈庫"}
+COLUMNS = ["Code", "Account", "Sleeve", "Price", "Shares", "Beta", "Leverage", "Factor", "Quote"]
+DEFAULT_ACCOUNT = "主帳戶"
+
+# 底層因子：(年化報酬, 年化波動)；持股的 Factor 欄從中選擇，mc_portfolio 據此推演
+FACTORS = {
+    "TWII": (0.12, 0.18),   # 台灣加權指數
+    "NDX": (0.13, 0.22),    # 那斯達克 100
+    "TWHD": (0.08, 0.12),   # 台股高股息
+    "USTB": (0.04, 0.03),   # 美國短天期公債
+}
+
+# 已知標的的預設屬性 (新增持股時自動帶入；未列出的代號以 UNKNOWN 為準，可自行修改)
+CATALOG = {
+    "00675L": {"factor": "TWII", "leverage": 2.0, "sleeve": "attack", "beta": 1.6, "quote": "00675L.TW"},
+    "00631L": {"factor": "TWII", "leverage": 2.0, "sleeve": "attack", "beta": 1.6, "quote": "00631L.TW"},
+    "00670L": {"factor": "NDX", "leverage": 2.0, "sleeve": "attack", "beta": 2.0, "quote": "00670L.TW"},
+    "00662": {"factor": "NDX", "leverage": 1.0, "sleeve": "core", "beta": 1.0, "quote": "00662.TW"},
+    "00713": {"factor": "TWHD", "leverage": 1.0, "sleeve": "defense", "beta": 0.6, "quote": "00713.TW"},
+    "00865B": {"factor": "USTB", "leverage": 1.0, "sleeve": "ammo", "beta": 0.0, "quote": "00865B.TWO"},
+}
+UNKNOWN = {"factor": "TWII", "leverage": 1.0, "sleeve": "core", "beta": 1.0}
+
+
+def _meta(code):
+    meta = dict(UNKNOWN, quote=f"{code}.TW")
+    meta.update(CATALOG.get(code, {}))
+    return meta
+
+
+class Holdings:
+    def __init__(self, code, price, shares, account=None, sleeve=None, beta=None, leverage=None, factor=None,
+                 quote=None):
+        """code 與數值欄位為等長序列；屬性欄位省略 (或個別為空值) 時依 CATALOG 帶入。"""
+        self.code = np.array([str(c) for c in code], dtype=object)
+        n = len(self.code)
+        meta = [_meta(c) for c in self.code]
+
+        def column(given, key, cast):
+            given = [None] * n if given is None else list(given)
+            return [cast(m[key]) if g is None or (isinstance(g, float) and g != g) or g == "" else cast(g)
+                    for g, m in zip(given, meta)]
+
+        self.account = np.array([DEFAULT_ACCOUNT if a is None or a != a or a == "" else str(a)
+                                 for a in (account if account is not None else [None] * n)], dtype=object)
+        self.sleeve = np.array(column(sleeve, "sleeve", str), dtype=object)
+        unknown = set(self.sleeve) - set(SLEEVES)
+        if unknown:
+            raise ValueError(f"未知的資產類別: {', '.join(sorted(unknown))}")
+        self.sleeve_idx = np.array([SLEEVES.index(s) for s in self.sleeve], dtype=np.intp)
+        self.price = np.nan_to_num(np.asarray(price, dtype=float).reshape(n))
+        self.shares = np.nan_to_num(np.asarray(shares, dtype=float).reshape(n))
+        self.beta = np.array(column(beta, "beta", float), dtype=float)
+        self.leverage = np.array(column(leverage, "leverage", float), dtype=float)
+        self.factor = np.array(column(factor, "factor", str), dtype=object)
+        self.quote = np.array(column(quote, "quote", str), dtype=object)
+
+    # --- 建構 / 轉換 ---
+    @classmethod
+    def from_positions(cls, positions):
+        """[(代號, 價格, 股數[, 帳戶]), ...]"""
+        rows = [tuple(p) + (None,) * (4 - len(p)) for p in positions]
+        return cls([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows], account=[r[3] for r in rows])
+
+    @classmethod
+    def from_frame(cls, df):
+        """由 COLUMNS 欄位的 DataFrame (介面表格或長格式歷史) 建立；代號空白的列略過。"""
+        df = df[df["Code"].notna() & (df["Code"].astype(str).str.strip() != "")]
+        get = lambda c: df[c].tolist() if c in df.columns else None
+        return cls(df["Code"].astype(str).str.strip().tolist(), pd.to_numeric(df["Price"], errors="coerce").to_numpy(),
+                   pd.to_numeric(df["Shares"], errors="coerce").to_numpy(), account=get("Account"),
+                   sleeve=get("Sleeve"), beta=get("Beta"), leverage=get("Leverage"), factor=get("Factor"),
+                   quote=get("Quote"))
+
+    @classmethod
+    def from_wide_record(cls, record):
+        """舊版單列紀錄 (P_00675 / S_00675 ...) -> Holdings；代號以 CATALOG 中數字部分相同者為準。"""
+        known = {re.sub(r"[A-Z]+$", "", c): c for c in CATALOG}
+        positions = []
+        for key, price in record.items():
+            m = re.fullmatch(r"P_(\w+)", str(key))
+            if m and price is not None and price == price:
+                shares = record.get(f"S_{m.group(1)}", 0)
+                positions.append((known.get(m.group(1), m.group(1)), float(price),
+                                  float(shares) if shares == shares and shares is not None else 0.0))
+        return cls.from_positions(positions)
+
+    def to_frame(self):
+        return pd.DataFrame({"Code": self.code, "Account": self.account, "Sleeve": self.sleeve, "Price": self.price,
+                             "Shares": self.shares, "Beta": self.beta, "Leverage": self.leverage,
+                             "Factor": self.factor, "Quote": self.quote}, columns=COLUMNS)
+
+    def with_prices(self, prices, by="quote"):
+        """以 {報價代號 (或 by="code" 時的代號): 價格} 更新價格，回傳新物件。"""
+        keys = self.quote if by == "quote" else self.code
+        h = self.copy()
+        h.price = np.array([prices.get(k, p) for k, p in zip(keys, self.price)], dtype=float)
+        return h
+
+    def copy(self):
+        h = object.__new__(Holdings)
+        h.__dict__.update({k: v.copy() for k, v in self.__dict__.items()})
+        return h
+
+    # --- 彙總 (內積) ---
+    def __len__(self):
+        return len(self.code)
+
+    @property
+    def values(self):
+        return self.price * self.shares
+
+    def total(self):
+        return float(self.price @ self.shares)
+
+    def exposure(self):
+        """實質曝險 = sum(市值 x 槓桿倍數)。"""
+        return float((self.leverage * self.price) @ self.shares)
+
+    def beta_sum(self):
+        return float((self.beta * self.price) @ self.shares)
+
+    def sleeve_totals(self):
+        totals = np.bincount(self.sleeve_idx, weights=self.values, minlength=len(SLEEVES))
+        return dict(zip(SLEEVES, totals.tolist()))
+
+    def by_code(self):
+        """同代號跨帳戶合併後的市值 {代號: 市值}。"""
+        codes, inv = np.unique(self.code.astype(str), return_inverse=True)
+        return dict(zip(codes.tolist(), np.bincount(inv, weights=self.values, minlength=len(codes)).tolist()))
+
+    def catalog(self):
+        """{代號: 屬性}，供多資產推演使用 (同代號取第一列的屬性)。"""
+        out = {}
+        for i, c in enumerate(self.code):
+            out.setdefault(c, {"factor": self.factor[i], "leverage": float(self.leverage[i]),
+                               "sleeve": self.sleeve[i], "beta": float(self.beta[i])})
+        return out
+
+    def __eq__(self, other):
+        if not isinstance(other, Holdings) or len(self) != len(other):
+            return False
+        return all(np.array_equal(getattr(self, k), getattr(other, k)) for k in self.__dict__)
+
+    __hash__ = None
@@ -0,0 +1,217 @@
+# --- 市場數據本地儲存 (SQLite) 與增量更新 ---
+# 日線 OHLC 永久存在本地；每次更新只向資料來源要「最後一根之後」的新 K 棒，
+# ATH、波動率與回撤由 RollingStats 增量維護 (只餵新 K 棒)，斷網時直接使用既有資料。
+# 資料來源可替換 (YFinanceProvider / FakeProvider)，測試與離線環境不需網路。
+# 持股即時報價以執行緒池並行抓取；逾時設在每一筆請求上 (由資料來源中止連線)，卡住的請求不會一直佔住執行緒。
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import closing
+from datetime import date, timedelta
+
+import pandas as pd
+
+from rolling_stats import RollingStats
+
+INDEX_SYMBOL = "^TWII"
+PE_SYMBOL = "0050.TW"
+INITIAL_PERIOD_DAYS = 5 * 365   # 本地無資料時的首次下載長度
+VOL_WINDOW = 60
+DEFAULT_MARKET_DATA = {"ath": 32996.0, "pe_0050": None, "current_vol": 0.20, "ewma_vol": 0.20,
+                       "drawdown_pct": None, "last_close": None}
+BAR_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+QUOTE_TIMEOUT = 5.0             # 單筆即時報價請求的逾時 (秒)
+QUOTE_GRACE = 0.5               # 整批等待 = 單筆逾時 + 緩衝 (讓逾時的請求先自行結束)
+
+
+class YFinanceProvider:
+    """以 yfinance 抓取資料 (延遲匯入，離線或測試時不需要安裝)。"""
+
+    def history(self, symbol, start):
+        import yfinance as yf
+        return yf.Ticker(symbol).history(start=start.isoformat())
+
+    def info(self, symbol):
+        import yfinance as yf
+        return yf.Ticker(symbol).info
+
+    def quote(self, symbol, timeout=QUOTE_TIMEOUT):
+        # fast_info 不接受逾時參數；改用 history()，逾時直接傳給底層的 HTTP 請求
+        import yfinance as yf
+        return float(yf.Ticker(symbol).history(period="5d", timeout=timeout)["Close"].iloc[-1])
+
+
+class FakeProvider:
+    """
+    測試用資料來源：bars 為 {代號: 以日期為索引的 OHLC DataFrame}，quotes 為 {代號: 價格}；
+    offline=True 模擬斷網，delay 模擬每次請求的網路延遲 (秒)；
+    延遲超過 quote() 的 timeout 時與真實來源相同，等到逾時即放棄並拋出 TimeoutError。
+    """
+
+    def __init__(self, bars=None, info=None, quotes=None, offline=False, delay=0.0):
+        self.bars = bars or {}
+        self.infos = info or {}
+        self.quotes = quotes or {}
+        self.offline = offline
+        self.delay = delay
+        self.calls = []
+
+    def history(self, symbol, start):
+        self.calls.append((symbol, start))
+        if self.offline:
+            raise ConnectionError("offline")
+        df = self.bars.get(symbol, pd.DataFrame(columns=BAR_COLUMNS))
+        return df[pd.to_datetime(df.index).date >= start]
+
+    def info(self, symbol):
+        if self.offline:
+            raise ConnectionError("offline")
+        return self.infos.get(symbol, {})
+
+    def quote(self, symbol, timeout=None):
+        if timeout is not None and self.delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(symbol)
+        time.sleep(self.delay)
+        if self.offline:
+            raise ConnectionError("offline")
+        return float(self.quotes[symbol])
+
+
+class MarketStore:
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("""CREATE TABLE IF NOT EXISTS bars (
+                symbol TEXT, date TEXT, open REAL, high REAL, low REAL, close REAL, volume REAL,
+                PRIMARY KEY (symbol, date))""")
+            con.execute("CREATE TABLE IF NOT EXISTS meta (symbol TEXT, key TEXT, value REAL, updated REAL, PRIMARY KEY (symbol, key))")
+            con.execute("CREATE TABLE IF NOT EXISTS stats (symbol TEXT PRIMARY KEY, state TEXT)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def last_date(self, symbol):
+        with closing(self._connect()) as con:
+            row = con.execute("SELECT MAX(date) FROM bars WHERE symbol = ?", (symbol,)).fetchone()
+        return date.fromisoformat(row[0]) if row and row[0] else None
+
+    def upsert_bars(self, symbol, df):
+        """寫入 (或覆寫同日) K 棒；df 以日期為索引，欄位同 yfinance。"""
+        if df is None or df.empty:
+            return 0
+        days = pd.to_datetime(df.index)
+        if days.tz is not None:
+            days = days.tz_localize(None)
+        rows = [(symbol, d.date().isoformat(), *(float(v) if pd.notna(v) else None for v in vals))
+                for d, vals in zip(days, df.reindex(columns=BAR_COLUMNS).itertuples(index=False))]
+        with closing(self._connect()) as con:
+            con.execute("BEGIN IMMEDIATE")
+            con.executemany("INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            con.execute("COMMIT")
+        return len(rows)
+
+    def bars(self, symbol, since=None):
+        sql, args = "SELECT date, open, high, low, close, volume FROM bars WHERE symbol = ?", [symbol]
+        if since is not None:
+            sql += " AND date >= ?"
+            args.append(since.isoformat())
+        with closing(self._connect()) as con:
+            rows = con.execute(sql + " ORDER BY date", args).fetchall()
+        df = pd.DataFrame(rows, columns=["Date"] + BAR_COLUMNS)
+        return df.set_index(pd.to_datetime(df.pop("Date")))
+
+    def set_meta(self, symbol, key, value):
+        with closing(self._connect()) as con:
+            con.execute("INSERT OR REPLACE INTO meta VALUES (?, ?, ?, ?)", (symbol, key, value, time.time()))
+
+    def get_meta(self, symbol, key):
+        with closing(self._connect()) as con:
+            row = con.execute("SELECT value FROM meta WHERE symbol = ? AND key = ?", (symbol, key)).fetchone()
+        return row[0] if row else None
+
+    def load_stats(self, symbol):
+        with closing(self._connect()) as con:
+            row = con.execute("SELECT state FROM stats WHERE symbol = ?", (symbol,)).fetchone()
+        return RollingStats.from_dict(json.loads(row[0])) if row else None
+
+    def save_stats(self, symbol, stats):
+        with closing(self._connect()) as con:
+            con.execute("INSERT OR REPLACE INTO stats VALUES (?, ?)", (symbol, json.dumps(stats.to_dict())))
+
+
+_QUOTE_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="quote")
+
+
+def fetch_quotes(provider, symbols, timeout=QUOTE_TIMEOUT):
+    """
+    同時向資料來源要所有代號的最新價，總延遲約等於一次往返。
+    timeout 為每筆請求的逾時 (傳給 provider.quote)，整批最多等 timeout + QUOTE_GRACE 秒；
+    回傳 {代號: 價格}，逾時或失敗的代號直接略過 (不會拖住整批)。
+    """
+    futures = {_QUOTE_POOL.submit(provider.quote, s, timeout): s for s in symbols}
+    done, _ = wait(futures, timeout=timeout + QUOTE_GRACE)
+    prices = {}
+    for f in done:
+        try:
+            price = f.result()
+        except Exception:
+            continue
+        if price and price > 0:
+            prices[futures[f]] = price
+    return prices
+
+
+def refresh_symbol(store, provider, symbol, today=None):
+    """只抓本地最後一根 (含當日，以便更新盤中 K 棒) 之後的資料；回傳新增/覆寫的筆數。"""
+    today = today or date.today()
+    last = store.last_date(symbol)
+    start = last if last is not None else today - timedelta(days=INITIAL_PERIOD_DAYS)
+    return store.upsert_bars(symbol, provider.history(symbol, start))
+
+
+def update_stats(store, symbol):
+    """把上次處理之後 (含未收盤那一根) 的 K 棒餵進已保存的 RollingStats，成本只與新 K 棒數有關。"""
+    stats = store.load_stats(symbol) or RollingStats()
+    since = date.fromisoformat(stats.open_bar[0]) if stats.open_bar else None
+    bars = store.bars(symbol, since=since)
+    for day, high, close in zip(bars.index.strftime("%Y-%m-%d"), bars["High"], bars["Close"]):
+        if pd.notna(high) and pd.notna(close):
+            stats.update(day, float(high), float(close))
+    if len(bars):
+        store.save_stats(symbol, stats)
+    return stats
+
+
+def derive_stats(stats, vol_window=VOL_WINDOW):
+    """由 RollingStats 取出介面所需的 ATH、波動率、回撤與最新收盤 (沒有資料的欄位略過)。"""
+    data = {"ath": stats.current_ath(), "current_vol": stats.rolling_vol(vol_window),
+            "ewma_vol": stats.ewma_vol(), "drawdown_pct": stats.drawdown_pct(), "last_close": stats.current_close()}
+    return {k: v for k, v in data.items() if v is not None}
+
+
+def load_market_data(store, provider, online=True):
+    """
+    增量更新後回傳 {"ath", "pe_0050", "current_vol", "ewma_vol", "drawdown_pct", "last_close"}：
+    pe_0050 為 0050 的本益比，其餘由本地加權指數日線的 RollingStats 取得 (current_vol 為 60 日滾動波動率)；
+    沒有資料的欄位維持 DEFAULT_MARKET_DATA 的預設值。任何網路錯誤都退回本地資料。
+    """
+    data = dict(DEFAULT_MARKET_DATA)
+    if online:
+        try:
+            refresh_symbol(store, provider, INDEX_SYMBOL)
+        except Exception:
+            pass
+        try:
+            info = provider.info(PE_SYMBOL)
+            if 'trailingPE' in info:
+                store.set_meta(PE_SYMBOL, "trailingPE", float(info['trailingPE']))
+        except Exception:
+            pass
+    data.update(derive_stats(update_stats(store, INDEX_SYMBOL)))
+    pe = store.get_meta(PE_SYMBOL, "trailingPE")
+    if pe is not None:
+        data["pe_0050"] = pe
+    return data
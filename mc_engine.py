@@ -0,0 +1,520 @@
+# --- 蒙地卡羅推演引擎 (分塊串流版) ---
+# 路徑依「路徑批次 x 時間區塊」串流運算，於對數空間原地累加；
+# 斷頭旗標、終值百分位、中位數路徑與抽樣路徑皆以增量方式累積，
+# 峰值記憶體只取決於 chunk_size x block_steps，與推演年數與路徑數無關。
+import math
+import os
+import threading
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+DEFAULT_PATHS = 10000
+DEFAULT_CHUNK = 2048        # 每批路徑數
+DEFAULT_BLOCK = 256         # 每批時間步數
+PATH_BINS = 4096            # 每個記錄時點的分位數直方圖格數 (30 年月線約 6 MB / 次推演)
+TERMINAL_BINS = 4096        # 每個整年時點的存活者分位數直方圖格數
+SKETCH_SIGMAS = 8.0         # 直方圖涵蓋範圍 (理論分布 ± N 個標準差)
+CACHE_SIZE = 16             # 推演結果快取筆數 (LRU)
+STAT_BATCH = 256            # 估計標準誤用的批次大小 (批次平均法)
+SOBOL_CHUNK = 1024          # Sobol 每批點數 (2 的次方；每批為一組獨立擾亂的 QMC 複本)
+SAMPLING_MODES = ("plain", "antithetic", "sobol")
+FAN_QUANTILES = (5, 25, 50, 75, 95)     # 扇形圖的百分位帶
+FAN_POINTS = 121                        # 扇形圖每條曲線的點數上限 (與年數、路徑數無關)
+
+
+def _norm_cdf(x):
+    return 0.5 * (1.0 + math.erf(x / math.sqrt(2.0)))
+
+
+def analytic_ruin_prob(total_assets, margin_call_threshold, mu, vol, years):
+    """
+    GBM 首次觸及斷頭線的解析機率 (%)，連續監控、微秒級，可每次重繪即時計算。
+    log(S_t/S_0) = nu t + vol W_t，nu = mu - vol^2/2，b = log(H/S_0) < 0：
+    P(min <= b) = N((b - nu T)/(vol sqrt T)) + exp(2 nu b / vol^2) N((b + nu T)/(vol sqrt T))
+    """
+    if margin_call_threshold <= 0:
+        return 0.0
+    if total_assets <= margin_call_threshold:
+        return 100.0
+    if years <= 0 or vol <= 0:
+        return 0.0
+    b = math.log(margin_call_threshold / total_assets)
+    nu = mu - 0.5 * vol ** 2
+    sd = vol * math.sqrt(years)
+    reflect = math.exp(2.0 * nu * b / vol ** 2) * _norm_cdf((b + nu * years) / sd)
+    return min(100.0, (_norm_cdf((b - nu * years) / sd) + reflect) * 100.0)
+
+
+def record_grid(years, steps_per_year=12, record_every=None):
+    """回傳需記錄的步數索引 (含起點 0 與終點)。預設為每月一點。"""
+    n_steps = int(years * steps_per_year)
+    if record_every is None:
+        record_every = max(1, steps_per_year // 12)
+    rec = np.arange(0, n_steps + 1, record_every)
+    if rec[-1] != n_steps:
+        rec = np.append(rec, n_steps)
+    return rec
+
+
+def mark_grid(years, steps_per_year=12):
+    """回傳每個整年 (含終點) 的步數索引；斷頭率與終值分布在這些時點各記一份。"""
+    n_steps = int(years * steps_per_year)
+    marks = np.arange(steps_per_year, n_steps + 1, steps_per_year)
+    if len(marks) == 0 or marks[-1] != n_steps:
+        marks = np.append(marks, n_steps)
+    return marks
+
+
+def _sketch_edges(t, mu, vol, bins):
+    m = (mu - 0.5 * vol ** 2) * t
+    s = np.maximum(vol * np.sqrt(t), 1e-12)
+    return m - SKETCH_SIGMAS * s, 2 * SKETCH_SIGMAS * s / bins
+
+
+class SimAccumulator:
+    """串流累積器：以標準化對數直方圖取代整個 (steps, paths) 矩陣。"""
+
+    def __init__(self, rec_t, mark_t, mu, vol, n_samples):
+        self.rec_t = np.asarray(rec_t, dtype=float)
+        self.mark_t = np.asarray(mark_t, dtype=float)
+        self.path_lo, self.path_w = _sketch_edges(self.rec_t, mu, vol, PATH_BINS)
+        self.mark_lo, self.mark_w = _sketch_edges(self.mark_t, mu, vol, TERMINAL_BINS)
+        self.path_hist = np.zeros((len(self.rec_t), PATH_BINS), dtype=np.int32)
+        self.mark_hist = np.zeros((len(self.mark_t), TERMINAL_BINS), dtype=np.int32)
+        self.mark_ruin = np.zeros(len(self.mark_t), dtype=np.int64)
+        # 批次估計量的累計和與平方和，用來算標準誤 (與總直方圖一樣可相加合併)
+        n_marks = len(self.mark_t)
+        self.ruin_k, self.ruin_sum, self.ruin_sq = np.zeros(n_marks), np.zeros(n_marks), np.zeros(n_marks)
+        self.q_k, self.q_sum, self.q_sq = np.zeros(n_marks), np.zeros((n_marks, 3)), np.zeros((n_marks, 3))
+        self.n_samples = n_samples
+        self.samples = np.empty((len(self.rec_t), 0))
+        self._pending = None
+        self.n_paths = 0
+
+    def add_records(self, row0, x_rows):
+        """x_rows: (R, C) 為第 row0 起 R 個記錄時點的對數報酬。"""
+        r = x_rows.shape[0]
+        sl = slice(row0, row0 + r)
+        self.path_hist[sl] += _bin_counts(x_rows, self.path_lo[sl], self.path_w[sl], PATH_BINS)
+        need = self.n_samples - self.samples.shape[1]
+        if need > 0 and row0 == 0:
+            self._pending = x_rows[:, :need]
+        elif need > 0:
+            self._pending = np.vstack([self._pending, x_rows[:, :need]])
+
+    def add_mark(self, i, x, ruined, groups):
+        """第 i 個整年時點：累計已斷頭路徑數，存活者計入該年的分布。groups 為統計批次。"""
+        self.mark_ruin[i] += int(ruined.sum())
+        alive = x[~ruined]
+        if alive.size:
+            self.mark_hist[i] += _bin_counts(alive[None, :], self.mark_lo[i:i + 1],
+                                             self.mark_w[i:i + 1], TERMINAL_BINS)[0]
+        for g in groups:
+            r = ruined[g].mean()
+            self.ruin_k[i] += 1
+            self.ruin_sum[i] += r
+            self.ruin_sq[i] += r * r
+            a = x[g][~ruined[g]]
+            if a.size:
+                q = np.percentile(a, (5, 50, 95))
+                self.q_k[i] += 1
+                self.q_sum[i] += q
+                self.q_sq[i] += q * q
+
+    def finish_chunk(self, n):
+        self.n_paths += n
+        if self._pending is not None:
+            self.samples = np.hstack([self.samples, self._pending])
+            self._pending = None
+
+    def merge(self, other):
+        """合併另一個累積器 (直方圖計數相加，結果與分割方式無關)。"""
+        self.path_hist += other.path_hist
+        self.mark_hist += other.mark_hist
+        self.mark_ruin += other.mark_ruin
+        for name in ("ruin_k", "ruin_sum", "ruin_sq", "q_k", "q_sum", "q_sq"):
+            getattr(self, name)[...] += getattr(other, name)
+        self.n_paths += other.n_paths
+        need = self.n_samples - self.samples.shape[1]
+        if need > 0:
+            self.samples = np.hstack([self.samples, other.samples[:, :need]])
+        return self
+
+    def path_quantile(self, q, rows=None):
+        """
+        各記錄時點的第 q 百分位 (對數報酬；q 可為序列)。由直方圖內插，與樣本精確百分位的差距
+        不超過一格寬 2 x SKETCH_SIGMAS x vol x sqrt(t) / PATH_BINS (約 0.004 vol sqrt(t))，
+        換成市值即相對誤差約 0.4% x vol sqrt(t)；尾端樣本稀疏時另加相鄰樣本的間距。
+        """
+        rows = slice(None) if rows is None else rows
+        return _hist_quantile(self.path_hist[rows], self.path_lo[rows], self.path_w[rows], q)
+
+    def mark_quantile(self, i, q):
+        return _hist_quantile(self.mark_hist[i:i + 1], self.mark_lo[i:i + 1], self.mark_w[i:i + 1], q)[0]
+
+    def mark_stderr(self, i):
+        """第 i 個整年時點的標準誤：(斷頭率, 對數空間 [p05, p50, p95])，以批次估計量的離散度估計。"""
+        def se(k, total, sq):
+            if k < 2:
+                return np.full(np.shape(total), np.nan)
+            var = (sq - total * total / k) / (k - 1)
+            return np.sqrt(np.maximum(var, 0.0) / k)
+        return se(self.ruin_k[i], self.ruin_sum[i], self.ruin_sq[i]), se(self.q_k[i], self.q_sum[i], self.q_sq[i])
+
+
+def _bin_counts(x_rows, lo, width, bins):
+    r = x_rows.shape[0]
+    idx = np.floor((x_rows - lo[:, None]) / width[:, None])
+    np.clip(idx, 0, bins - 1, out=idx)
+    idx = idx.astype(np.int64) + (np.arange(r) * bins)[:, None]
+    return np.bincount(idx.ravel(), minlength=r * bins).reshape(r, bins)
+
+
+def _hist_quantile(counts, lo, width, q):
+    """由直方圖做格內線性內插取第 q 百分位 (逐列)；q 為序列時累計次數只算一次，回傳 (len(q), 列數)。"""
+    cum = np.cumsum(counts, axis=1, dtype=np.int64)
+    total = cum[:, -1]
+    rows = np.arange(counts.shape[0])
+
+    def one(q):
+        target = q / 100.0 * total
+        i = np.minimum((cum < target[:, None]).sum(axis=1), counts.shape[1] - 1)
+        before = np.where(i > 0, cum[rows, i - 1], 0)
+        inside = counts[rows, i]
+        frac = np.where(inside > 0, (target - before) / np.maximum(inside, 1), 0.5)
+        return lo + (i + frac) * width
+    return np.array([one(x) for x in q]) if np.ndim(q) else one(q)
+
+
+def _normal_blocks(seq, n, n_steps, block_steps, sampling):
+    """
+    依抽樣方式逐時間區塊產生 (b, n) 的標準常態亂數。
+    antithetic: 前半路徑抽 z、後半取 -z (對偶變數)
+    sobol: 每批為一組擾亂 Sobol 點 (維度 = 步數)，經反常態 CDF 轉換
+    """
+    if sampling == "sobol":
+        from scipy.special import ndtri
+        from scipy.stats import qmc
+        with warnings.catch_warnings():
+            # 最後一批點數未必是 2 的次方，仍為合法的擾亂 QMC 複本
+            warnings.simplefilter("ignore", UserWarning)
+            u = qmc.Sobol(n_steps, scramble=True, seed=np.random.default_rng(seq)).random(n)
+        np.clip(u, 1e-12, 1 - 1e-12, out=u)
+        for k0 in range(0, n_steps, block_steps):
+            yield ndtri(u[:, k0:k0 + block_steps].T)
+        return
+    rng = np.random.default_rng(seq)
+    half = (n + 1) // 2
+    for k0 in range(0, n_steps, block_steps):
+        b = min(block_steps, n_steps - k0)
+        if sampling == "antithetic":
+            z = rng.standard_normal((b, half))
+            yield np.concatenate([z, -z], axis=1)[:, :n]
+        else:
+            yield rng.standard_normal((b, n))
+
+
+def _n_groups(units, per_group):
+    """批次數：每批約 per_group 個獨立單位，但至少 2 批 (才估得出標準誤)，且不超過單位數。"""
+    return max(1, min(units, max(2, units // per_group)))
+
+
+def _stat_groups(n, sampling):
+    """切出彼此獨立的統計批次：對偶路徑成對留在同批，Sobol 整批為一個複本。"""
+    if sampling == "sobol":
+        return [np.arange(n)]
+    if sampling == "antithetic":
+        half = (n + 1) // 2
+        edges = np.linspace(0, half, _n_groups(half, STAT_BATCH // 2) + 1).astype(int)
+        groups = []
+        for lo, hi in zip(edges[:-1], edges[1:]):
+            idx = np.arange(lo, hi)
+            partner = idx + half
+            groups.append(np.concatenate([idx, partner[partner < n]]))
+        return groups
+    edges = np.linspace(0, n, _n_groups(n, STAT_BATCH) + 1).astype(int)
+    return [np.arange(lo, hi) for lo, hi in zip(edges[:-1], edges[1:])]
+
+
+def _sobol_chunk(chunk_size, n_steps, block_steps, n_paths):
+    """
+    Sobol 需一次產生整批的全部維度，依記憶體預算把批次縮成 2 的次方。
+    每批是一個統計批次，批次上限取 n_paths / 2，確保至少兩個獨立複本才估得出標準誤。
+    """
+    budget = max(chunk_size * block_steps // max(n_steps, 1), 256)
+    replicas = max(n_paths // 2, 1)
+    return int(min(chunk_size, SOBOL_CHUNK, 2 ** int(np.log2(budget)), 2 ** int(np.log2(replicas))))
+
+
+def simulate_chunk(acc, seed_seq, n, barrier, mu, vol, rec_steps, mark_steps, steps_per_year,
+                   block_steps=DEFAULT_BLOCK, bridge=False, sampling="plain"):
+    """
+    跑一批 n 條路徑，結果累積進 acc。barrier 為對數空間的斷頭線。
+    每批路徑有自己的 SeedSequence，常態亂數依時間順序逐列抽取，
+    因此較短年數的推演恰為較長推演的前段 (可由快取截斷取得)。
+    bridge=True 時對每個時間格套用布朗橋穿越修正：兩端都在斷頭線之上的格子，
+    格內觸線機率為 exp(-2 (x0-b)(x1-b) / (vol^2 dt))，逐格累乘成存活機率後
+    每條路徑以一個固定的均勻亂數決定是否斷頭，粗網格也能得到連續監控的斷頭率。
+    """
+    dt = 1.0 / steps_per_year
+    drift = (mu - 0.5 * vol ** 2) * dt
+    diffusion = vol * np.sqrt(dt)
+    n_steps = int(rec_steps[-1])
+    z_seq, u_seq = seed_seq.spawn(2)
+    blocks = _normal_blocks(z_seq, n, n_steps, block_steps, sampling)
+    groups = _stat_groups(n, sampling)
+    u = np.random.default_rng(u_seq).random(n) if bridge else None
+
+    x = np.zeros(n)
+    run_min = np.zeros(n)
+    log_survival = np.zeros(n)
+    acc.add_records(0, x[None, :])
+    cursor = [1, 0]
+    k0 = 0
+    while k0 < n_steps:
+        b = min(block_steps, n_steps - k0)
+        z = next(blocks)
+        z *= diffusion
+        z += drift
+        np.cumsum(z, axis=0, out=z)
+        z += x
+
+        ls = None
+        if bridge:
+            ls = _bridge_log_survival(x, z, barrier, diffusion ** 2)
+            np.cumsum(ls, axis=0, out=ls)
+            ls += log_survival
+            log_survival = ls[-1].copy()
+        book_block(acc, z, k0, run_min, barrier, rec_steps, mark_steps, cursor, groups, ls, u)
+        x = z[-1].copy()
+        k0 += b
+
+    acc.finish_chunk(n)
+
+
+def book_block(acc, z, k0, run_min, barrier, rec_steps, mark_steps, cursor, groups, ls=None, u=None):
+    """
+    把第 k0+1 步起的時間區塊 z (b, n) (對數位置) 記入 acc：
+    整年時點的斷頭數與存活者分布、月線直方圖，並就地更新 run_min 與 cursor = [記錄列, 整年列]。
+    ls/u 為布朗橋模式下截至各步的對數存活機率與每條路徑的均勻亂數。
+    """
+    b = z.shape[0]
+    rec_row, mark_row = cursor
+    hi = np.searchsorted(mark_steps, k0 + b, side="right")
+    if hi > mark_row:
+        rows = mark_steps[mark_row:hi] - k0 - 1
+        block_min = np.minimum.accumulate(z[:rows[-1] + 1], axis=0)
+        for i, r in zip(range(mark_row, hi), rows):
+            ruined = np.minimum(run_min, block_min[r]) < barrier
+            if ls is not None:
+                ruined |= u >= np.exp(ls[r])
+            acc.add_mark(i, z[r], ruined, groups)
+        cursor[1] = hi
+    np.minimum(run_min, z.min(axis=0), out=run_min)
+
+    hi = np.searchsorted(rec_steps, k0 + b, side="right")
+    if hi > rec_row:
+        acc.add_records(rec_row, z[rec_steps[rec_row:hi] - k0 - 1])
+        cursor[0] = hi
+
+
+def _bridge_log_survival(x_start, z, barrier, var):
+    """回傳區塊內每一格「格內未觸線」的對數機率 (z 為區塊內各步位置)。"""
+    if not np.isfinite(barrier):
+        return np.zeros_like(z)
+    d = z - barrier
+    np.maximum(d, 0.0, out=d)
+    d_prev = np.empty_like(d)
+    d_prev[0] = np.maximum(x_start - barrier, 0.0)
+    d_prev[1:] = d[:-1]
+    d *= d_prev
+    d *= -2.0 / var
+    np.exp(d, out=d)
+    with np.errstate(divide="ignore"):
+        np.log1p(-d, out=d)
+    return d
+
+
+def _run_share(chunk_seeds, chunk_sizes, barrier, mu, vol, years, steps_per_year, n_samples,
+               block_steps, bridge=False, sampling="plain"):
+    """單一 worker 的工作：依序串流跑完分到的各批路徑 (每批自帶亂數流)。"""
+    rec_steps, mark_steps = record_grid(years, steps_per_year), mark_grid(years, steps_per_year)
+    acc = SimAccumulator(rec_steps / steps_per_year, mark_steps / steps_per_year, mu, vol, n_samples)
+    for seq, n in zip(chunk_seeds, chunk_sizes):
+        simulate_chunk(acc, seq, n, barrier, mu, vol, rec_steps, mark_steps, steps_per_year,
+                       block_steps, bridge, sampling)
+    return acc
+
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _get_pool(n_workers):
+    # 行程池建立成本高，依 worker 數重複使用；多個 session 同時首次推演時只建立一個
+    with _POOLS_LOCK:
+        if n_workers not in _POOLS:
+            _POOLS[n_workers] = ProcessPoolExecutor(max_workers=n_workers)
+        return _POOLS[n_workers]
+
+
+def default_workers():
+    return max(1, os.cpu_count() or 1)
+
+
+class SimCache:
+    """
+    推演結果的 LRU 快取 (同一個 Streamlit 行程內所有使用者共用)。
+    鍵為影響亂數路徑的參數 (不含年數)；年數較短的請求直接截斷較長的快取結果，
+    因為每批路徑的亂數依時間逐列抽取，截斷結果與重新推演完全一致。
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, years):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < years:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, years, acc):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < years:
+                self._data[key] = (years, acc)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+SIM_CACHE = SimCache()
+
+
+def fan_series(sim, n_samples=0, n_points=FAN_POINTS):
+    """
+    把推演摘要壓成固定大小的繪圖資料：各百分位帶與抽樣路徑重新取樣到至多 n_points 個時點，
+    n_samples 條抽樣路徑串成一條以 NaN 分隔的序列 (單一 WebGL trace)。
+    回傳 {"t", "bands": {q: y}, "sample_t", "sample_y"}，數值已四捨五入到元。
+    百分位帶來自直方圖 (誤差界見 SimAccumulator.path_quantile)：誤差以總市值計，
+    真實淨資產接近 0 時相對誤差會放大。
+    """
+    t = np.asarray(sim["time_axis"], dtype=float)
+    grid = np.linspace(t[0], t[-1], min(len(t), n_points)) if len(t) else t
+    resample = lambda y: np.round(np.interp(grid, t, y))
+    paths = [np.append(resample(p), np.nan) for p in sim["sample_paths"][:, :n_samples].T]
+    return {"t": np.round(grid, 4), "bands": {q: resample(y) for q, y in sim["bands"].items()},
+            "sample_t": np.tile(np.append(np.round(grid, 4), np.nan), len(paths)),
+            "sample_y": np.concatenate(paths) if paths else np.empty(0)}
+
+
+def run_simulation(total_assets, total_debt, margin_call_threshold, mu, vol, years,
+                   n_paths=DEFAULT_PATHS, seed=42, steps_per_year=12, n_samples=100,
+                   chunk_size=DEFAULT_CHUNK, block_steps=DEFAULT_BLOCK, n_workers=1, bridge=False,
+                   sampling="plain", use_cache=True):
+    """
+    單一 GBM 的真實淨資產推演。
+    total_assets: 券商層級總市值 (路徑起點)
+    total_debt: 質押 + 房貸增貸 + 信貸 (由市值換算真實淨資產)
+    margin_call_threshold: 市值跌破此值即視為斷頭 (任一步)
+    steps_per_year: 12 為月線、252 為日線；圖表一律以每月一點記錄
+    bridge: 以布朗橋修正格點之間的觸線機率 (見 simulate_chunk)
+    n_workers: >1 時以行程池平行運算；每批路徑的亂數流皆由同一個
+               SeedSequence(seed) spawn 而來，結果與 worker 數無關、逐位元一致。
+    sampling: "plain" 偽亂數、"antithetic" 對偶變數、"sobol" 擾亂 Sobol 準蒙地卡羅；
+              摘要中的 "se" 為斷頭率與各百分位的標準誤 (批次平均法)
+    use_cache: 相同輸入 (或僅年數縮短) 時直接由 SIM_CACHE 取得結果
+    """
+    if sampling not in SAMPLING_MODES:
+        raise ValueError(f"未知的抽樣方式: {sampling}")
+    if total_assets <= 0:
+        rec_steps = record_grid(years, steps_per_year)
+        return _wiped_out(rec_steps / steps_per_year, n_paths, total_assets - total_debt)
+    barrier = float(np.log(margin_call_threshold / total_assets)) if margin_call_threshold > 0 else -np.inf
+
+    # 路徑只與「斷頭線相對起點的比例」有關；總負債只在摘要時換算，不影響快取
+    # Sobol 的維度等於步數，不同年數的點集無法互相截斷，故年數也要放進鍵
+    key = (barrier, float(mu), float(vol), seed, n_paths, steps_per_year, bool(bridge),
+           n_samples, chunk_size, block_steps, sampling, years if sampling == "sobol" else None)
+    acc = SIM_CACHE.get(key, years) if use_cache else None
+    if acc is not None:
+        return summarize(acc, total_assets, total_debt, years, cached=True)
+
+    if sampling == "sobol":
+        chunk_size = _sobol_chunk(chunk_size, int(years * steps_per_year), block_steps, n_paths)
+    chunk_sizes = [min(chunk_size, n_paths - i) for i in range(0, n_paths, chunk_size)]
+    chunk_seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    n_workers = max(1, min(int(n_workers), len(chunk_sizes)))
+    bounds = np.linspace(0, len(chunk_sizes), n_workers + 1).astype(int)
+    args = [(chunk_seeds[lo:hi], chunk_sizes[lo:hi], barrier, mu, vol, years, steps_per_year,
+             n_samples, block_steps, bridge, sampling) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    if n_workers == 1:
+        acc = _run_share(*args[0])
+    else:
+        futures = [_get_pool(n_workers).submit(_run_share, *a) for a in args]
+        # 依批次順序合併，抽樣路徑與計數都與排程無關
+        acc = futures[0].result()
+        for f in futures[1:]:
+            acc.merge(f.result())
+    if use_cache:
+        SIM_CACHE.put(key, years, acc)
+    return summarize(acc, total_assets, total_debt, years)
+
+
+def _wiped_out(rec_t, n_paths, net):
+    """總市值為 0 時無法取對數：視為起點即斷頭。"""
+    flat = np.full(len(rec_t), float(net))
+    return {
+        "time_axis": rec_t, "n_paths": n_paths, "ruin_prob": 100.0,
+        "p05": 0.0, "p50": 0.0, "p95": 0.0,
+        "median_path": flat, "bands": {q: flat for q in FAN_QUANTILES},
+        "sample_paths": np.empty((len(rec_t), 0)), "cached": False,
+        "se": {"ruin_prob": 0.0, "p05": 0.0, "p50": 0.0, "p95": 0.0},
+    }
+
+
+def summarize(acc, total_assets, total_debt, years=None, cached=False):
+    """把累積器換算成介面所需的真實淨資產摘要；years 小於推演年數時截斷。"""
+    years = acc.mark_t[-1] if years is None else years
+    rows = acc.rec_t <= years + 1e-9
+    m = int(np.searchsorted(acc.mark_t, years - 1e-9))
+    to_net = lambda x: total_assets * np.exp(x) - total_debt
+    ruin_se, q_se = acc.mark_stderr(m)
+    se = {"ruin_prob": float(ruin_se) * 100}
+    if acc.mark_hist[m].sum() > 0:
+        qx = [acc.mark_quantile(m, q) for q in (5, 50, 95)]
+        p05, p50, p95 = (float(to_net(x)) for x in qx)
+        # 對數空間的標準誤以 delta method 換算成台幣：d(S0 e^x) = S0 e^x dx
+        for name, x, e in zip(("p05", "p50", "p95"), qx, q_se):
+            se[name] = float(total_assets * np.exp(x) * e)
+    else:
+        p05 = p50 = p95 = 0.0
+        se.update(p05=np.nan, p50=np.nan, p95=np.nan)
+    bands = dict(zip(FAN_QUANTILES, to_net(acc.path_quantile(FAN_QUANTILES, rows))))
+    return {
+        "time_axis": acc.rec_t[rows],
+        "n_paths": acc.n_paths,
+        "ruin_prob": acc.mark_ruin[m] / acc.n_paths * 100 if acc.n_paths else 0.0,
+        "p05": p05, "p50": p50, "p95": p95,
+        "median_path": bands[50],
+        "bands": bands,
+        "sample_paths": to_net(acc.samples[rows]),
+        "cached": cached,
+        "se": se,
+    }
@@ -0,0 +1,191 @@
+# --- 多資產相關性推演引擎 ---
+# 每檔持股各自擁有漂移、波動與槓桿倍數，透過 Cholesky 分解的相關矩陣共用底層因子；
+# 正二為每日再平衡的槓桿 ETF：dV/V = L dS/S - (L-1) r dt，波動耗損 (L^2 sigma^2 / 2) 自然反映在對數漂移中。
+# 運算以 (steps, paths, assets) 批次矩陣進行，沿用 mc_engine 的分塊串流、累積器與快取。
+import numpy as np
+
+from mc_engine import (DEFAULT_BLOCK, SIM_CACHE, SimAccumulator, _get_pool, _stat_groups, _wiped_out,
+                       book_block, mark_grid, record_grid, summarize)
+from holdings import CATALOG, FACTORS
+from rules import tier_target
+
+MULTI_CHUNK = 512           # 多資產每批路徑數 (區塊記憶體 = 步數 x 路徑 x 資產)
+
+# 底層因子 (FACTORS 定義於 holdings) 的相關矩陣，列 / 欄順序同 FACTORS
+FACTOR_CORR = np.array([
+    [1.00, 0.55, 0.80, -0.10],
+    [0.55, 1.00, 0.45, -0.15],
+    [0.80, 0.45, 1.00, -0.05],
+    [-0.10, -0.15, -0.05, 1.00],
+])
+
+# 持股預設屬性：追蹤因子、槓桿倍數、資產類別 (sleeve)；實際持股可用 Holdings.catalog() 傳入
+HOLDINGS = CATALOG
+INDEX_FACTOR = "TWII"       # MDD 位階以台股加權指數計算
+
+
+def build_spec(values, steps_per_year, mu_scale=1.0, vol_scale=1.0, financing_rate=0.025,
+               factors=FACTORS, corr=FACTOR_CORR, holdings=HOLDINGS):
+    """把持股市值與因子假設整理成推演所需的矩陣 (每步對數漂移、因子負荷、初始權重)。"""
+    codes = [c for c in holdings if values.get(c, 0) > 0]
+    names = list(factors)
+    dt = 1.0 / steps_per_year
+    f_mu = np.array([factors[f][0] for f in names]) * mu_scale
+    f_vol = np.array([factors[f][1] for f in names]) * vol_scale
+    lev = np.array([holdings[c]["leverage"] for c in codes])
+    fi = np.array([names.index(holdings[c]["factor"]) for c in codes])
+
+    # 每日再平衡槓桿 ETF 的連續時間參數
+    a_mu = lev * f_mu[fi] - (lev - 1.0) * financing_rate
+    a_vol = lev * f_vol[fi]
+    load = np.zeros((len(names), len(codes)))
+    load[fi, np.arange(len(codes))] = a_vol * np.sqrt(dt)
+    w0 = np.array([values[c] for c in codes], dtype=float)
+    w0 /= w0.sum()
+
+    k = names.index(INDEX_FACTOR)
+    idx_load = np.zeros(len(names))
+    idx_load[k] = f_vol[k] * np.sqrt(dt)
+
+    # 組合層級的近似報酬與波動，只用來決定分位數直方圖的涵蓋範圍
+    cov = np.outer(a_vol, a_vol) * corr[np.ix_(fi, fi)]
+    chol_t = np.linalg.cholesky(corr).T
+    return {
+        "codes": tuple(codes),
+        # 獨立常態 (.., K) @ mix 一次得到相關化後的各資產對數變動
+        "mix": chol_t @ load,
+        "drift": (a_mu - 0.5 * a_vol ** 2) * dt,
+        "idx_mix": chol_t @ idx_load,
+        "idx_drift": (f_mu[k] - 0.5 * f_vol[k] ** 2) * dt,
+        "w0": w0,
+        "attack": np.array([holdings[c]["sleeve"] == "attack" for c in codes]),
+        "mu_p": float(w0 @ a_mu),
+        "vol_p": float(np.sqrt(w0 @ cov @ w0)),
+    }
+
+
+def _rebalance(v, target_pct, attack, tolerance):
+    """把偏離目標超過容忍度的路徑，攻擊型占比調回 target_pct (其餘資產等比例縮放)。"""
+    total = v.sum(axis=1)
+    atk = v[:, attack].sum(axis=1)
+    ratio = np.divide(atk, total, out=np.zeros_like(total), where=total > 0) * 100
+    move = np.abs(ratio - target_pct) > tolerance
+    if not move.any() or attack.all() or not attack.any():
+        return v
+    want = total * target_pct / 100.0
+    rest = total - atk
+    scale_atk = np.divide(want, atk, out=np.ones_like(atk), where=atk > 0)
+    scale_rest = np.divide(total - want, rest, out=np.ones_like(rest), where=rest > 0)
+    v = v.copy()
+    v[np.ix_(move, attack)] *= scale_atk[move, None]
+    v[np.ix_(move, ~attack)] *= scale_rest[move, None]
+    return v
+
+
+def simulate_portfolio_chunk(acc, seed_seq, n, barrier, spec, rec_steps, mark_steps,
+                             block_steps=DEFAULT_BLOCK, rebalance_every=None, base_exposure=23.0,
+                             start_mdd_pct=0.0, tolerance=0.0):
+    """
+    跑一批 n 條多資產路徑。rebalance_every (步數) 不為 None 時，每期依模擬出的
+    加權指數 MDD 查 Tier 目標，對偏離超過 tolerance 的路徑執行再平衡。
+    """
+    rng = np.random.default_rng(seed_seq)
+    groups = _stat_groups(n, "plain")
+    n_steps = int(rec_steps[-1])
+    mix, drift = spec["mix"], spec["drift"]
+    attack = spec["attack"]
+
+    v = np.tile(spec["w0"], (n, 1))                          # 各資產相對市值 (起點合計 = 1)
+    log_idx = np.zeros(n)
+    idx_peak = np.full(n, -np.log(max(1.0 - start_mdd_pct / 100.0, 1e-9)))
+    run_min = np.zeros(n)
+    acc.add_records(0, np.zeros((1, n)))
+    cursor = [1, 0]
+    k0 = 0
+    while k0 < n_steps:
+        b = min(block_steps, n_steps - k0)
+        eps = rng.standard_normal((b, n, mix.shape[0]))
+        inc = eps @ mix
+        inc += drift
+        idx_path = np.cumsum(eps @ spec["idx_mix"] + spec["idx_drift"], axis=0)
+        idx_path += log_idx
+        idx_peaks = np.maximum(np.maximum.accumulate(idx_path, axis=0), idx_peak)
+
+        # 以再平衡日切段：段內各資產獨立複利，段末依當時 MDD 調整權重
+        x = np.empty((b, n))
+        s = 0
+        while s < b:
+            e = b if rebalance_every is None else min(b, s + rebalance_every - (k0 + s) % rebalance_every)
+            seg = inc[s:e]
+            np.cumsum(seg, axis=0, out=seg)
+            np.exp(seg, out=seg)
+            seg *= v
+            seg.sum(axis=2, out=x[s:e])
+            v = seg[-1].copy()
+            if rebalance_every is not None and (k0 + e) % rebalance_every == 0:
+                mdd = (1.0 - np.exp(idx_path[e - 1] - idx_peaks[e - 1])) * 100
+                v = _rebalance(v, tier_target(mdd, base_exposure), attack, tolerance)
+            s = e
+        np.log(x, out=x)
+        log_idx, idx_peak = idx_path[-1].copy(), idx_peaks[-1].copy()
+
+        book_block(acc, x, k0, run_min, barrier, rec_steps, mark_steps, cursor, groups)
+        k0 += b
+
+    acc.finish_chunk(n)
+
+
+def _run_portfolio_share(chunk_seeds, chunk_sizes, barrier, spec, years, steps_per_year, n_samples,
+                         block_steps, strategy):
+    rec_steps, mark_steps = record_grid(years, steps_per_year), mark_grid(years, steps_per_year)
+    acc = SimAccumulator(rec_steps / steps_per_year, mark_steps / steps_per_year, spec["mu_p"], spec["vol_p"],
+                         n_samples)
+    for seq, n in zip(chunk_seeds, chunk_sizes):
+        simulate_portfolio_chunk(acc, seq, n, barrier, spec, rec_steps, mark_steps, block_steps, **strategy)
+    return acc
+
+
+def run_portfolio_simulation(values, total_debt, margin_call_threshold, years, n_paths=10000, seed=42,
+                             steps_per_year=12, mu_scale=1.0, vol_scale=1.0, financing_rate=0.025,
+                             rebalance_every=None, base_exposure=23.0, start_mdd_pct=0.0, tolerance=0.0,
+                             n_samples=100, chunk_size=MULTI_CHUNK, block_steps=DEFAULT_BLOCK, n_workers=1,
+                             use_cache=True, holdings=HOLDINGS):
+    """
+    多資產真實淨資產推演，回傳格式與 mc_engine.run_simulation 相同。
+    values: {代號: 目前市值}，代號需在 holdings ({代號: 屬性}，預設 HOLDINGS) 中
+    mu_scale / vol_scale: 總經乘數，套用在所有底層因子
+    rebalance_every: 每幾步檢查一次 Tier 目標並再平衡 (None 為買進持有)
+    """
+    total_assets = float(sum(values.get(c, 0) for c in holdings))
+    if total_assets <= 0:
+        return _wiped_out(record_grid(years, steps_per_year) / steps_per_year, n_paths, total_assets - total_debt)
+    barrier = float(np.log(margin_call_threshold / total_assets)) if margin_call_threshold > 0 else -np.inf
+    spec = build_spec(values, steps_per_year, mu_scale, vol_scale, financing_rate, holdings=holdings)
+    strategy = dict(rebalance_every=rebalance_every, base_exposure=float(base_exposure),
+                    start_mdd_pct=float(start_mdd_pct), tolerance=float(tolerance))
+
+    traits = tuple((holdings[c]["factor"], holdings[c]["leverage"], holdings[c]["sleeve"]) for c in spec["codes"])
+    key = ("portfolio", barrier, spec["codes"], traits, tuple(spec["w0"]), float(mu_scale), float(vol_scale),
+           float(financing_rate), tuple(sorted(strategy.items())), seed, n_paths, steps_per_year,
+           n_samples, chunk_size, block_steps)
+    acc = SIM_CACHE.get(key, years) if use_cache else None
+    if acc is not None:
+        return summarize(acc, total_assets, total_debt, years, cached=True)
+
+    chunk_sizes = [min(chunk_size, n_paths - i) for i in range(0, n_paths, chunk_size)]
+    chunk_seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    n_workers = max(1, min(int(n_workers), len(chunk_sizes)))
+    bounds = np.linspace(0, len(chunk_sizes), n_workers + 1).astype(int)
+    args = [(chunk_seeds[lo:hi], chunk_sizes[lo:hi], barrier, spec, years, steps_per_year, n_samples,
+             block_steps, strategy) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    if n_workers == 1:
+        acc = _run_portfolio_share(*args[0])
+    else:
+        futures = [_get_pool(n_workers).submit(_run_portfolio_share, *a) for a in args]
+        acc = futures[0].result()
+        for f in futures[1:]:
+            acc.merge(f.result())
+    if use_cache:
+        SIM_CACHE.put(key, years, acc)
+    return summarize(acc, total_assets, total_debt, years)
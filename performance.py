@@ -0,0 +1,187 @@
+# --- 帳戶績效統計 (時間加權 / 資金加權報酬、已實現波動率、最大回撤) ---
+# 以真實淨資產 (True_Net_Assets) 為帳戶價值，每筆存檔為一個子期間：
+#   外部資金 = Contribution (入金 + / 出金 -) + 房貸增貸 / 信貸的本金減少 (視為以場外收入還款)；
+#   負債增加視為借款已投入組合，真實淨資產不變，不算外部資金。
+# 時間加權報酬 (TWR) 以子期間報酬連乘，扣除外部資金的影響；資金加權報酬 (MWR) 為外部資金流的 IRR。
+# 狀態只有幾個累計量與非零資金流清單，每筆新紀錄 O(1) 更新；歷史資料庫把累計量存成 JSON、資金流另存一表只做追加。
+import math
+
+import numpy as np
+import pandas as pd
+
+DAYS_PER_YEAR = 365
+RATE_BOUNDS = (-0.99, 100.0)    # IRR 搜尋範圍 (年化)
+
+
+def _years(dates):
+    return pd.to_datetime(pd.Series(dates)).to_numpy("datetime64[s]").astype(np.int64) / (86400 * DAYS_PER_YEAR)
+
+
+class PerformanceStats:
+    def __init__(self):
+        self.n = 0
+        self.origin = None          # 第一筆紀錄的時間 (年，epoch 起算)
+        self.last_t = 0.0           # 最後一筆距第一筆的年數
+        self.first_value = None
+        self.last_value = None
+        self.last_debt = None
+        self.log_twr = 0.0          # 子期間對數報酬總和
+        self.n_returns = 0
+        self.sum_sq = 0.0           # 子期間對數報酬平方和
+        self.peak = 0.0             # 累積對數報酬的歷史高點
+        self.max_dd = 0.0
+        self.flows = []             # [(年數, 外部資金)]，只記非零者
+
+    def extend(self, dates, values, debts=None, contributions=None):
+        """依時間順序餵入多筆紀錄 (向量化)；單筆更新與整批重建走同一段程式。"""
+        t = _years(dates)
+        v = np.asarray(values, dtype=float)
+        if len(v) == 0:
+            return self
+        # 負債欄位空白 (舊紀錄或漏填) 時沿用前一筆，避免被當成一次還清
+        d = np.zeros_like(v) if debts is None else np.asarray(debts, dtype=float)
+        d = pd.Series(np.concatenate([[self.last_debt or 0.0], d])).ffill().to_numpy()[1:]
+        c = np.nan_to_num(np.zeros_like(v) if contributions is None else np.asarray(contributions, dtype=float))
+        if self.origin is None:
+            self.origin, self.first_value = float(t[0]), float(v[0])
+            self.last_value, self.last_debt = float(v[0]), float(d[0])
+            t, v, d, c = t[1:], v[1:], d[1:], c[1:]
+            self.n = 1
+        t = t - self.origin
+        prev_v = np.concatenate([[self.last_value], v[:-1]])
+        prev_d = np.concatenate([[self.last_debt], d[:-1]])
+        flow = c + np.maximum(prev_d - d, 0.0)
+        valid = (prev_v > 0) & (v - flow > 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lr = np.where(valid, np.log((v - flow) / prev_v), 0.0)
+
+        if len(lr):
+            cum = self.log_twr + np.cumsum(lr)
+            peak = np.maximum(self.peak, np.maximum.accumulate(cum))
+            self.max_dd = max(self.max_dd, float((1.0 - np.exp(cum - peak)).max()))
+            self.log_twr, self.peak = float(cum[-1]), float(peak[-1])
+            self.last_t, self.last_value, self.last_debt = float(t[-1]), float(v[-1]), float(d[-1])
+        self.sum_sq += float(lr @ lr)
+        self.n_returns += int(valid.sum())
+        self.flows += [(float(a), float(b)) for a, b in zip(t[flow != 0], flow[flow != 0])]
+        self.n += len(v)
+        return self
+
+    def update(self, date, value, debt=0.0, contribution=0.0):
+        return self.extend([date], [value], [debt], [contribution])
+
+    # --- 指標 ---
+    def twr(self):
+        """期間時間加權報酬 (非年化)。"""
+        return math.expm1(self.log_twr)
+
+    def twr_annualized(self):
+        return math.expm1(self.log_twr / self.last_t) if self.last_t > 0 else 0.0
+
+    def realized_vol(self):
+        """子期間對數報酬的年化標準差 (依各期間長度加總換算，存檔頻率不均也適用)。"""
+        if self.n_returns < 2 or self.last_t <= 0:
+            return None
+        var = (self.sum_sq - self.log_twr ** 2 / self.n_returns) / self.last_t
+        return math.sqrt(max(var, 0.0) * self.n_returns / (self.n_returns - 1))
+
+    def drawdown_pct(self):
+        return (1.0 - math.exp(self.log_twr - self.peak)) * 100
+
+    def max_drawdown_pct(self):
+        return self.max_dd * 100
+
+    def net_flows(self):
+        return sum(f for _, f in self.flows)
+
+    def mwr(self):
+        """資金加權報酬 (年化 IRR)：起始淨資產與各筆外部資金為投入，最後淨資產為回收。"""
+        if self.n < 2 or self.last_t <= 0 or not self.first_value or self.first_value <= 0:
+            return None
+        t = np.array([0.0] + [a for a, _ in self.flows] + [self.last_t])
+        cash = np.array([-self.first_value] + [-b for _, b in self.flows] + [self.last_value])
+        lo, hi = (math.log1p(r) for r in RATE_BOUNDS)
+        # 以 TWR 為起點的牛頓法 (資金流很多時只需掃過幾次)，跳出範圍或不收斂時改用二分法
+        g = min(max(self.log_twr / self.last_t, lo), hi)
+        for _ in range(20):
+            w = cash * np.exp(-g * t)
+            f, df = w.sum(), -(w @ t)
+            if df == 0:
+                break
+            step = f / df
+            g -= step
+            if not lo < g < hi:
+                break
+            if abs(step) < 1e-12:
+                return math.expm1(g)
+        npv = lambda g: cash @ np.exp(-g * t)
+        f_lo, f_hi = npv(lo), npv(hi)
+        if f_lo * f_hi > 0:
+            return None
+        for _ in range(100):        # 對數成長率上的二分法
+            mid = 0.5 * (lo + hi)
+            f_mid = npv(mid)
+            if f_mid * f_lo > 0:
+                lo, f_lo = mid, f_mid
+            else:
+                hi = mid
+            if hi - lo < 1e-12:
+                break
+        return math.expm1(0.5 * (lo + hi))
+
+    def summary(self):
+        return {"records": self.n, "years": self.last_t, "start_value": self.first_value, "end_value": self.last_value,
+                "net_flows": self.net_flows(), "twr": self.twr(), "twr_annualized": self.twr_annualized(),
+                "mwr": self.mwr(), "realized_vol": self.realized_vol(), "max_drawdown_pct": self.max_drawdown_pct(),
+                "drawdown_pct": self.drawdown_pct()}
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls()
+        stats.__dict__.update(d)
+        stats.flows = [tuple(f) for f in d.get("flows", [])]
+        return stats
+
+
+def feed_records(stats, df):
+    """把歷史紀錄 (load() 格式的 DataFrame) 依序餵入 stats；缺日期或淨資產的列略過。"""
+    value = df["True_Net_Assets"] if "True_Net_Assets" in df.columns else pd.Series(np.nan, index=df.index)
+    for legacy in ("Net_Assets", "Total_Assets"):       # 舊版紀錄沒有真實淨資產欄位
+        if legacy in df.columns:
+            value = value.fillna(df[legacy])
+    def column(name):
+        return pd.to_numeric(df[name], errors="coerce") if name in df.columns else pd.Series(np.nan, index=df.index)
+
+    debt = column("Mortgage").fillna(0) + column("Personal_Loan").fillna(0)
+    debt[column("Mortgage").isna() & column("Personal_Loan").isna()] = np.nan
+    ok = value.notna() & (df["Date"].notna() if "Date" in df.columns else False)
+    if not ok.any():
+        return stats
+    return stats.extend(df["Date"][ok], pd.to_numeric(value[ok]), debt[ok], column("Contribution")[ok])
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets 降採樣：保留視覺上重要的轉折點，回傳選取的索引。
+    x 需遞增 (日期可先轉成數值)；點數不超過 n_out 時原樣回傳。
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    picked = np.empty(n_out, dtype=np.intp)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt = slice(hi, edges[i + 2]) if i + 2 < len(edges) else slice(n - 1, n)
+        cx, cy = x[nxt].mean(), y[nxt].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        picked[i + 1] = a
+    return picked
@@ -0,0 +1,295 @@
+# --- 投資組合運算引擎 (第 6 區，無 UI 相依) ---
+# 輸入為型別化的快照 PortfolioInputs，輸出為具名節點 (估值、曝險、Beta、維持率、Tier 階梯、
+# 曝險缺口、借款空間、TXO 履約價...)。節點以函式參數名宣告依賴，形成計算圖；
+# PortfolioEngine 記住每個節點的值與依賴版本，只有輸入真的變動的節點會重算，
+# 重算結果與上次相同時不會往下游傳遞 (early cutoff)。介面、命令列批次與回測共用。
+#   python portfolio_engine.py snapshot.json
+#   python portfolio_engine.py --history asset_history.db
+import argparse
+import inspect
+import json
+from collections import Counter
+from dataclasses import dataclass, field, fields
+
+import numpy as np
+
+import rules
+from holdings import Holdings
+
+BROKER_MAX_LOAN_RATIO = 0.35    # 券商質押成數上限 (U < 35%)
+NO_LOAN_MAINTENANCE = 999       # 無質押借款時顯示的維持率
+
+
+@dataclass(frozen=True)
+class PortfolioInputs:
+    holdings: Holdings = field(default_factory=lambda: Holdings.from_positions([]))
+    loan_amount: float = 0.0
+    mortgage_loan: float = 0.0
+    personal_loan: float = 0.0
+    current_index: float = 0.0
+    mdd_pct: float = 0.0
+    pe: float = 23.5
+    volatility: float = 0.20
+    base_exposure: float = 23.0
+
+    @classmethod
+    def from_record(cls, record, holdings=None, **overrides):
+        """
+        由歷史存檔紀錄還原快照；holdings 為該筆的長格式持股 (省略時讀舊版 P_ / S_ 欄位)。
+        借款由總市值 - 券商淨資產推回。
+        """
+        if holdings is None:
+            holdings = Holdings.from_wide_record(record)
+        elif not isinstance(holdings, Holdings):
+            holdings = Holdings.from_frame(holdings)
+        total, net = record.get("Total_Assets"), record.get("Portfolio_Net_Assets")
+        kw = dict(holdings=holdings,
+                  loan_amount=float(total - net) if total is not None and net is not None else 0.0,
+                  mortgage_loan=float(record.get("Mortgage", 0) or 0),
+                  personal_loan=float(record.get("Personal_Loan", 0) or 0),
+                  current_index=float(record.get("Current_Index", 0) or 0),
+                  mdd_pct=float(record.get("MDD", 0) or 0), pe=float(record.get("PE_Ratio", 23.5) or 23.5))
+        kw.update(overrides)
+        return cls(**kw)
+
+
+# --- 計算圖節點 (參數名即依賴的輸入或節點名) ---
+NODES = {}
+
+
+def node(fn):
+    NODES[fn.__name__] = (fn, tuple(inspect.signature(fn).parameters))
+    return fn
+
+
+@node
+def values(holdings):
+    """同代號跨帳戶合併後的市值 {代號: 市值}。"""
+    return holdings.by_code()
+
+
+@node
+def sleeve_values(holdings):
+    return holdings.sleeve_totals()
+
+
+@node
+def total_assets(holdings):
+    return holdings.total()
+
+
+@node
+def portfolio_net_assets(total_assets, loan_amount):
+    return total_assets - loan_amount
+
+
+@node
+def true_net_assets(portfolio_net_assets, mortgage_loan, personal_loan):
+    return portfolio_net_assets - mortgage_loan - personal_loan
+
+
+@node
+def real_exposure(holdings):
+    return holdings.exposure()
+
+
+@node
+def real_leverage_ratio(real_exposure, portfolio_net_assets):
+    return (real_exposure / portfolio_net_assets) * 100 if portfolio_net_assets > 0 else 0
+
+
+@node
+def portfolio_beta(holdings, total_assets):
+    return holdings.beta_sum() / total_assets if total_assets > 0 else 0
+
+
+@node
+def maintenance_ratio(total_assets, loan_amount):
+    return (total_assets / loan_amount) * 100 if loan_amount > 0 else NO_LOAN_MAINTENANCE
+
+
+@node
+def loan_ratio(loan_amount, total_assets):
+    return (loan_amount / total_assets) * 100 if total_assets > 0 else 0
+
+
+@node
+def ladder(base_exposure):
+    return rules.ladder_table(base_exposure)
+
+
+@node
+def tier_index(mdd_pct):
+    return int(rules.tier_index(mdd_pct))
+
+
+@node
+def tier_name(ladder, tier_index):
+    return ladder[tier_index]["位階"]
+
+
+@node
+def target_attack_ratio(mdd_pct, base_exposure):
+    return float(rules.tier_target(mdd_pct, base_exposure))
+
+
+@node
+def current_attack_ratio(sleeve_values, total_assets):
+    return (sleeve_values["attack"] / total_assets) * 100 if total_assets > 0 else 0
+
+
+@node
+def gap_tolerance(true_net_assets):
+    return float(rules.gap_tolerance(true_net_assets))
+
+
+@node
+def gap(current_attack_ratio, target_attack_ratio):
+    return current_attack_ratio - target_attack_ratio
+
+
+@node
+def pe_limit(pe):
+    return int(rules.pe_limit(pe))
+
+
+@node
+def kelly_limit(volatility):
+    return float(rules.kelly_limit(volatility))
+
+
+@node
+def safe_leverage_limit(pe_limit, kelly_limit):
+    return min(pe_limit, kelly_limit)
+
+
+@node
+def exposure_gap(portfolio_net_assets, safe_leverage_limit, real_exposure):
+    return portfolio_net_assets * (safe_leverage_limit / 100.0) - real_exposure
+
+
+@node
+def max_loan_broker(portfolio_net_assets):
+    return portfolio_net_assets / (1 - BROKER_MAX_LOAN_RATIO) - portfolio_net_assets
+
+
+@node
+def loan_headroom(max_loan_broker, loan_amount):
+    return max_loan_broker - loan_amount
+
+
+@node
+def recommendation(exposure_gap, loan_headroom):
+    """("REDUCE" | "BORROW", 金額)。"""
+    if exposure_gap < 0:
+        return "REDUCE", abs(exposure_gap)
+    return "BORROW", min(exposure_gap / 2, loan_headroom)
+
+
+@node
+def txo_plan(pe, gap, current_index):
+    """本週 TXO 價差策略與履約價 (依 P/E 決定安全距離、依曝險偏離決定方向)。"""
+    distance = 700 if pe > 25.0 else 600 if pe < 20.0 else 500
+    if gap >= 1.5:
+        sell_call = round(int(current_index + distance) / 100) * 100
+        return {"strategy": "bear_call", "base_distance": distance, "sell_call": sell_call, "buy_call": sell_call + 500}
+    if gap >= -1.0:
+        sell_call = round(int(current_index + distance + 100) / 100) * 100
+        sell_put = round(int(current_index - distance - 100) / 100) * 100
+        return {"strategy": "iron_condor", "base_distance": distance, "sell_call": sell_call,
+                "buy_call": sell_call + 500, "sell_put": sell_put, "buy_put": sell_put - 500}
+    sell_put = round(int(current_index - distance) / 100) * 100
+    return {"strategy": "bull_put", "base_distance": distance, "sell_put": sell_put, "buy_put": sell_put - 500}
+
+
+def _same(a, b):
+    try:
+        return bool(a == b)
+    except ValueError:      # NumPy 陣列
+        return np.array_equal(a, b)
+
+
+class PortfolioEngine:
+    """記憶化的計算圖：set_inputs() 只標記真的變動的輸入，get() 只重算受影響的節點。"""
+
+    def __init__(self, nodes=None):
+        self.nodes = NODES if nodes is None else nodes
+        self._clock = 0
+        self._inputs = {}       # 輸入名 -> (值, 版本)
+        self._memo = {}         # 節點名 -> (依賴版本, 值, 版本)
+        self.recomputed = Counter()
+
+    def set_inputs(self, inputs):
+        for f in fields(inputs):
+            value = getattr(inputs, f.name)
+            old = self._inputs.get(f.name)
+            if old is None or not _same(old[0], value):
+                self._clock += 1
+                self._inputs[f.name] = (value, self._clock)
+        return self
+
+    def _resolve(self, name):
+        if name in self._inputs:
+            return self._inputs[name]
+        if name not in self.nodes:
+            raise KeyError(f"未知的節點或尚未設定的輸入: {name}")
+        fn, deps = self.nodes[name]
+        resolved = [self._resolve(d) for d in deps]
+        dep_versions = tuple(v for _, v in resolved)
+        memo = self._memo.get(name)
+        if memo is not None and memo[0] == dep_versions:
+            return memo[1], memo[2]
+        value = fn(*(v for v, _ in resolved))
+        self.recomputed[name] += 1
+        if memo is not None and _same(memo[1], value):
+            version = memo[2]
+        else:
+            self._clock += 1
+            version = self._clock
+        self._memo[name] = (dep_versions, value, version)
+        return value, version
+
+    def get(self, name):
+        return self._resolve(name)[0]
+
+    __getitem__ = get
+
+    def outputs(self, names=None):
+        return {n: self.get(n) for n in (names or self.nodes)}
+
+
+def evaluate(inputs, names=None):
+    """一次性計算 (不保留記憶)，回傳 {節點名: 值}。"""
+    return PortfolioEngine().set_inputs(inputs).outputs(names)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="第 6 區投資組合指標 (JSON 輸出，每個快照一行)")
+    ap.add_argument("snapshot", nargs="*", help="PortfolioInputs 欄位的 JSON 檔 (holdings 為 [[代號, 價格, 股數], ...])")
+    ap.add_argument("--history", help="以歷史資料庫的每一筆存檔紀錄作為快照")
+    ap.add_argument("--nodes", nargs="+", help="只輸出指定節點")
+    args = ap.parse_args()
+
+    snapshots = []
+    for path in args.snapshot:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        data["holdings"] = Holdings.from_positions(data.get("holdings", []))
+        snapshots.append(PortfolioInputs(**data))
+    if args.history:
+        from history_store import HistoryStore
+        store = HistoryStore(args.history)
+        df, held = store.load(), store.holdings()
+        for i, r in df.iterrows():
+            rows = held[held["Record"] == i]
+            snapshots.append(PortfolioInputs.from_record(r.dropna().to_dict(), rows if len(rows) else None))
+    engine = PortfolioEngine()
+    for snap in snapshots:
+        out = engine.set_inputs(snap).outputs(args.nodes)
+        inputs = {f.name: getattr(snap, f.name) for f in fields(snap)}
+        inputs["holdings"] = snap.holdings.to_frame().to_dict("records")
+        print(json.dumps({"inputs": inputs, "outputs": out}, ensure_ascii=False, default=float))
+
+
+if __name__ == "__main__":
+    main()
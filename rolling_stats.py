@@ -0,0 +1,108 @@
+# --- 增量滾動統計 (ATH / 已實現波動率 / EWMA 波動率 / 回撤) ---
+# 每根新 K 棒 O(1) 更新；最後一根視為「未收盤」，盤中重抓同一天只會覆寫它，不會重複累計。
+# 狀態可序列化成 dict，隨本地市場資料庫一起保存，重啟後從上次處理到的日期接續。
+import math
+from collections import deque
+
+TRADING_DAYS = 252
+DEFAULT_WINDOWS = (20, 60)
+EWMA_LAMBDA = 0.94          # RiskMetrics 日資料衰減係數
+
+
+class RollingStats:
+    def __init__(self, windows=DEFAULT_WINDOWS, ewma_lambda=EWMA_LAMBDA):
+        self.windows = tuple(windows)
+        self.ewma_lambda = ewma_lambda
+        # 已收盤部分
+        self.ath = -math.inf
+        self.last_close = None
+        self.last_date = None
+        self.returns = {w: deque(maxlen=w) for w in self.windows}
+        self.sums = {w: [0.0, 0.0] for w in self.windows}     # [sum, sum of squares]
+        self.ewma_var = None
+        # 未收盤的最後一根 (date, high, close)
+        self.open_bar = None
+
+    def update(self, day, high, close):
+        """餵入一根 K 棒 (day 為可比較的日期字串或 date)。同日重餵視為修正盤中數值。"""
+        if self.open_bar is not None and day > self.open_bar[0]:
+            self._commit(*self.open_bar)
+        if self.open_bar is None or day >= self.open_bar[0]:
+            self.open_bar = (day, high, close)
+
+    def _commit(self, day, high, close):
+        if self.last_close:
+            r = close / self.last_close - 1.0
+            for w in self.windows:
+                q, s = self.returns[w], self.sums[w]
+                if len(q) == q.maxlen:
+                    old = q[0]
+                    s[0] -= old
+                    s[1] -= old * old
+                q.append(r)
+                s[0] += r
+                s[1] += r * r
+            self.ewma_var = r * r if self.ewma_var is None else self.ewma_lambda * self.ewma_var + (1 - self.ewma_lambda) * r * r
+        self.ath = max(self.ath, high)
+        self.last_close = close
+        self.last_date = day
+
+    def _open_return(self):
+        if self.open_bar is None or not self.last_close:
+            return None
+        return self.open_bar[2] / self.last_close - 1.0
+
+    def current_ath(self):
+        ath = self.ath if self.open_bar is None else max(self.ath, self.open_bar[1])
+        return ath if ath > -math.inf else None
+
+    def current_close(self):
+        return self.open_bar[2] if self.open_bar is not None else self.last_close
+
+    def rolling_vol(self, window):
+        """近 window 日報酬的年化標準差 (含未收盤的最後一根)。"""
+        q, (total, sq) = self.returns[window], self.sums[window]
+        n = len(q)
+        r = self._open_return()
+        if r is not None:
+            if n == q.maxlen:
+                total, sq, n = total - q[0], sq - q[0] * q[0], n - 1
+            total, sq, n = total + r, sq + r * r, n + 1
+        if n < 2:
+            return None
+        var = max((sq - total * total / n) / (n - 1), 0.0)
+        return math.sqrt(var * TRADING_DAYS)
+
+    def ewma_vol(self):
+        var = self.ewma_var
+        r = self._open_return()
+        if r is not None:
+            var = r * r if var is None else self.ewma_lambda * var + (1 - self.ewma_lambda) * r * r
+        return math.sqrt(var * TRADING_DAYS) if var is not None else None
+
+    def drawdown_pct(self, price=None):
+        """相對 ATH 的回撤 (%)，price 省略時用最新收盤價。"""
+        ath, price = self.current_ath(), price if price is not None else self.current_close()
+        if not ath or price is None:
+            return None
+        return max((ath - price) / ath * 100, 0.0)
+
+    def to_dict(self):
+        return {
+            "windows": list(self.windows), "ewma_lambda": self.ewma_lambda,
+            "ath": self.ath if self.ath > -math.inf else None, "last_close": self.last_close,
+            "last_date": self.last_date, "returns": {str(w): list(q) for w, q in self.returns.items()},
+            "ewma_var": self.ewma_var, "open_bar": list(self.open_bar) if self.open_bar else None,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls(d["windows"], d["ewma_lambda"])
+        stats.ath = d["ath"] if d["ath"] is not None else -math.inf
+        stats.last_close, stats.last_date, stats.ewma_var = d["last_close"], d["last_date"], d["ewma_var"]
+        for w in stats.windows:
+            stats.returns[w].extend(d["returns"][str(w)])
+            q = stats.returns[w]
+            stats.sums[w] = [sum(q), sum(r * r for r in q)]
+        stats.open_bar = tuple(d["open_bar"]) if d["open_bar"] else None
+        return stats
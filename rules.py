@@ -0,0 +1,55 @@
+# --- 策略規則 (MDD 位階階梯、雙引擎煞車、動態容忍度) ---
+# 純數值函式，純量與 NumPy 陣列皆可輸入；介面、推演與回測共用同一份規則。
+import numpy as np
+
+TIER_BOUNDS = (5.0, 10.0, 20.0, 35.0, 45.0)          # MDD 區間上緣 (%)
+TIER_OFFSETS = (0.0, 5.0, 5.0, 10.0, 15.0, 20.0)     # 相對基準曝險的加碼幅度 (%)
+TIER_LABELS = ("< 5%", "5%~10%", "10%~20%", "20%~35%", "35%~45%", "> 45%")
+TIER_NAMES = ("Tier 1 (基準)", "Tier 1.5 (警戒)", "Tier 2 (初跌)", "Tier 3 (主跌)", "Tier 4 (恐慌)", "Tier 5 (毀滅)")
+
+
+def tier_index(mdd_pct):
+    """MDD (%) 落在第幾階 (0~5)。"""
+    return np.searchsorted(TIER_BOUNDS, mdd_pct, side="right")
+
+
+def tier_target(mdd_pct, base_exposure):
+    """該 MDD 位階的攻擊型資產目標占比 (%)。"""
+    return base_exposure + np.asarray(TIER_OFFSETS)[tier_index(mdd_pct)]
+
+
+def ladder_table(base_exposure):
+    return [{"MDD區間": label, "目標曝險": base_exposure + offset, "位階": name}
+            for label, offset, name in zip(TIER_LABELS, TIER_OFFSETS, TIER_NAMES)]
+
+
+# 估值限速：P/E 上緣 -> 槓桿上限 (%)
+PE_BOUNDS = (17.0, 19.0, 21.0, 23.0)
+PE_LIMITS = (320, 280, 240, 200, 160)
+
+# 波動率限速 (連續時間凱利公式)
+MARKET_MU = 0.1415
+LEVERAGE_COST = 0.025
+VOL_FLOOR = 0.15
+
+# 動態擴容再平衡閥值
+GAP_SCALE_ASSETS = 10_000_000
+GAP_TOLERANCES = (3.0, 5.0)
+
+
+def pe_bucket(pe):
+    return np.searchsorted(PE_BOUNDS, pe, side="right")
+
+
+def pe_limit(pe, limits=PE_LIMITS):
+    return np.asarray(limits)[pe_bucket(pe)]
+
+
+def kelly_limit(vol, market_mu=MARKET_MU, leverage_cost=LEVERAGE_COST):
+    safe_vol = np.maximum(vol, VOL_FLOOR)
+    return ((market_mu - leverage_cost) / (safe_vol ** 2)) * 100
+
+
+def gap_tolerance(true_net_assets, scale_assets=GAP_SCALE_ASSETS, tolerances=GAP_TOLERANCES):
+    """真實淨資產未滿 1,000 萬用 3%，以上用 5%。"""
+    return np.where(np.asarray(true_net_assets) < scale_assets, *tolerances)
@@ -0,0 +1,84 @@
+# --- 情境 / 壓力測試矩陣 ---
+# 一次向量化計算「加權指數 x P/E x 質押借款」整個網格上的第 6 區指標，取代逐一改輸入值試算。
+# 持股價格依各自 Beta 隨指數變動 (價格倍數 = max(1 + beta x 指數報酬, 0))，MDD 以目前 ATH 重新計算；
+# P/E 為獨立軸 (只影響估值限速)，波動率沿用目前值。公式與 portfolio_engine / rules 相同。
+import numpy as np
+
+import rules
+from portfolio_engine import BROKER_MAX_LOAN_RATIO, NO_LOAN_MAINTENANCE
+
+MARGIN_CALL_PCT = 130.0
+
+
+def _axes(*arrays):
+    """每個一維陣列各佔一個軸 (純量不佔軸)，回傳可互相廣播的陣列。"""
+    arrays = [np.asarray(a, dtype=float) for a in arrays]
+    n_axes = sum(a.ndim == 1 for a in arrays)
+    out, k = [], 0
+    for a in arrays:
+        if a.ndim == 1:
+            shape = [1] * n_axes
+            shape[k] = a.size
+            out.append(a.reshape(shape))
+            k += 1
+        else:
+            out.append(a)
+    return out
+
+
+def evaluate_grid(inputs, index_levels, pe_values=None, loan_amounts=None):
+    """
+    inputs: 目前的 PortfolioInputs (持股、場外負債、指數、MDD、波動率、基準曝險)
+    index_levels / pe_values / loan_amounts: 一維陣列各自成為一個軸 (依此順序)，純量或 None 表示固定
+    回傳 {指標名: 網格陣列}；recommendation 為 +1 (BORROW) / -1 (REDUCE)
+    """
+    pe_values = inputs.pe if pe_values is None else pe_values
+    loan_amounts = inputs.loan_amount if loan_amounts is None else loan_amounts
+    idx, pe, loan = _axes(index_levels, pe_values, loan_amounts)
+
+    h = inputs.holdings
+    v0, beta, lev, attack = h.values, h.beta, h.leverage, h.sleeve == "attack"
+
+    # 指數軸上的持股市值只與指數有關：先在一維上算完 (K 檔 x N 點)，再廣播
+    idx_1d = np.ravel(idx)
+    ret = idx_1d / inputs.current_index - 1.0 if inputs.current_index > 0 else np.zeros_like(idx_1d)
+    v = v0[:, None] * np.maximum(1.0 + beta[:, None] * ret, 0.0)
+    shape = np.shape(idx)
+    total = v.sum(axis=0).reshape(shape)
+    val_attack = v[attack].sum(axis=0).reshape(shape)
+    real_exposure = (lev @ v).reshape(shape)
+    beta_sum = (beta @ v).reshape(shape)
+
+    ath = inputs.current_index / (1 - inputs.mdd_pct / 100) if inputs.mdd_pct < 100 else inputs.current_index
+    mdd = np.maximum((ath - idx) / ath * 100, 0.0) if ath > 0 else np.zeros(shape)
+    target = rules.tier_target(mdd, inputs.base_exposure)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pos = total > 0
+        net = total - loan
+        true_net = net - inputs.mortgage_loan - inputs.personal_loan
+        current_attack = np.where(pos, val_attack / total * 100, 0.0)
+        gap = current_attack - target
+        safe = np.minimum(rules.pe_limit(pe), rules.kelly_limit(inputs.volatility))
+        exposure_gap = net * (safe / 100.0) - real_exposure
+        max_loan_broker = net / (1 - BROKER_MAX_LOAN_RATIO) - net
+        loan_headroom = max_loan_broker - loan
+        maintenance = np.where(loan > 0, total / loan * 100, NO_LOAN_MAINTENANCE)
+        out = {
+            "total_assets": total, "portfolio_net_assets": net, "true_net_assets": true_net,
+            "real_exposure": real_exposure,
+            "real_leverage_ratio": np.where(net > 0, real_exposure / net * 100, 0.0),
+            "portfolio_beta": np.where(pos, beta_sum / total, 0.0),
+            "maintenance_ratio": maintenance,
+            "loan_ratio": np.where(pos, loan / total * 100, 0.0),
+            "mdd_pct": mdd, "target_attack_ratio": target, "current_attack_ratio": current_attack, "gap": gap,
+            "gap_tolerance": rules.gap_tolerance(true_net),
+            "safe_leverage_limit": safe, "exposure_gap": exposure_gap,
+            "max_loan_broker": max_loan_broker, "loan_headroom": loan_headroom,
+            "recommendation": np.where(exposure_gap < 0, -1, 1),
+            "recommendation_amount": np.where(exposure_gap < 0, -exposure_gap,
+                                              np.minimum(exposure_gap / 2, loan_headroom)),
+            "margin_call": maintenance < MARGIN_CALL_PCT,
+        }
+    full = np.broadcast_shapes(*(np.shape(a) for a in (idx, pe, loan)))
+    return {k: np.broadcast_to(a, full) for k, a in out.items()}
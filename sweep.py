@@ -0,0 +1,162 @@
+# --- 策略參數掃描 / 最佳化 (base_exposure、gap_tolerance、P/E 槓桿上限表) ---
+# 每條指數路徑只 prepare() 一次 (MDD 位階、P/E 區間、凱利上限、累積報酬)，
+# 各行程在啟動時收到全部路徑的中間量並常駐，之後每批參數以 replay_grid() 一起逐日推進。
+# 結果以「CAGR 中位數 vs. 斷頭機率」的 Pareto 前緣呈現；可於無 Streamlit 環境直接執行：
+#   python sweep.py --source bootstrap --paths 200 --years 10 --out sweep.csv
+import argparse
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backtest import TRADING_DAYS, prepare, replay_grid
+from mc_engine import default_workers
+from rules import GAP_TOLERANCES, PE_LIMITS
+
+DEFAULT_BASES = tuple(range(20, 31))
+DEFAULT_GAP_SCALES = (5_000_000, 10_000_000, 20_000_000)
+DEFAULT_GAP_PAIRS = ((2.0, 4.0), GAP_TOLERANCES, (4.0, 6.0))
+DEFAULT_PE_SCALES = (0.8, 0.9, 1.0, 1.1, 1.2)      # 以預設上限表等比例縮放
+BOOTSTRAP_BLOCK = 20                               # 區塊自助法的區塊長度 (保留波動叢聚)
+BATCH_SIZE = 64                                    # 每個工作單位的參數組數
+
+
+def bootstrap_bars(bars, n_paths, years, block=BOOTSTRAP_BLOCK, seed=42):
+    """以歷史日報酬 (含當日高/收比) 做區塊自助抽樣，產生 n_paths 條合成日線。"""
+    close = bars["Close"].to_numpy(float)
+    hc = (bars["High"] / bars["Close"]).to_numpy(float)[1:]
+    lr = np.diff(np.log(close))
+    n = int(years * TRADING_DAYS)
+    rng = np.random.default_rng(seed)
+    n_blocks = -(-n // block)
+    starts = rng.integers(0, len(lr) - block + 1, (n_paths, n_blocks))
+    take = (starts[:, :, None] + np.arange(block)).reshape(n_paths, -1)[:, :n]
+    return _to_bars(close[-1], lr[take], np.maximum(hc[take], 1.0))
+
+
+def gbm_bars(n_paths, years, mu=0.10, vol=0.18, start=20000.0, seed=42):
+    n = int(years * TRADING_DAYS)
+    dt = 1.0 / TRADING_DAYS
+    rng = np.random.default_rng(seed)
+    lr = (mu - 0.5 * vol ** 2) * dt + vol * np.sqrt(dt) * rng.standard_normal((n_paths, n))
+    return _to_bars(start, lr, np.ones_like(lr))
+
+
+def _to_bars(start, lr, hc):
+    index = pd.bdate_range("2000-01-03", periods=lr.shape[1] + 1)
+    close = start * np.exp(np.concatenate([np.zeros((lr.shape[0], 1)), np.cumsum(lr, axis=1)], axis=1))
+    high = close * np.concatenate([np.ones((lr.shape[0], 1)), hc], axis=1)
+    return [pd.DataFrame({"High": h, "Close": c}, index=index) for h, c in zip(high, close)]
+
+
+def param_grid(bases=DEFAULT_BASES, gap_scales=DEFAULT_GAP_SCALES, gap_pairs=DEFAULT_GAP_PAIRS,
+               pe_scales=DEFAULT_PE_SCALES):
+    """所有參數組合 (list of dict)，可直接傳給 replay()。"""
+    return [{"base_exposure": float(b), "gap_scale_assets": float(g), "gap_tolerances": tuple(p),
+             "pe_limits": tuple(round(x * s) for x in PE_LIMITS)}
+            for b, g, p, s in itertools.product(bases, gap_scales, gap_pairs, pe_scales)]
+
+
+# 工作行程常駐的路徑中間量與帳戶狀態
+_PREPS = None
+_ACCOUNT = None
+
+
+def _init_worker(preps, account):
+    global _PREPS, _ACCOUNT
+    _PREPS, _ACCOUNT = preps, account
+
+
+def evaluate(batch, preps, account):
+    """一批參數跑遍所有路徑，每組彙整成 CAGR 分布、斷頭機率、回撤與週轉率。"""
+    m = replay_grid(preps, batch, **account)
+    return pd.DataFrame({
+        "cagr_median": np.median(m["cagr"], axis=1), "cagr_p05": np.percentile(m["cagr"], 5, axis=1),
+        "ruin_prob": m["ruined"].mean(axis=1) * 100,
+        "max_drawdown_median": np.median(m["max_drawdown_pct"], axis=1),
+        "annual_turnover": m["annual_turnover"].mean(axis=1),
+    })
+
+
+def _evaluate_batch(batch):
+    return evaluate(batch, _PREPS, _ACCOUNT)
+
+
+def pareto_front(df, ret="cagr_median", risk="ruin_prob"):
+    """非支配解：沒有其他組合能在報酬不降的同時讓斷頭機率更低 (或反之)。"""
+    order = df.sort_values([risk, ret], ascending=[True, False]).index
+    best = -np.inf
+    front = pd.Series(False, index=df.index)
+    for i in order:
+        if df.at[i, ret] > best:
+            front[i] = True
+            best = df.at[i, ret]
+    return front
+
+
+def run_sweep(paths, grid, total_assets, loan_amount=0.0, other_debt=0.0, n_workers=1, pe=23.5,
+              earnings_growth=None, **path_kw):
+    """
+    paths: 指數日線 DataFrame 的 list (歷史一條或合成多條，需等長)
+    grid: param_grid() 的結果
+    回傳每組參數一列的 DataFrame (含 pareto 欄位)
+    """
+    preps = [prepare(b, pe, earnings_growth, **path_kw) for b in paths]
+    account = {"total_assets": float(total_assets), "loan_amount": float(loan_amount), "other_debt": float(other_debt)}
+    batches = [grid[i:i + BATCH_SIZE] for i in range(0, len(grid), BATCH_SIZE)]
+    n_workers = max(1, min(int(n_workers), len(batches)))
+    if n_workers == 1:
+        results = [evaluate(batch, preps, account) for batch in batches]
+    else:
+        with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(preps, account)) as pool:
+            results = list(pool.map(_evaluate_batch, batches))
+    df = pd.concat([pd.DataFrame(grid), pd.concat(results, ignore_index=True)], axis=1)
+    df["pareto"] = pareto_front(df)
+    return df
+
+
+def main():
+    ap = argparse.ArgumentParser(description="策略參數掃描：CAGR vs. 斷頭機率的 Pareto 前緣")
+    ap.add_argument("--source", choices=["history", "bootstrap", "gbm"], default="bootstrap")
+    ap.add_argument("--db", default="market_data.db", help="本地市場資料庫 (history / bootstrap 使用)")
+    ap.add_argument("--paths", type=int, default=100)
+    ap.add_argument("--years", type=float, default=10)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--assets", type=float, default=9_500_000.0)
+    ap.add_argument("--loan", type=float, default=2_350_000.0)
+    ap.add_argument("--other-debt", type=float, default=0.0)
+    ap.add_argument("--pe", type=float, default=23.5)
+    ap.add_argument("--earnings-growth", type=float, default=0.08, help="合成路徑的盈餘年成長 (P/E 隨價格漂移)")
+    ap.add_argument("--bases", type=float, nargs="+", default=list(DEFAULT_BASES))
+    ap.add_argument("--pe-scales", type=float, nargs="+", default=list(DEFAULT_PE_SCALES))
+    ap.add_argument("--workers", type=int, default=default_workers())
+    ap.add_argument("--out", help="完整結果輸出 CSV")
+    args = ap.parse_args()
+
+    if args.source == "gbm":
+        paths = gbm_bars(args.paths, args.years, seed=args.seed)
+    else:
+        from market_data import INDEX_SYMBOL, MarketStore
+        bars = MarketStore(args.db).bars(INDEX_SYMBOL).dropna(subset=["High", "Close"])
+        if len(bars) < 2 * BOOTSTRAP_BLOCK:
+            raise SystemExit(f"{args.db} 內沒有足夠的 {INDEX_SYMBOL} 日線")
+        paths = [bars] if args.source == "history" else bootstrap_bars(bars, args.paths, args.years, seed=args.seed)
+    growth = args.earnings_growth if args.source != "history" else None
+
+    grid = param_grid(bases=args.bases, pe_scales=args.pe_scales)
+    t0 = time.perf_counter()
+    df = run_sweep(paths, grid, args.assets, args.loan, args.other_debt, n_workers=args.workers, pe=args.pe,
+                   earnings_growth=growth)
+    elapsed = time.perf_counter() - t0
+    print(f"{len(grid):,} 組參數 x {len(paths):,} 條路徑，{elapsed:.1f}s (workers={args.workers})")
+    front = df[df["pareto"]].sort_values("ruin_prob")
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(front.drop(columns="pareto").to_string(index=False))
+    if args.out:
+        df.to_csv(args.out, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# --- market_data 測試 (以 FakeProvider 取代 yfinance，不需網路) ---
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from market_data import (DEFAULT_MARKET_DATA, INDEX_SYMBOL, INITIAL_PERIOD_DAYS, PE_SYMBOL, QUOTE_TIMEOUT, FakeProvider,
+                         MarketStore, fetch_quotes, load_market_data, refresh_symbol)
+
+
+def make_bars(days, start_close=20000.0, seed=0):
+    rng = np.random.default_rng(seed)
+    close = start_close * np.exp(np.cumsum(rng.normal(0, 0.01, len(days))))
+    return pd.DataFrame({"Open": close, "High": close * 1.005, "Low": close * 0.995, "Close": close,
+                         "Volume": 1e6}, index=pd.DatetimeIndex(days))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MarketStore(str(tmp_path / "market.db"))
+
+
+def test_refresh_fetches_only_after_last_stored_date(store):
+    today = date(2024, 6, 28)
+    days = pd.bdate_range(end=today, periods=80)
+    provider = FakeProvider(bars={INDEX_SYMBOL: make_bars(days[:60])})
+
+    assert refresh_symbol(store, provider, INDEX_SYMBOL, today=today) == 60
+    assert provider.calls[-1] == (INDEX_SYMBOL, today - timedelta(days=INITIAL_PERIOD_DAYS))
+    last = store.last_date(INDEX_SYMBOL)
+    assert last == days[59].date()
+
+    # 第二次只要最後一根 (可能是盤中 K 棒) 之後的資料
+    provider.bars[INDEX_SYMBOL] = make_bars(days)
+    assert refresh_symbol(store, provider, INDEX_SYMBOL, today=today) == 21
+    assert provider.calls[-1] == (INDEX_SYMBOL, last)
+    assert len(store.bars(INDEX_SYMBOL)) == 80
+    assert store.last_date(INDEX_SYMBOL) == today
+
+
+def test_offline_falls_back_to_stored_values(store):
+    days = pd.bdate_range(end=date.today() - timedelta(days=1), periods=120)
+    bars = make_bars(days)
+    online = load_market_data(store, FakeProvider(bars={INDEX_SYMBOL: bars}, info={PE_SYMBOL: {"trailingPE": 21.5}}))
+    assert online["last_close"] == pytest.approx(bars["Close"].iloc[-1])
+    assert online["ath"] == pytest.approx(bars["High"].max())
+    assert online["pe_0050"] == 21.5
+
+    offline = FakeProvider(offline=True)
+    assert load_market_data(store, offline) == online
+    assert offline.calls            # 確實嘗試過連線，失敗後才退回本地資料
+    assert len(store.bars(INDEX_SYMBOL)) == len(days)
+
+
+def test_offline_with_empty_store_returns_defaults(store):
+    assert load_market_data(store, FakeProvider(offline=True)) == DEFAULT_MARKET_DATA
+
+
+HOLDING_QUOTES = {"00675L.TW": 212.8, "00631L.TW": 466.7, "00670L.TW": 157.95,
+                  "00662.TW": 101.35, "00713.TW": 54.0, "00865B.TWO": 47.36}
+
+
+def test_fetch_quotes_takes_about_one_round_trip():
+    delay = 0.2
+    provider = FakeProvider(quotes=HOLDING_QUOTES, delay=delay)
+    t0 = time.perf_counter()
+    prices = fetch_quotes(provider, list(HOLDING_QUOTES), timeout=5.0)
+    elapsed = time.perf_counter() - t0
+    assert prices == HOLDING_QUOTES
+    assert elapsed < 2 * delay       # 逐一抓取需 6 x delay
+
+
+def test_fetch_quotes_skips_missing_and_failed_symbols():
+    provider = FakeProvider(quotes={"00713.TW": 54.0})
+    assert fetch_quotes(provider, ["00713.TW", "UNKNOWN"], timeout=5.0) == {"00713.TW": 54.0}
+    assert fetch_quotes(FakeProvider(quotes=HOLDING_QUOTES, offline=True), list(HOLDING_QUOTES), timeout=5.0) == {}
+
+
+def test_fetch_quotes_returns_empty_on_timeout():
+    provider = FakeProvider(quotes=HOLDING_QUOTES, delay=0.5)
+    t0 = time.perf_counter()
+    assert fetch_quotes(provider, list(HOLDING_QUOTES), timeout=0.05) == {}
+    assert time.perf_counter() - t0 < 0.3     # 不等慢的請求做完
+
+
+def test_hanging_requests_do_not_exhaust_the_quote_pool():
+    # 每筆都卡得比 QUOTE_TIMEOUT 還久；連續幾批 (總請求數超過執行緒池大小) 之後，正常的來源仍要拿得到報價
+    hanging = FakeProvider(quotes=HOLDING_QUOTES, delay=QUOTE_TIMEOUT * 20)
+    symbols = [f"{s}#{i}" for i in range(2) for s in HOLDING_QUOTES]
+    for _ in range(3):
+        t0 = time.perf_counter()
+        assert fetch_quotes(hanging, symbols, timeout=0.1) == {}
+        assert time.perf_counter() - t0 < 1.0
+    assert fetch_quotes(FakeProvider(quotes=HOLDING_QUOTES), list(HOLDING_QUOTES), timeout=0.1) == HOLDING_QUOTES
@@ -0,0 +1,39 @@
+# --- mc_engine 測試 (標準誤估計、扇形圖百分位精度) ---
+import numpy as np
+import pytest
+
+from mc_engine import PATH_BINS, SKETCH_SIGMAS, run_simulation
+
+# 槓桿偏高、波動大：推演期間有一部分路徑會斷頭，斷頭率的標準誤才不為 0
+ARGS = dict(total_assets=10_000_000, total_debt=4_000_000, margin_call_threshold=6_000_000, mu=0.08, vol=0.25, years=5)
+
+
+@pytest.mark.parametrize("sampling, n_paths", [("sobol", 512), ("sobol", 1000), ("antithetic", 7), ("plain", 3)])
+def test_standard_errors_are_finite_for_small_runs(sampling, n_paths):
+    res = run_simulation(**ARGS, n_paths=n_paths, sampling=sampling, use_cache=False)
+    assert res["n_paths"] == n_paths
+    assert np.isfinite(res["se"]["ruin_prob"])
+    for name in ("p05", "p50", "p95"):
+        assert np.isfinite(res["se"][name])
+
+
+def test_sobol_standard_error_is_positive():
+    res = run_simulation(**ARGS, n_paths=512, sampling="sobol", use_cache=False)
+    assert 0 < res["ruin_prob"] < 100
+    assert res["se"]["ruin_prob"] > 0
+    assert res["se"]["p50"] > 0
+
+
+def test_fan_bands_match_exact_percentiles():
+    # 抽樣路徑取全部路徑，即可與精確百分位比較 (對數空間，誤差即市值的相對誤差)
+    n, vol, years = 10000, 0.25, 30
+    res = run_simulation(**{**ARGS, "vol": vol, "years": years}, n_paths=n, n_samples=n, use_cache=False)
+    t = res["time_axis"][1:]
+    log_assets = lambda net: np.log((net + ARGS["total_debt"]) / ARGS["total_assets"])
+    exact = np.sort(log_assets(res["sample_paths"][1:]), axis=1)
+    bin_width = 2 * SKETCH_SIGMAS * vol * np.sqrt(t) / PATH_BINS
+    for q, band in res["bands"].items():
+        err = np.abs(log_assets(band[1:]) - np.percentile(exact, q, axis=1))
+        k = int(q / 100 * (n - 1))
+        assert np.all(err <= bin_width + exact[:, k + 1] - exact[:, k])    # 一格寬 + 該處相鄰樣本間距
+        assert err.max() < 0.006                                            # 市值誤差 < 0.6%
@@ -0,0 +1,159 @@
+# --- TXO 週選擇權定價與價差排名 (向量化 Black-Scholes) ---
+# 以加權指數現價為中心展開整條履約價階梯，一次算出所有買權 / 賣權的權利金與 Greeks，
+# 再把 Bear Call、Bull Put 與 Iron Condor 的所有履約價 x 翼寬組合一起評估：
+# 收取權利金、最大虧損、淨 Delta / Theta / Vega、賣方履約價的觸價機率與到期獲利機率。
+# 波動率可用單一值 (real_volatility) 或 [(履約價, 波動率), ...] 的微笑曲線 (線性內插)。
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+
+TXO_MULTIPLIER = 50                     # 每點 50 元
+STRIKE_STEP = 100                       # 履約價間距
+LADDER_HALF_WIDTH = 3000                # 階梯涵蓋 現價 ± 3000 點
+WING_WIDTHS = tuple(range(100, 1100, 100))
+RISK_FREE = 0.015
+DAYS_PER_YEAR = 365
+STRATEGIES = ("bear_call", "bull_put", "iron_condor")
+
+
+def strike_ladder(current_index, half_width=LADDER_HALF_WIDTH, step=STRIKE_STEP):
+    center = round(current_index / step) * step
+    return np.arange(center - half_width, center + half_width + step, step, dtype=float)
+
+
+def smile_vols(strikes, vol, smile=None):
+    """各履約價的波動率：smile 為 [(履約價, 波動率), ...] 時線性內插 (兩端持平)，否則全部為 vol。"""
+    strikes = np.asarray(strikes, dtype=float)
+    if not smile:
+        return np.full(strikes.shape, float(vol))
+    k, v = np.array(sorted(smile), dtype=float).T
+    return np.interp(strikes, k, v)
+
+
+def _d12(spot, strikes, t, sigma, r, q):
+    sd = sigma * np.sqrt(t)
+    d1 = (np.log(spot / strikes) + (r - q + 0.5 * sigma ** 2) * t) / sd
+    return d1, d1 - sd
+
+
+def prob_above(spot, levels, t, sigma, r=RISK_FREE, q=0.0):
+    """風險中立下到期指數高於 levels 的機率 N(d2)。"""
+    return ndtr(_d12(spot, np.asarray(levels, dtype=float), t, sigma, r, q)[1])
+
+
+def touch_prob(spot, strikes, t, sigma, r=RISK_FREE, q=0.0):
+    """到期前任一時點觸及履約價的機率 (GBM 首次觸及公式，上方與下方履約價各自套用)。"""
+    strikes = np.asarray(strikes, dtype=float)
+    nu = r - q - 0.5 * sigma ** 2
+    b = np.abs(np.log(strikes / spot))
+    drift = np.where(strikes >= spot, nu, -nu)          # 朝履約價方向的漂移
+    sd = sigma * np.sqrt(t)
+    with np.errstate(over="ignore"):
+        p = ndtr((-b + drift * t) / sd) + np.exp(2 * drift * b / sigma ** 2) * ndtr((-b - drift * t) / sd)
+    return np.clip(p, 0.0, 1.0)
+
+
+def price_chain(spot, strikes, days, vol, smile=None, r=RISK_FREE, q=0.0):
+    """
+    整條階梯一次定價 (單位：指數點)。
+    回傳 DataFrame：strike, vol, call / put 的權利金、delta、theta (每日)、vega (每 1% 波動率)，
+    以及 touch (觸價機率) 與 itm (到期價內機率 = 指數高於履約價)。
+    """
+    strikes = np.asarray(strikes, dtype=float)
+    sigma = smile_vols(strikes, vol, smile)
+    t = max(float(days), 1e-6) / DAYS_PER_YEAR
+    d1, d2 = _d12(spot, strikes, t, sigma, r, q)
+    disc_r, disc_q = np.exp(-r * t), np.exp(-q * t)
+    n1, n2 = ndtr(d1), ndtr(d2)
+    pdf = np.exp(-0.5 * d1 ** 2) / np.sqrt(2 * np.pi)
+    call = spot * disc_q * n1 - strikes * disc_r * n2
+    put = call - spot * disc_q + strikes * disc_r            # 買賣權平價
+    decay = -spot * disc_q * pdf * sigma / (2 * np.sqrt(t))
+    call_theta = (decay - r * strikes * disc_r * n2 + q * spot * disc_q * n1) / DAYS_PER_YEAR
+    put_theta = (decay + r * strikes * disc_r * (1 - n2) - q * spot * disc_q * (1 - n1)) / DAYS_PER_YEAR
+    vega = spot * disc_q * pdf * np.sqrt(t) / 100
+    return pd.DataFrame({
+        "strike": strikes, "vol": sigma,
+        "call": call, "call_delta": disc_q * n1, "call_theta": call_theta,
+        "put": put, "put_delta": disc_q * (n1 - 1), "put_theta": put_theta,
+        "vega": vega, "touch": touch_prob(spot, strikes, t, sigma, r, q), "itm": n2,
+    })
+
+
+def _verticals(chain, spot, t, kind, widths, r, q):
+    """所有價外賣方履約價 x 翼寬的信用價差 (bear_call 往上買保護、bull_put 往下買保護)。"""
+    k = chain["strike"].to_numpy()
+    step = np.diff(k).min() if len(k) > 1 else STRIKE_STEP
+    offsets = np.round(np.asarray(widths, dtype=float) / step).astype(int)
+    sign = 1 if kind == "bear_call" else -1
+    short = np.nonzero(k >= spot if kind == "bear_call" else k <= spot)[0]
+    i = np.repeat(short, len(offsets))
+    j = i + sign * np.tile(offsets, len(short))
+    ok = (j >= 0) & (j < len(k))
+    i, j = i[ok], j[ok]
+    side = "call" if kind == "bear_call" else "put"
+    px, delta, theta = (chain[f"{side}{s}"].to_numpy() for s in ("", "_delta", "_theta"))
+    vega, touch, vol = chain["vega"].to_numpy(), chain["touch"].to_numpy(), chain["vol"].to_numpy()
+    credit = px[i] - px[j]
+    width = np.abs(k[j] - k[i])
+    breakeven = k[i] + sign * credit
+    beyond = prob_above(spot, breakeven, t, vol[i], r, q)      # 到期高於損益兩平點
+    return pd.DataFrame({
+        "strategy": kind, "sell": k[i], "buy": k[j], "width": width, "credit": credit,
+        "max_loss": width - credit, "delta": delta[j] - delta[i], "theta": theta[j] - theta[i],
+        "vega": vega[j] - vega[i], "p_touch": touch[i],
+        "p_profit": 1 - beyond if kind == "bear_call" else beyond,
+        "distance": np.abs(k[i] - spot), "breakeven": breakeven,
+    })
+
+
+def _condors(calls, puts, spot, t, vol, r, q):
+    """同翼寬的 Bear Call x Bull Put 全組合；兩側不會同時虧損，最大虧損 = 翼寬 - 總權利金。"""
+    frames = []
+    for w in np.intersect1d(calls["width"].unique(), puts["width"].unique()):
+        c, p = calls[calls["width"] == w], puts[puts["width"] == w]
+        ci, pi = np.repeat(np.arange(len(c)), len(p)), np.tile(np.arange(len(p)), len(c))
+        cv = {col: c[col].to_numpy()[ci] for col in c.columns if col != "strategy"}
+        pv = {col: p[col].to_numpy()[pi] for col in p.columns if col != "strategy"}
+        credit = cv["credit"] + pv["credit"]
+        upper, lower = cv["sell"] + credit, pv["sell"] - credit
+        frames.append(pd.DataFrame({
+            "strategy": "iron_condor", "sell_call": cv["sell"], "buy_call": cv["buy"],
+            "sell_put": pv["sell"], "buy_put": pv["buy"], "width": w, "credit": credit, "max_loss": w - credit,
+            "delta": cv["delta"] + pv["delta"], "theta": cv["theta"] + pv["theta"], "vega": cv["vega"] + pv["vega"],
+            "p_touch": np.minimum(cv["p_touch"] + pv["p_touch"], 1.0),     # 兩側觸價機率和 (上限估計)
+            "p_profit": prob_above(spot, lower, t, vol, r, q) - prob_above(spot, upper, t, vol, r, q),
+            "distance": np.minimum(cv["distance"], pv["distance"]),
+        }))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def spread_table(spot, days, vol, strategy, smile=None, widths=WING_WIDTHS, strikes=None, r=RISK_FREE, q=0.0):
+    """
+    strategy 的所有候選價差 (DataFrame，單位：指數點；金額欄位另附 _ntd 版本)。
+    strikes 省略時以 strike_ladder(spot) 展開。
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"未知的策略: {strategy}")
+    strikes = strike_ladder(spot) if strikes is None else strikes
+    chain = price_chain(spot, strikes, days, vol, smile, r, q)
+    t = max(float(days), 1e-6) / DAYS_PER_YEAR
+    if strategy == "iron_condor":
+        calls = _verticals(chain, spot, t, "bear_call", widths, r, q)
+        puts = _verticals(chain, spot, t, "bull_put", widths, r, q)
+        df = _condors(calls, puts, spot, t, smile_vols(spot, vol, smile), r, q)
+    else:
+        df = _verticals(chain, spot, t, strategy, widths, r, q)
+    if len(df):
+        df["return_on_risk"] = np.where(df["max_loss"] > 0, df["credit"] / df["max_loss"], np.inf)
+        for col in ("credit", "max_loss", "theta"):
+            df[f"{col}_ntd"] = df[col] * TXO_MULTIPLIER
+    return df
+
+
+def rank_spreads(df, max_touch=0.30, min_distance=0.0, min_credit=1.0, sort_by="return_on_risk", top=20):
+    """篩選觸價機率、安全距離與最低權利金 (點) 後，依 sort_by 由高到低取前 top 名。"""
+    if df.empty:
+        return df
+    ok = (df["p_touch"] <= max_touch) & (df["distance"] >= min_distance) & (df["credit"] >= min_credit)
+    return df[ok].sort_values([sort_by, "p_profit"], ascending=False).head(top).reset_index(drop=True)